@@ -6,13 +6,19 @@ import base64
 import mimetypes
 from typing import Optional
 from fastapi import FastAPI, UploadFile, File, Form
+from fastapi.concurrency import run_in_threadpool
 from fastapi.responses import FileResponse
 from fastapi.middleware.cors import CORSMiddleware
 import struct
 from google import genai
 from google.genai import types
 
+# Shared rate limiting / retries / circuit breaking for Gemini calls; rag is a package, so run
+# this service from backend/ as: python -m ai.llmasssist
+from rag.gemini_client import get_gemini_client
+
 api_key = os.environ.get("GOOGLE_API_KEY")
+gemini = get_gemini_client("generate")
 
 def image_generate(text: str) -> None:
     """Generates an image from text using Gemini Imagen and saves it to a file.
@@ -23,7 +29,8 @@ def image_generate(text: str) -> None:
     """
     client = genai.Client(api_key=api_key)
 
-    result = client.models.generate_images(
+    result = gemini.call(
+        client.models.generate_images,
         model="models/imagen-4.0-generate-preview-06-06",
         prompt=text,
         config=dict(
@@ -86,11 +93,14 @@ def audio_generate(text: str) -> None:
     )
 
     file_index = 0
-    for chunk in client.models.generate_content_stream(
+    # The stream is read inside the wrapped call, so 429/5xx errors raised while iterating are retried too
+    chunks = gemini.call(
+        lambda **kwargs: list(client.models.generate_content_stream(**kwargs)),
         model=model,
         contents=contents,
         config=generate_content_config,
-    ):
+    )
+    for chunk in chunks:
         if (
             chunk.candidates is None
             or chunk.candidates[0].content is None
@@ -289,7 +299,10 @@ async def llm_assist(
     cfg = types.GenerateContentConfig(tools=tools)
 
     client = genai.Client(api_key=api_key)
-    response = client.models.generate_content(
+    # gemini.call blocks on rate limiting and retry backoff, so keep it off the event loop
+    response = await run_in_threadpool(
+        gemini.call,
+        client.models.generate_content,
         model="gemini-2.5-flash",
         contents=messages,
         config=cfg,
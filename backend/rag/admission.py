@@ -0,0 +1,182 @@
+import os
+import math
+import time
+import asyncio
+import threading
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Dict, Any, Optional
+
+class Overloaded(Exception):
+    """Raised when a request is shed; carries the HTTP status and Retry-After seconds"""
+
+    def __init__(self, pool: str, status_code: int, retry_after: int, reason: str):
+        super().__init__(f"{pool} pool {reason}")
+        self.pool = pool
+        self.status_code = status_code
+        self.retry_after = retry_after
+        self.reason = reason
+
+class AdmissionPool:
+    """Bounded concurrency with a bounded FIFO wait queue, for one class of endpoints
+
+    Requests run while fewer than max_concurrent are in flight, otherwise wait in the
+    queue. A full queue is rejected at once (429); a request still queued after max_wait
+    seconds is rejected (503). Both carry a Retry-After estimated from recent service times.
+    Runs on the event loop; the counters may be read from other threads.
+    """
+
+    def __init__(self, name: str, max_concurrent: int, max_queue: int, max_wait: float):
+        self.name = name
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.in_flight = 0
+        self._waiters: deque = deque()
+        # Smoothed request duration, used for Retry-After
+        self._service_time = 0.5
+
+        # Metrics
+        self.stats_data = {
+            "admitted": 0,
+            "queued_total": 0,
+            "rejected_queue_full": 0,
+            "rejected_timeout": 0,
+            "max_queue_depth": 0,
+            "queue_wait_ms_total": 0.0
+        }
+
+    @classmethod
+    def from_env(cls, name: str, max_concurrent: int, max_queue: int, max_wait: float) -> "AdmissionPool":
+        prefix = f"RAG_{name.upper()}"
+        return cls(
+            name,
+            max_concurrent=int(os.environ.get(f"{prefix}_CONCURRENCY", str(max_concurrent))),
+            max_queue=int(os.environ.get(f"{prefix}_QUEUE", str(max_queue))),
+            max_wait=float(os.environ.get(f"{prefix}_MAX_WAIT", str(max_wait)))
+        )
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._waiters)
+
+    def retry_after(self) -> int:
+        """Seconds until the current queue has likely drained through the pool"""
+        backlog = self.queue_depth + 1
+        return max(1, math.ceil(self._service_time * backlog / self.max_concurrent))
+
+    async def acquire(self):
+        if self.in_flight < self.max_concurrent and not self._waiters:
+            self.in_flight += 1
+            self.stats_data["admitted"] += 1
+            return
+        if len(self._waiters) >= self.max_queue:
+            self.stats_data["rejected_queue_full"] += 1
+            raise Overloaded(self.name, 429, self.retry_after(), "queue full")
+
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.append(future)
+        self.stats_data["queued_total"] += 1
+        self.stats_data["max_queue_depth"] = max(self.stats_data["max_queue_depth"], len(self._waiters))
+        started = time.perf_counter()
+        # asyncio.wait leaves the future alone on timeout, so a slot handed over at the deadline is not lost
+        try:
+            await asyncio.wait({future}, timeout=self.max_wait)
+        except asyncio.CancelledError:
+            # Client went away while queued: give back a slot that was already handed over
+            if future.done() and not future.cancelled():
+                self.release()
+            else:
+                self._waiters.remove(future)
+                future.cancel()
+            raise
+        self.stats_data["queue_wait_ms_total"] += (time.perf_counter() - started) * 1000
+        if not future.done():
+            self._waiters.remove(future)
+            future.cancel()
+            self.stats_data["rejected_timeout"] += 1
+            raise Overloaded(self.name, 503, self.retry_after(), "queue wait exceeded")
+        # The releasing request handed its slot directly to this waiter
+        self.stats_data["admitted"] += 1
+
+    def release(self, duration: Optional[float] = None):
+        if duration is not None:
+            self._service_time = 0.8 * self._service_time + 0.2 * duration
+        while self._waiters:
+            future = self._waiters.popleft()
+            if not future.done():
+                future.set_result(None)
+                return
+        self.in_flight -= 1
+
+    @asynccontextmanager
+    async def slot(self):
+        await self.acquire()
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.release(time.perf_counter() - started)
+
+    def busy(self) -> bool:
+        """True while requests are waiting or the pool is at capacity"""
+        return bool(self._waiters) or self.in_flight >= self.max_concurrent
+
+    def stats(self) -> Dict[str, Any]:
+        data = dict(self.stats_data)
+        data["avg_queue_wait_ms"] = round(data.pop("queue_wait_ms_total") / (data["queued_total"] or 1), 3)
+        data.update(
+            in_flight=self.in_flight,
+            queue_depth=self.queue_depth,
+            max_concurrent=self.max_concurrent,
+            max_queue=self.max_queue,
+            avg_service_ms=round(self._service_time * 1000, 1)
+        )
+        return data
+
+class AdmissionController:
+    """Per-endpoint-class admission pools plus chat priority over background ingestion
+
+    Ingestion workers call yield_to_interactive() before each embedding call; it holds
+    them back while chat requests are waiting or chat is at capacity, up to max_defer
+    seconds per call so ingestion still progresses under sustained chat load.
+    """
+
+    def __init__(self, pools: Dict[str, AdmissionPool], max_defer: float = 2.0):
+        self.pools = pools
+        self.max_defer = max_defer
+        self._lock = threading.Lock()
+        self.stats_data = {"ingest_deferrals": 0, "ingest_deferred_ms_total": 0.0}
+
+    @classmethod
+    def from_env(cls) -> "AdmissionController":
+        return cls(
+            {
+                "chat": AdmissionPool.from_env("chat", max_concurrent=16, max_queue=64, max_wait=5.0),
+                "upload": AdmissionPool.from_env("upload", max_concurrent=4, max_queue=16, max_wait=10.0),
+                "read": AdmissionPool.from_env("read", max_concurrent=32, max_queue=128, max_wait=2.0)
+            },
+            max_defer=float(os.environ.get("RAG_INGEST_MAX_DEFER", "2.0"))
+        )
+
+    def pool(self, name: str) -> AdmissionPool:
+        return self.pools[name]
+
+    def yield_to_interactive(self):
+        chat = self.pools["chat"]
+        if not chat.busy():
+            return
+        started = time.perf_counter()
+        deadline = started + self.max_defer
+        while chat.busy() and time.perf_counter() < deadline:
+            time.sleep(0.05)
+        with self._lock:
+            self.stats_data["ingest_deferrals"] += 1
+            self.stats_data["ingest_deferred_ms_total"] += (time.perf_counter() - started) * 1000
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            data = dict(self.stats_data)
+        data["ingest_deferred_ms_total"] = round(data["ingest_deferred_ms_total"], 1)
+        data["pools"] = {name: pool.stats() for name, pool in self.pools.items()}
+        return data
@@ -1,22 +1,46 @@
 import os
-from typing import List, Dict, Any, Optional
-import google.generativeai as genai
+from typing import List, Dict, Any, Optional, Callable
 from models import ChatRequest, ChatResponse, SearchResult
 from hybrid_vector_store import HybridVectorStore
 from document_processor import DocumentProcessor
+from document_archive import create_document_archive
+from sharding import ShardCoordinator
+from gemini_client import get_gemini_client
+from singleflight import SingleFlight
+from context_builder import ContextBuilder, ContextPassage
+from context_compressor import ContextCompressor
+from tracing import trace_request, stage, record_stage, metrics
 import uuid
+import time
 from datetime import datetime
 
 class AgenticWorkflow:
     """Agentic workflow for retrieval and generation"""
     
-    def __init__(self, project_id: str):
+    def __init__(self, project_id: str, vector_store: Optional[HybridVectorStore] = None, generation_client=None):
         self.project_id = project_id
-        self.vector_store = HybridVectorStore(project_id)
-        self.document_processor = DocumentProcessor(project_id)
+        self.vector_store = vector_store or HybridVectorStore(project_id)
+        # Uploaded PDFs and their parsed text are archived (bucket or local directory) for re-indexing
+        self.document_processor = DocumentProcessor(project_id, archive=create_document_archive(self.vector_store.bucket))
         
-        # Initialize Gemini model for generation
-        self.model = genai.GenerativeModel("gemini-2.0-flash-exp")
+        # Scatter-gather over shard workers when RAG_SHARD_URLS is set
+        self.shard_coordinator = ShardCoordinator.from_env()
+        
+        # Gemini model for generation, created on the first generation call
+        self._model = None
+        self.generation_client = generation_client or get_gemini_client("generate")
+        
+        # Identical concurrent chats (e.g. a whole class asking the same question) share one run
+        self.chat_flight = SingleFlight("chat")
+        
+        # Retrieved chunks are packed into a fixed prompt token budget
+        self.context_builder = ContextBuilder(token_budget=int(os.environ.get("RAG_CONTEXT_TOKENS", "2000")))
+        
+        # Extractive compression keeps only the sentences relevant to the question; the builder
+        # runs it on the merged, deduplicated passages it selected, within its own token budget
+        self.context_compressor = None
+        if os.environ.get("RAG_COMPRESS_CONTEXT", "1") == "1":
+            self.context_compressor = ContextCompressor()
         
         # System prompt for agentic behavior
         self.system_prompt = """You are an intelligent AI assistant with access to a knowledge base. 
@@ -28,6 +52,22 @@ class AgenticWorkflow:
         
         Always be helpful, accurate, and cite your sources when possible."""
     
+    @property
+    def model(self):
+        if self._model is None:
+            import google.generativeai as genai
+            self._model = genai.GenerativeModel("gemini-2.0-flash-exp")
+        return self._model
+    
+    def warm_up(self, embed: bool = True) -> Dict[str, Any]:
+        """Prepare everything the first chat would otherwise pay for; returns timings in ms"""
+        # With shards the local store only embeds queries; the shard workers hold the indexes
+        timings = self.vector_store.warm_up(load_indexes=self.shard_coordinator is None, embed=embed)
+        started = time.perf_counter()
+        self.model
+        timings["generation_client"] = round((time.perf_counter() - started) * 1000, 3)
+        return timings
+    
     def should_retrieve(self, query: str) -> bool:
         """Decide whether to retrieve information based on the query"""
         try:
@@ -58,17 +98,41 @@ class AgenticWorkflow:
         class_name: str,
         subject_name: str,
         allowed_file_ids: Optional[List[str]] = None,
-        top_k: int = 5
+        top_k: int = 5,
+        timings: Optional[Dict[str, float]] = None
     ) -> List[SearchResult]:
         """Search the knowledge base for relevant information"""
+        timings = timings if timings is not None else {}
         try:
-            results = self.vector_store.hybrid_search(
-                query=query,
-                class_name=class_name,
-                subject_name=subject_name,
-                allowed_file_ids=allowed_file_ids,
-                top_k=top_k
-            )
+            if self.shard_coordinator is not None:
+                # Embed once here; every shard reuses the same query vector
+                started = time.perf_counter()
+                results, info = self.shard_coordinator.search(
+                    query=query,
+                    query_embedding=self.vector_store.embed_query(query),
+                    class_name=class_name,
+                    subject_name=subject_name,
+                    allowed_file_ids=allowed_file_ids,
+                    top_k=top_k
+                )
+                timings["total"] = round((time.perf_counter() - started) * 1000, 3)
+                timings["shards"] = info["took_ms"]
+                if info["partial"]:
+                    metrics.inc("rag_partial_shard_results_total", help="Searches missing at least one shard")
+                    print(f"⚠️ Partial results: shards {sorted(info['failed_shards'])} did not answer")
+            else:
+                results = self.vector_store.hybrid_search(
+                    query=query,
+                    class_name=class_name,
+                    subject_name=subject_name,
+                    allowed_file_ids=allowed_file_ids,
+                    top_k=top_k,
+                    timings=timings
+                )
+            
+            # Sub-stages go to the request trace as retrieval.<stage>; the overall time as retrieval
+            for name, ms in timings.items():
+                record_stage("retrieval" if name == "total" else f"retrieval.{name}", ms)
             
             print(f"🔍 Retrieved {len(results)} chunks for query: {query}")
             return results
@@ -88,13 +152,14 @@ class AgenticWorkflow:
     ) -> str:
         """Generate response using retrieved context"""
         try:
-            # Build context from search results
-            if search_results:
-                context_parts = [f"Context from {class_name} - {subject_name}:"]
-                for i, result in enumerate(search_results, 1):
-                    context_parts.append(f"\n{i}. Content: {result.content[:500]}...")
-                    context_parts.append(f"   Hybrid Score: {result.hybrid_score:.3f}")
-                context = "\n".join(context_parts)
+            # Build context from search results: merge, deduplicate, then compress what was selected
+            compress = None
+            if self.context_compressor is not None:
+                compress = lambda passages, budget: self._compress_context(query, passages, budget)
+            with stage("context.build"):
+                packed = self.context_builder.build(search_results, compress=compress) if search_results else None
+            if packed and packed.passages:
+                context = f"Context from {class_name} - {subject_name}:\n\n{packed.text}"
             else:
                 context = "No relevant information found in the knowledge base."
             
@@ -108,30 +173,71 @@ User Query: {query}
 Please provide a comprehensive response based on the context provided. If the context doesn't contain relevant information, say so and provide general guidance."""
 
             # Generate response
-            response = self.model.generate_content(
-                prompt,
-                generation_config=genai.types.GenerationConfig(
-                    temperature=temperature,
-                    max_output_tokens=max_tokens
+            import google.generativeai as genai
+            with stage("generation"):
+                response = self.generation_client.generate_content(
+                    self.model,
+                    prompt,
+                    generation_config=genai.types.GenerationConfig(
+                        temperature=temperature,
+                        max_output_tokens=max_tokens
+                    )
                 )
-            )
+                text = response.text
             
-            return response.text
+            return text
             
         except Exception as e:
             print(f"❌ Error generating response: {e}")
             return f"I apologize, but I encountered an error while generating a response. Please try again. Error: {str(e)}"
     
+    def _compress_context(self, query: str, passages: List[ContextPassage], token_budget: int) -> List[ContextPassage]:
+        """Keep the sentences of the selected passages that match the query"""
+        with stage("context.compress"):
+            compressed = self.context_compressor.compress(query, passages, token_budget)
+        compression = self.context_compressor.stats(passages, compressed)
+        print(f"🗜️ Compressed context {compression['chars_before']} -> {compression['chars_after']} chars")
+        return compressed
+    
+    def _chat_key(self, request: ChatRequest) -> tuple:
+        """Requests that would produce the same answer: normalized message plus retrieval scope"""
+        return (
+            " ".join(request.message.lower().split()),
+            request.class_name,
+            request.subject_name,
+            tuple(sorted(request.allowed_file_ids)) if request.allowed_file_ids else None,
+            request.max_tokens,
+            request.temperature
+        )
+    
     def process_chat_request(self, request: ChatRequest) -> ChatResponse:
+        """Process chat request, coalescing identical requests already in flight"""
+        return self.chat_flight.do(self._chat_key(request), self._process_chat_request, request)
+    
+    def _process_chat_request(self, request: ChatRequest) -> ChatResponse:
         """Process chat request with agentic workflow"""
+        with trace_request("chat") as trace:
+            response = self._run_chat(request)
+            response.metadata["stage_timings_ms"] = trace.to_dict()
+        metrics.inc(
+            "rag_chat_requests_total",
+            labels={"outcome": "error" if "error" in response.metadata else "ok"},
+            help="Chat requests processed, by outcome"
+        )
+        return response
+    
+    def _run_chat(self, request: ChatRequest) -> ChatResponse:
+        """Decide, retrieve, compress and generate for one chat request"""
         try:
             print(f"🤖 Processing chat request: {request.message}")
             
             # Step 1: Decide whether to retrieve
-            should_retrieve = self.should_retrieve(request.message)
+            with stage("should_retrieve"):
+                should_retrieve = self.should_retrieve(request.message)
             
             retrieved_chunks = []
             response_text = ""
+            retrieval_timings = {}
             
             if should_retrieve:
                 print("🔍 Retrieval needed, searching knowledge base...")
@@ -142,10 +248,11 @@ Please provide a comprehensive response based on the context provided. If the co
                     class_name=request.class_name,
                     subject_name=request.subject_name,
                     allowed_file_ids=request.allowed_file_ids,
-                    top_k=5
+                    top_k=5,
+                    timings=retrieval_timings
                 )
                 
-                # Step 3: Generate response with context
+                # Step 3: Generate response with context (merged, deduplicated and compressed)
                 response_text = self.generate_response_with_context(
                     query=request.message,
                     search_results=retrieved_chunks,
@@ -178,7 +285,8 @@ Please provide a comprehensive response based on the context provided. If the co
                     "subject_name": request.subject_name,
                     "allowed_files": request.allowed_file_ids,
                     "temperature": request.temperature,
-                    "max_tokens": request.max_tokens
+                    "max_tokens": request.max_tokens,
+                    "retrieval_timings_ms": retrieval_timings
                 }
             )
             
@@ -198,23 +306,40 @@ Please provide a comprehensive response based on the context provided. If the co
         title: str,
         class_name: str,
         subject_name: str,
-        user_id: str = "default"
+        user_id: str = "default",
+        progress: Optional[Callable[[str, int, int], None]] = None,
+        file_id: Optional[str] = None,
+        document_id: Optional[str] = None
     ) -> Dict[str, Any]:
-        """Process PDF upload with Document AI and store chunks"""
+        """Process PDF upload with Document AI and store chunks
+
+        progress(stage, chunks_done, total_chunks) is called as the upload moves through
+        the "parsing" and "embedding" stages.
+        """
+        report = progress or (lambda stage, done, total: None)
         try:
             print(f"📄 Processing PDF: {title}")
             
             # Step 1: Process PDF with Document AI
+            report("parsing", 0, 0)
             processing_result = self.document_processor.process_pdf_file(
                 file_content=file_content,
                 title=title,
                 class_name=class_name,
                 subject_name=subject_name,
-                user_id=user_id
+                user_id=user_id,
+                file_id=file_id,
+                document_id=document_id
             )
             
             # Step 2: Store chunks with embeddings
-            chunk_ids = self.vector_store.store_chunks(processing_result["chunks"])
+            total_chunks = processing_result["total_chunks"]
+            report("embedding", 0, total_chunks)
+            chunk_ids = self.vector_store.store_chunks(
+                processing_result["chunks"],
+                parents=processing_result["parents"],
+                progress=lambda done, total: report("embedding", done, total)
+            )
             
             print(f"✅ Stored {len(chunk_ids)} chunks for file: {processing_result['file_id']}")
             
@@ -233,6 +358,77 @@ Please provide a comprehensive response based on the context provided. If the co
             print(f"❌ Error processing PDF upload: {e}")
             raise
     
+    def process_pdf_batch(
+        self,
+        files: List[Dict[str, Any]],
+        class_name: str,
+        subject_name: str,
+        user_id: str = "default",
+        progress: Optional[Callable[[int, str, int, int], None]] = None
+    ) -> List[Dict[str, Any]]:
+        """Process several PDFs together: parallel parsing, shared embedding and write batches
+
+        Each file is a dict with file_content, title and optional file_id/document_id.
+        Returns one result per file; failed files carry an "error" instead of chunks.
+        progress(file_position, stage, chunks_done, total_chunks) reports per-file progress.
+        """
+        report = progress or (lambda position, stage, done, total: None)
+        print(f"📚 Processing batch of {len(files)} PDFs")
+        
+        # Step 1: Parse every file across the process pool
+        for position in range(len(files)):
+            report(position, "parsing", 0, 0)
+        parsed = self.document_processor.process_pdf_files(files, class_name, subject_name, user_id)
+        
+        results: List[Dict[str, Any]] = [None] * len(files)
+        positions = {}
+        for position, processing_result in enumerate(parsed):
+            if isinstance(processing_result, Exception):
+                results[position] = {"title": files[position]["title"], "error": f"Parsing failed: {processing_result}"}
+                continue
+            positions[processing_result["file_id"]] = position
+            report(position, "embedding", 0, processing_result["total_chunks"])
+        
+        # Step 2: Store all files' chunks through shared embedding calls and write batches
+        stored = [p for p in parsed if not isinstance(p, Exception)]
+        if not stored:
+            return results
+        done = {file_id: 0 for file_id in positions}
+        
+        def on_commit(committed):
+            for chunk in committed:
+                done[chunk.file_id] += 1
+            for file_id in {chunk.file_id for chunk in committed}:
+                position = positions[file_id]
+                report(position, "embedding", done[file_id], parsed[position]["total_chunks"])
+        
+        try:
+            self.vector_store.store_chunks_batched(
+                [chunk for p in stored for chunk in p["chunks"]],
+                parents=[parent for p in stored for parent in p["parents"]],
+                progress=on_commit
+            )
+        except Exception as e:
+            print(f"❌ Error storing PDF batch: {e}")
+            # Remove partially written files so a retry starts clean
+            for p in stored:
+                self.delete_file(p["file_id"])
+                results[positions[p["file_id"]]] = {"title": p["title"], "error": f"Storing failed: {e}"}
+            return results
+        
+        for p in stored:
+            results[positions[p["file_id"]]] = {
+                "file_id": p["file_id"],
+                "document_id": p["document_id"],
+                "title": p["title"],
+                "class_name": p["class_name"],
+                "subject_name": p["subject_name"],
+                "total_chunks": p["total_chunks"],
+                "message": "PDF processed and stored successfully"
+            }
+        print(f"✅ Stored {sum(p['total_chunks'] for p in stored)} chunks for {len(stored)}/{len(files)} PDFs")
+        return results
+    
     def get_file_chunks(self, file_id: str) -> List[Dict[str, Any]]:
         """Get chunks for a specific file"""
         try:
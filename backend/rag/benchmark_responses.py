@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Chat Response Serialization Benchmark
+Builds real ChatResponses (agentic workflow over a synthetic corpus and the fake Gemini backend)
+and compares the serialization time and bytes on the wire of the old full-content path
+(to_dict + FastAPI's jsonable_encoder + stdlib json) with full and lean responses rendered by
+fast_json, uncompressed, gzip and (when installed) brotli. No cloud access or server needed.
+"""
+
+import gzip
+import json
+import time
+import argparse
+import contextlib
+import io
+import numpy as np
+
+import fast_json
+from fake_gemini import FakeGemini
+from models import ChatRequest
+from synthetic_corpus import generate_queries
+from benchmark_suite import corpus_chunks, make_store, percentile
+from storage_backends import FirestoreStorage
+from local_firestore import LocalFirestore
+
+try:
+    from fastapi.encoders import jsonable_encoder
+except ImportError:
+    jsonable_encoder = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+def stdlib_render(content) -> bytes:
+    """What the old response_model=Dict[str, Any] endpoint did: jsonable_encoder, then Starlette's JSONResponse"""
+    if jsonable_encoder is not None:
+        content = jsonable_encoder(content)
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")).encode("utf-8")
+
+def chat_responses(args):
+    """ChatResponses from the real workflow for generated questions"""
+    from agentic_workflow import AgenticWorkflow
+
+    backend = FakeGemini()
+    chunks = corpus_chunks(args.files, args.chunks_per_file, words_per_chunk=args.words_per_chunk)
+    store = make_store(FirestoreStorage(LocalFirestore()), backend, "exact")
+    workflow = AgenticWorkflow("response-benchmark", vector_store=store, generation_client=backend)
+    responses = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        store.store_chunks_batched(chunks)
+        for query in generate_queries(args.chats):
+            chunk = chunks[len(responses) % len(chunks)]
+            responses.append(workflow.process_chat_request(ChatRequest(
+                message=f"Explain {query}", user_id="benchmark", class_name=chunk.class_name,
+                subject_name=chunk.subject_name, allowed_file_ids=[]
+            )))
+    return responses
+
+def measure(name: str, responses, build, render, repeat: int):
+    """Mean/p95 serialization microseconds and mean bytes per chat (raw, gzip, brotli)"""
+    timings, bodies = [], []
+    for _ in range(repeat):
+        for response in responses:
+            started = time.perf_counter()
+            body = render(build(response))
+            timings.append((time.perf_counter() - started) * 1e6)
+            bodies.append(body)
+    bodies = bodies[:len(responses)]
+    row = {
+        "name": name,
+        "mean_us": float(np.mean(timings)),
+        "p95_us": percentile(timings, 95),
+        "bytes": float(np.mean([len(b) for b in bodies])),
+        "gzip_bytes": float(np.mean([len(gzip.compress(b, compresslevel=6)) for b in bodies]))
+    }
+    if brotli is not None:
+        row["br_bytes"] = float(np.mean([len(brotli.compress(b, quality=4)) for b in bodies]))
+    return row
+
+def main():
+    """Main function"""
+    parser = argparse.ArgumentParser(description="Benchmark chat response serialization and payload size")
+    parser.add_argument("--files", type=int, default=20, help="Synthetic files")
+    parser.add_argument("--chunks-per-file", type=int, default=20, help="Chunks per file")
+    parser.add_argument("--words-per-chunk", type=int, default=450, help="Words per chunk (~3000 characters at 450)")
+    parser.add_argument("--chats", type=int, default=50, help="Chat requests to serialize")
+    parser.add_argument("--repeat", type=int, default=20, help="Serializations per response")
+    parser.add_argument("--snippet-chars", type=int, default=240, help="Snippet length of lean responses")
+    args = parser.parse_args()
+
+    responses = chat_responses(args)
+    chunks = np.mean([len(r.retrieved_chunks) for r in responses])
+    content = np.mean([len(c.content) for r in responses for c in r.retrieved_chunks] or [0])
+
+    rows = [
+        measure("full, jsonable_encoder + json" if jsonable_encoder else "full, json", responses,
+                lambda r: r.to_dict(), stdlib_render, args.repeat),
+        measure(f"full, {fast_json.BACKEND}", responses, lambda r: r.to_dict(), fast_json.dumps, args.repeat),
+        measure(f"lean, {fast_json.BACKEND}", responses,
+                lambda r: r.to_dict(include_content=False, snippet_chars=args.snippet_chars), fast_json.dumps, args.repeat)
+    ]
+
+    print("=" * 96)
+    print(f"CHAT RESPONSE SERIALIZATION ({len(responses)} chats, {chunks:.1f} chunks/chat, {content:.0f} chars/chunk)")
+    print("=" * 96)
+    header = f"{'mode':<36}{'mean us':>10}{'p95 us':>10}{'bytes':>10}{'gzip':>10}"
+    if brotli is not None:
+        header += f"{'br':>10}"
+    print(header)
+    for row in rows:
+        line = f"{row['name']:<36}{row['mean_us']:>10.1f}{row['p95_us']:>10.1f}{row['bytes']:>10.0f}{row['gzip_bytes']:>10.0f}"
+        if brotli is not None:
+            line += f"{row['br_bytes']:>10.0f}"
+        print(line)
+    print("=" * 96)
+    if jsonable_encoder is None:
+        print("⚠️ fastapi not installed: the baseline row omits jsonable_encoder and understates the old cost")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,238 @@
+#!/usr/bin/env python3
+"""
+Offline RAG Benchmark Suite
+Runs ingestion, hybrid_search and (optionally) full chat requests against a local storage backend
+(LocalFirestore or SQLite) and an in-process fake Gemini backend with configurable latency, over synthetic corpora of several
+sizes. Reports ingest throughput, latency percentiles and memory; no cloud access needed.
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import tracemalloc
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+
+from local_firestore import LocalFirestore
+from synthetic_corpus import generate_corpus, generate_queries
+from fake_gemini import FakeGemini
+from hybrid_vector_store import HybridVectorStore
+from storage_backends import FirestoreStorage, SQLiteStorage
+from models import DocumentChunk, ChatRequest
+
+# Metrics compared against a baseline, and whether higher values are better
+TRACKED_METRICS = {
+    "ingest_chunks_per_second": True,
+    "search_p50_ms": False,
+    "search_p95_ms": False,
+    "search_p99_ms": False,
+    "chat_p95_ms": False,
+    "index_mb": False
+}
+
+def parse_sizes(sizes: str):
+    """'20x50,100x50' -> [(20, 50), (100, 50)] (files x chunks per file)"""
+    return [tuple(int(n) for n in size.lower().split("x")) for size in sizes.split(",")]
+
+def percentile(values, q):
+    return float(np.percentile(values, q)) if values else 0.0
+
+def rss_mb() -> float:
+    """Resident set size of this process (Linux), 0 when unavailable"""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return 0.0
+
+def corpus_chunks(num_files: int, chunks_per_file: int, words_per_chunk: int = 120):
+    """Synthetic corpus as DocumentChunks, without precomputed embeddings"""
+    docs = generate_corpus(num_files, chunks_per_file, words_per_chunk=words_per_chunk, dimension=8)
+    return [
+        DocumentChunk(
+            id=doc["chunk_id"],
+            document_id=doc["document_id"],
+            content=doc["content"],
+            chunk_index=doc["chunk_index"],
+            class_name=doc["class_name"],
+            subject_name=doc["subject_name"],
+            file_id=doc["file_id"],
+            metadata={**doc["metadata"], "chunk_size": 3000, "overlap": 0}
+        )
+        for doc in docs
+    ]
+
+def make_storage(args):
+    if args.storage == "sqlite":
+        return SQLiteStorage(os.path.join(tempfile.mkdtemp(prefix="rag-bench-"), "store.db"))
+    return FirestoreStorage(LocalFirestore())
+
+def make_store(storage, backend: FakeGemini, dense_mode: str) -> HybridVectorStore:
+    store = HybridVectorStore("offline-benchmark", dense_mode=dense_mode, storage=storage)
+    store.embedding_client = backend
+    return store
+
+def bench_ingest(chunks, backend: FakeGemini, args):
+    storage = make_storage(args)
+    store = make_store(storage, backend, args.dense_mode)
+    started = time.perf_counter()
+    if args.ingest == "batched":
+        store.store_chunks_batched(chunks)
+    else:
+        store.store_chunks(chunks)
+    elapsed = time.perf_counter() - started
+    return storage, len(chunks) / elapsed
+
+def bench_search(store: HybridVectorStore, queries, scopes, args):
+    def one(i):
+        class_name, subject_name = scopes[i % len(scopes)]
+        started = time.perf_counter()
+        store.hybrid_search(queries[i], class_name=class_name, subject_name=subject_name, top_k=args.top_k)
+        return (time.perf_counter() - started) * 1000
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        latencies = list(pool.map(one, range(len(queries))))
+    return latencies, len(queries) / (time.perf_counter() - started)
+
+def bench_chat(store: HybridVectorStore, backend: FakeGemini, queries, scopes, args):
+    from agentic_workflow import AgenticWorkflow
+
+    workflow = AgenticWorkflow("offline-benchmark", vector_store=store, generation_client=backend)
+    latencies = []
+    for i, query in enumerate(queries):
+        class_name, subject_name = scopes[i % len(scopes)]
+        started = time.perf_counter()
+        workflow.process_chat_request(ChatRequest(
+            message=query, user_id="benchmark", class_name=class_name,
+            subject_name=subject_name, allowed_file_ids=[]
+        ))
+        latencies.append((time.perf_counter() - started) * 1000)
+    return latencies
+
+def run_size(num_files: int, chunks_per_file: int, args):
+    backend = FakeGemini(
+        embed_latency_ms=args.embed_latency_ms,
+        embed_per_item_ms=args.embed_per_item_ms,
+        generate_latency_ms=args.generate_latency_ms,
+        jitter_ms=args.jitter_ms
+    )
+    chunks = corpus_chunks(num_files, chunks_per_file)
+    scopes = sorted({(c.class_name, c.subject_name) for c in chunks})
+    queries = generate_queries(args.queries)
+
+    storage, ingest_rate = bench_ingest(chunks, backend, args)
+
+    # Cold start on a fresh store: index load time and the memory it holds
+    tracemalloc.start()
+    store = make_store(storage, backend, args.dense_mode)
+    started = time.perf_counter()
+    store.hybrid_search(queries[0], top_k=args.top_k)
+    index_load_ms = (time.perf_counter() - started) * 1000
+    index_mb = tracemalloc.get_traced_memory()[0] / 1e6
+    tracemalloc.stop()
+
+    latencies, qps = bench_search(store, queries, scopes, args)
+    result = {
+        "files": num_files,
+        "chunks": len(chunks),
+        "ingest_chunks_per_second": round(ingest_rate, 1),
+        "index_load_ms": round(index_load_ms, 1),
+        "index_mb": round(index_mb, 1),
+        "rss_mb": round(rss_mb(), 1),
+        "search_p50_ms": round(percentile(latencies, 50), 2),
+        "search_p95_ms": round(percentile(latencies, 95), 2),
+        "search_p99_ms": round(percentile(latencies, 99), 2),
+        "search_qps": round(qps, 1),
+        "embed_calls": backend.stats()["embed_calls"]
+    }
+    if args.chat:
+        chat = bench_chat(store, backend, queries[:args.chat_queries], scopes, args)
+        result.update(chat_p50_ms=round(percentile(chat, 50), 2), chat_p95_ms=round(percentile(chat, 95), 2))
+    return result
+
+def compare(results, baseline, max_regression: float) -> int:
+    """Print changes against a saved run; returns the number of regressions beyond the threshold"""
+    previous = {(r["files"], r["chunks"]): r for r in baseline["results"]}
+    regressions = 0
+    print(f"\n{'size':<14}{'metric':<26}{'baseline':>12}{'current':>12}{'change':>9}")
+    for result in results:
+        before = previous.get((result["files"], result["chunks"]))
+        if before is None:
+            continue
+        for metric, higher_is_better in TRACKED_METRICS.items():
+            if metric not in result or not before.get(metric):
+                continue
+            change = (result[metric] - before[metric]) / before[metric]
+            worse = -change if higher_is_better else change
+            flag = ""
+            if worse > max_regression:
+                regressions += 1
+                flag = "  ❌"
+            size = f"{result['files']}x{result['chunks'] // result['files']}"
+            print(f"{size:<14}{metric:<26}{before[metric]:>12.2f}{result[metric]:>12.2f}{change:>+9.1%}{flag}")
+    return regressions
+
+def main():
+    """Main function"""
+    parser = argparse.ArgumentParser(description="Offline ingest/search/chat benchmark suite")
+    parser.add_argument("--sizes", default="20x50,100x50,400x50", help="Comma-separated corpus sizes, files x chunks per file")
+    parser.add_argument("--queries", type=int, default=200, help="Search queries per size")
+    parser.add_argument("--top-k", type=int, default=5, help="Results per query")
+    parser.add_argument("--concurrency", type=int, default=1, help="Concurrent search callers")
+    parser.add_argument("--dense-mode", default=os.environ.get("RAG_DENSE_MODE", "exact"), choices=["exact", "two_stage"])
+    parser.add_argument("--storage", default="memory", choices=["memory", "sqlite"], help="LocalFirestore or SQLite storage backend")
+    parser.add_argument("--ingest", default="batched", choices=["batched", "single"], help="store_chunks_batched or per-chunk store_chunks")
+    parser.add_argument("--embed-latency-ms", type=float, default=20.0, help="Fake latency per embed_content call")
+    parser.add_argument("--embed-per-item-ms", type=float, default=0.2, help="Extra fake latency per embedded text")
+    parser.add_argument("--generate-latency-ms", type=float, default=300.0, help="Fake latency per generate_content call")
+    parser.add_argument("--jitter-ms", type=float, default=5.0, help="Uniform jitter added to every fake call")
+    parser.add_argument("--chat", action="store_true", help="Also benchmark full chat requests")
+    parser.add_argument("--chat-queries", type=int, default=20, help="Chat requests per size")
+    parser.add_argument("--save", help="Write results as JSON to this path")
+    parser.add_argument("--baseline", help="Compare against results saved by an earlier --save")
+    parser.add_argument("--max-regression", type=float, default=0.2, help="Allowed relative regression before failing")
+    args = parser.parse_args()
+
+    print("=" * 100)
+    print(f"OFFLINE RAG BENCHMARK (storage={args.storage}, dense={args.dense_mode}, ingest={args.ingest}, embed {args.embed_latency_ms}ms, "
+          f"generate {args.generate_latency_ms}ms, concurrency={args.concurrency})")
+    print("=" * 100)
+    header = f"{'size':<12}{'chunks':>8}{'ingest/s':>10}{'load ms':>9}{'index MB':>9}{'RSS MB':>8}{'p50 ms':>8}{'p95 ms':>8}{'p99 ms':>8}{'qps':>8}"
+    if args.chat:
+        header += f"{'chat p50':>10}{'chat p95':>10}"
+    print(header)
+
+    results = []
+    for num_files, chunks_per_file in parse_sizes(args.sizes):
+        r = run_size(num_files, chunks_per_file, args)
+        results.append(r)
+        line = (f"{f'{num_files}x{chunks_per_file}':<12}{r['chunks']:>8}{r['ingest_chunks_per_second']:>10.1f}{r['index_load_ms']:>9.1f}"
+                f"{r['index_mb']:>9.1f}{r['rss_mb']:>8.1f}{r['search_p50_ms']:>8.2f}{r['search_p95_ms']:>8.2f}"
+                f"{r['search_p99_ms']:>8.2f}{r['search_qps']:>8.1f}")
+        if args.chat:
+            line += f"{r['chat_p50_ms']:>10.1f}{r['chat_p95_ms']:>10.1f}"
+        print(line)
+    print("=" * 100)
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump({"args": vars(args), "results": results}, f, indent=2)
+        print(f"✅ Results saved to {args.save}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.max_regression)
+        if regressions:
+            print(f"\n❌ {regressions} metrics regressed by more than {args.max_regression:.0%}")
+            sys.exit(1)
+        print("\n✅ No regressions beyond threshold")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Two-Stage Dense Retrieval Benchmark
+Compares exact full-precision search against reduced-dimension / binary candidate
+selection with full-precision rerank on a synthetic corpus (no cloud access needed)
+"""
+
+import argparse
+import time
+import numpy as np
+
+from dense_index import DenseIndex
+
+def make_corpus(num_docs: int, dimension: int, num_queries: int, seed: int = 0):
+    """Synthetic embeddings with a decaying spectrum, similar to real text embeddings"""
+    rng = np.random.default_rng(seed)
+    rank = 64
+    basis = rng.standard_normal((rank, dimension)).astype(np.float32)
+    weights = (1.0 / np.arange(1, rank + 1) ** 0.5).astype(np.float32)
+    docs = (rng.standard_normal((num_docs, rank)).astype(np.float32) * weights) @ basis
+    docs += 0.05 * rng.standard_normal((num_docs, dimension)).astype(np.float32)
+
+    # Queries are noisy copies of random documents
+    picks = rng.choice(num_docs, num_queries, replace=False)
+    queries = docs[picks] + 0.3 * rng.standard_normal((num_queries, dimension)).astype(np.float32)
+    return docs, queries
+
+def run_benchmark(index: DenseIndex, queries: np.ndarray, top_k: int, two_stage: bool, multiplier: int):
+    """Return (mean latency ms, result rows per query)"""
+    results = []
+    start = time.perf_counter()
+    for query in queries:
+        rows, _ = index.search(query, top_k, two_stage=two_stage, candidate_multiplier=multiplier)
+        results.append(set(rows.tolist()))
+    elapsed = (time.perf_counter() - start) * 1000 / len(queries)
+    return elapsed, results
+
+def bytes_per_query(index: DenseIndex, top_k: int, multiplier: int, two_stage: bool) -> int:
+    """Approximate vector bytes read per query"""
+    full_row = index.vectors.shape[1] * index.vectors.itemsize
+    if not two_stage:
+        return len(index) * full_row
+    reduced_row = index.reduced.shape[1] * index.reduced.itemsize
+    return len(index) * reduced_row + min(top_k * multiplier, len(index)) * full_row
+
+def main():
+    """Main function"""
+    parser = argparse.ArgumentParser(description="Benchmark two-stage dense retrieval")
+    parser.add_argument("--docs", type=int, default=50000, help="Number of corpus vectors")
+    parser.add_argument("--queries", type=int, default=200, help="Number of queries")
+    parser.add_argument("--dimension", type=int, default=768, help="Embedding dimension")
+    parser.add_argument("--reduced-dim", type=int, default=128, help="Reduced dimension for truncate/pca")
+    parser.add_argument("--top-k", type=int, default=5, help="Results per query")
+    parser.add_argument("--multipliers", default="10,20,50", help="Comma-separated candidate multipliers")
+    args = parser.parse_args()
+
+    docs, queries = make_corpus(args.docs, args.dimension, args.queries)
+    ids = [str(i) for i in range(args.docs)]
+    records = [{} for _ in ids]
+    multipliers = [int(m) for m in args.multipliers.split(",")]
+
+    print("=" * 78)
+    print(f"TWO-STAGE DENSE RETRIEVAL BENCHMARK ({args.docs} docs, {args.dimension} dims, top_k={args.top_k})")
+    print("=" * 78)
+
+    exact_index = DenseIndex(dimension=args.dimension)
+    exact_index.add(ids, docs, records)
+    exact_ms, exact_results = run_benchmark(exact_index, queries, args.top_k, False, 1)
+    exact_bytes = bytes_per_query(exact_index, args.top_k, 1, False)
+    print(f"{'mode':<10}{'mult':>6}{'recall@k':>10}{'ms/query':>10}{'MB/query':>10}{'speedup':>9}")
+    print(f"{'exact':<10}{'-':>6}{1.0:>10.3f}{exact_ms:>10.2f}{exact_bytes / 1e6:>10.2f}{1.0:>9.2f}")
+
+    for quantization in DenseIndex.QUANTIZATIONS:
+        index = DenseIndex(dimension=args.dimension, reduced_dim=args.reduced_dim, quantization=quantization)
+        index.add(ids, docs, records)
+        for multiplier in multipliers:
+            ms, results = run_benchmark(index, queries, args.top_k, True, multiplier)
+            recall = np.mean([len(r & e) / len(e) for r, e in zip(results, exact_results)])
+            scanned = bytes_per_query(index, args.top_k, multiplier, True)
+            print(f"{quantization:<10}{multiplier:>6}{recall:>10.3f}{ms:>10.2f}{scanned / 1e6:>10.2f}{exact_ms / ms:>9.2f}")
+
+    print("=" * 78)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+import json
+import numpy as np
+from typing import List, Dict, Any, Optional, Sequence
+
+from models import ChunkRecord
+
+# Columns stored as int32 codes into a per-table dictionary; filters compare codes, not strings
+CODED_COLUMNS = ("document_id", "class_name", "subject_name", "file_id", "user_id")
+
+class ChunkTable:
+    """Columnar, read-only metadata for the rows of an index segment
+
+    Filter columns are dictionary-encoded, chunk_index is an int32 array (-1 when unknown)
+    and content and metadata (JSON) each live in one shared UTF-8 buffer addressed by row
+    offsets, the same layout as index snapshots. A row costs a few array slots instead of a
+    dict with its own strings; ChunkRecords are only materialized for search results.
+    """
+
+    __slots__ = (
+        "ids", "codes", "values", "lookups", "chunk_index",
+        "content_buffer", "content_offsets", "metadata_buffer", "metadata_offsets"
+    )
+
+    def __init__(
+        self,
+        ids: List[str],
+        codes: Dict[str, np.ndarray],
+        values: Dict[str, List[Any]],
+        chunk_index: np.ndarray,
+        content_buffer: bytes,
+        content_offsets: np.ndarray,
+        metadata_buffer: bytes,
+        metadata_offsets: np.ndarray
+    ):
+        self.ids = ids
+        self.codes = codes
+        # code -> value, and value -> code for filters
+        self.values = values
+        self.lookups = {name: {value: code for code, value in enumerate(column)} for name, column in values.items()}
+        self.chunk_index = chunk_index
+        self.content_buffer = content_buffer
+        self.content_offsets = content_offsets
+        self.metadata_buffer = metadata_buffer
+        self.metadata_offsets = metadata_offsets
+
+    @classmethod
+    def from_records(cls, records: Sequence[Dict[str, Any]]) -> "ChunkTable":
+        """Table over index record dicts (HybridVectorStore._index_record)"""
+        codes, values = {}, {}
+        for name in CODED_COLUMNS:
+            lookup: Dict[Any, int] = {}
+            codes[name] = np.fromiter(
+                (lookup.setdefault(r.get(name), len(lookup)) for r in records), dtype=np.int32, count=len(records)
+            )
+            values[name] = list(lookup)
+        chunk_index = np.array(
+            [-1 if r.get("chunk_index") is None else r["chunk_index"] for r in records], dtype=np.int32
+        )
+        content_buffer, content_offsets = _pack(r["content"] for r in records)
+        metadata_buffer, metadata_offsets = _pack(json.dumps(r.get("metadata") or {}) for r in records)
+        return cls(
+            [r["chunk_id"] for r in records], codes, values, chunk_index,
+            content_buffer, content_offsets, metadata_buffer, metadata_offsets
+        )
+
+    @classmethod
+    def concat(cls, tables: Sequence["ChunkTable"], rows: Sequence[np.ndarray]) -> "ChunkTable":
+        """Table with the given rows of each table, in order; dictionaries are merged"""
+        ids, chunk_index, contents, metadata = [], [], [], []
+        codes: Dict[str, List[np.ndarray]] = {name: [] for name in CODED_COLUMNS}
+        values: Dict[str, List[Any]] = {name: [] for name in CODED_COLUMNS}
+        lookups: Dict[str, Dict[Any, int]] = {name: {} for name in CODED_COLUMNS}
+        for table, keep in zip(tables, rows):
+            keep = np.asarray(keep, dtype=np.int64)
+            ids.extend(table.ids[row] for row in keep)
+            chunk_index.append(table.chunk_index[keep])
+            contents.extend(table._slice(table.content_buffer, table.content_offsets, row) for row in keep)
+            metadata.extend(table._slice(table.metadata_buffer, table.metadata_offsets, row) for row in keep)
+            for name in CODED_COLUMNS:
+                # Table code -> merged code
+                remap = np.array(
+                    [lookups[name].setdefault(value, len(lookups[name])) for value in table.values[name]],
+                    dtype=np.int32
+                )
+                codes[name].append(remap[table.codes[name][keep]] if len(remap) else np.zeros(0, dtype=np.int32))
+        for name in CODED_COLUMNS:
+            values[name] = list(lookups[name])
+        content_buffer, content_offsets = _join(contents)
+        metadata_buffer, metadata_offsets = _join(metadata)
+        return cls(
+            ids,
+            {name: np.concatenate(parts) if parts else np.zeros(0, dtype=np.int32) for name, parts in codes.items()},
+            values,
+            np.concatenate(chunk_index) if chunk_index else np.zeros(0, dtype=np.int32),
+            content_buffer, content_offsets, metadata_buffer, metadata_offsets
+        )
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @property
+    def nbytes(self) -> int:
+        arrays = [self.chunk_index, self.content_offsets, self.metadata_offsets, *self.codes.values()]
+        return int(sum(array.nbytes for array in arrays)) + len(self.content_buffer) + len(self.metadata_buffer)
+
+    @staticmethod
+    def _slice(buffer: bytes, offsets: np.ndarray, row: int) -> bytes:
+        return buffer[int(offsets[row]):int(offsets[row + 1])]
+
+    def content(self, row: int) -> str:
+        return self._slice(self.content_buffer, self.content_offsets, row).decode("utf-8")
+
+    def mask(self, name: str, value: Any) -> np.ndarray:
+        """Rows whose column equals value"""
+        code = self.lookups[name].get(value)
+        if code is None:
+            return np.zeros(len(self.ids), dtype=bool)
+        return self.codes[name] == code
+
+    def isin(self, name: str, values: Sequence[Any]) -> np.ndarray:
+        """Rows whose column is one of values"""
+        codes = [self.lookups[name][value] for value in values if value in self.lookups[name]]
+        return np.isin(self.codes[name], np.array(codes, dtype=np.int32))
+
+    def record(self, row: int) -> ChunkRecord:
+        columns = {name: self.values[name][self.codes[name][row]] for name in CODED_COLUMNS}
+        chunk_index = int(self.chunk_index[row])
+        return ChunkRecord(
+            chunk_id=self.ids[row],
+            content=self.content(row),
+            chunk_index=chunk_index if chunk_index >= 0 else None,
+            metadata=json.loads(self._slice(self.metadata_buffer, self.metadata_offsets, row)),
+            **columns
+        )
+
+def _join(encoded: List[bytes]):
+    """One buffer and row offsets for already-encoded values"""
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(e) for e in encoded], out=offsets[1:])
+    return b"".join(encoded), offsets
+
+def _pack(texts) -> tuple:
+    return _join([text.encode("utf-8") for text in texts])
@@ -1,6 +1,8 @@
+import os
+import time
 import requests
 import json
-from typing import Dict, Any
+from typing import Dict, Any, List
 
 class AgenticRAGClient:
     """Client for the simplified Agentic RAG API"""
@@ -66,6 +68,60 @@ class AgenticRAGClient:
             )
             return response.json()
     
+    def upload_pdfs(
+        self,
+        file_paths: List[str],
+        class_name: str,
+        subject_name: str,
+        user_id: str = "default"
+    ) -> Dict[str, Any]:
+        """Upload several PDFs (or zips of PDFs) in one batch request; titles come from file names"""
+        handles = [open(path, 'rb') for path in file_paths]
+        try:
+            files = [('files', (os.path.basename(path), handle)) for path, handle in zip(file_paths, handles)]
+            data = {
+                'class_name': class_name,
+                'subject_name': subject_name,
+                'user_id': user_id
+            }
+            
+            response = self.session.post(
+                f"{self.base_url}/upload-pdfs",
+                files=files,
+                data=data
+            )
+            return response.json()
+        finally:
+            for handle in handles:
+                handle.close()
+    
+    def wait_for_batch(self, batch_id: str, poll_interval: float = 2.0, timeout: float = 3600.0) -> List[Dict[str, Any]]:
+        """Poll a batch upload until every file's job has completed or failed"""
+        deadline = time.time() + timeout
+        while True:
+            response = self.session.get(f"{self.base_url}/jobs", params={"batch_id": batch_id, "limit": 500})
+            jobs = response.json()["jobs"]
+            if all(job["status"] in ("completed", "failed") for job in jobs) or time.time() > deadline:
+                return jobs
+            done = sum(job["chunks_done"] for job in jobs)
+            print(f"⏳ {sum(job['status'] == 'completed' for job in jobs)}/{len(jobs)} files, {done} chunks stored")
+            time.sleep(poll_interval)
+    
+    def get_job(self, job_id: str) -> Dict[str, Any]:
+        """Get the status of an ingestion job"""
+        response = self.session.get(f"{self.base_url}/jobs/{job_id}")
+        return response.json()
+    
+    def wait_for_job(self, job_id: str, poll_interval: float = 2.0, timeout: float = 1800.0) -> Dict[str, Any]:
+        """Poll an ingestion job until it completes or fails"""
+        deadline = time.time() + timeout
+        while True:
+            job = self.get_job(job_id)
+            if job.get("status") in ("completed", "failed") or time.time() > deadline:
+                return job
+            print(f"⏳ {job.get('stage')}: {job.get('chunks_done')}/{job.get('total_chunks')} chunks")
+            time.sleep(poll_interval)
+    
     def get_file_chunks(self, file_id: str) -> Dict[str, Any]:
         """Get chunks for a specific file"""
         response = self.session.get(f"{self.base_url}/files/{file_id}/chunks")
@@ -95,7 +151,10 @@ def main():
             subject_name="Mathematics",
             user_id="teacher123"
         )
-        print(f"✅ PDF uploaded: {upload_result}")
+        print(f"✅ PDF queued: {upload_result}")
+        
+        job = client.wait_for_job(upload_result["job_id"])
+        print(f"✅ Ingestion {job['status']}: {job.get('result') or job.get('error')}")
         
         file_id = upload_result["file_id"]
         allowed_files = [file_id]
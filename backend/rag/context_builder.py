@@ -0,0 +1,202 @@
+import re
+import math
+import hashlib
+from dataclasses import dataclass, field
+from typing import List, Dict, Any, Optional, Callable
+
+import numpy as np
+
+from models import SearchResult
+
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+_WORD = re.compile(r"\w+")
+
+@dataclass
+class ContextPassage:
+    """A contiguous run of retrieved chunks from one file"""
+    file_id: str
+    document_id: str
+    title: str
+    chunk_indices: List[int]
+    text: str
+    score: float
+    chunk_ids: List[str] = field(default_factory=list)
+
+    def label(self) -> str:
+        if not self.chunk_indices:
+            return self.title
+        first, last = self.chunk_indices[0], self.chunk_indices[-1]
+        part = f"part {first + 1}" if first == last else f"parts {first + 1}-{last + 1}"
+        return f"{self.title}, {part}"
+
+@dataclass
+class PackedContext:
+    """Passages that fit the token budget, rendered for the prompt"""
+    passages: List[ContextPassage]
+    text: str
+    tokens: int
+    dropped_duplicates: int = 0
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "tokens": self.tokens,
+            "passages": len(self.passages),
+            "dropped_duplicates": self.dropped_duplicates,
+            "sources": [{"file_id": p.file_id, "chunk_ids": p.chunk_ids} for p in self.passages]
+        }
+
+class ContextBuilder:
+    """Packs retrieved chunks into a token budget for the generation prompt
+
+    Adjacent/overlapping chunks of the same file are merged by chunk_index, near-duplicate
+    passages are dropped with MMR over hashed term vectors, and the last passage that does
+    not fit is trimmed at a sentence boundary. An optional compress step (ContextCompressor)
+    runs on the selected passages, so it sees merged, deduplicated text and fills the same budget.
+    """
+
+    def __init__(
+        self,
+        token_budget: int = 2000,
+        chars_per_token: float = 4.0,
+        mmr_lambda: float = 0.7,
+        duplicate_threshold: float = 0.9,
+        min_passage_tokens: int = 40,
+        hash_features: int = 4096
+    ):
+        self.token_budget = token_budget
+        self.chars_per_token = chars_per_token
+        self.mmr_lambda = mmr_lambda
+        self.duplicate_threshold = duplicate_threshold
+        self.min_passage_tokens = min_passage_tokens
+        self.hash_features = hash_features
+
+    def estimate_tokens(self, text: str) -> int:
+        """Character-based estimate; close enough for budgeting without a tokenizer"""
+        return math.ceil(len(text) / self.chars_per_token)
+
+    def build(
+        self,
+        results: List[SearchResult],
+        compress: Optional[Callable[[List[ContextPassage], int], List[ContextPassage]]] = None
+    ) -> PackedContext:
+        """Pack results into the budget; compress(passages, token_budget) may shorten the selected passages"""
+        passages = self.merge_adjacent(results)
+        ordered, dropped = self.select_mmr(passages)
+        if compress is not None and ordered:
+            headers = sum(self.estimate_tokens(f"[{i + 1}] {p.label()}\n") for i, p in enumerate(ordered))
+            ordered = compress(ordered, max(self.token_budget - headers, 0))
+
+        packed, parts, used = [], [], 0
+        for passage in ordered:
+            header = f"[{len(packed) + 1}] {passage.label()}\n"
+            remaining = self.token_budget - used - self.estimate_tokens(header)
+            if remaining < self.min_passage_tokens:
+                break
+            text = passage.text
+            if self.estimate_tokens(text) > remaining:
+                text = self.trim_to_sentences(text, remaining)
+                if not text:
+                    continue
+            passage.text = text
+            packed.append(passage)
+            parts.append(header + text)
+            used += self.estimate_tokens(header + text)
+
+        return PackedContext(passages=packed, text="\n\n".join(parts), tokens=used, dropped_duplicates=dropped)
+
+    def merge_adjacent(self, results: List[SearchResult]) -> List[ContextPassage]:
+        """Join consecutive chunks of a file, removing the text they overlap on"""
+        by_file: Dict[str, List[SearchResult]] = {}
+        for result in results:
+            by_file.setdefault(result.file_id, []).append(result)
+
+        passages = []
+        for file_id, file_results in by_file.items():
+            indexed = sorted((r for r in file_results if r.chunk_index is not None), key=lambda r: r.chunk_index)
+            unindexed = [r for r in file_results if r.chunk_index is None]
+
+            run: List[SearchResult] = []
+            for result in indexed:
+                if run and result.chunk_index == run[-1].chunk_index:
+                    continue
+                if run and result.chunk_index != run[-1].chunk_index + 1:
+                    passages.append(self._passage(run))
+                    run = []
+                run.append(result)
+            if run:
+                passages.append(self._passage(run))
+            passages.extend(self._passage([r]) for r in unindexed)
+        return passages
+
+    def _passage(self, run: List[SearchResult]) -> ContextPassage:
+        text = run[0].content
+        for result in run[1:]:
+            text = self._join_overlapping(text, result.content, result.metadata.get("overlap", 0))
+        first = run[0]
+        return ContextPassage(
+            file_id=first.file_id,
+            document_id=first.document_id,
+            title=first.metadata.get("title", first.file_id),
+            chunk_indices=[r.chunk_index for r in run if r.chunk_index is not None],
+            text=text.strip(),
+            score=max(r.hybrid_score for r in run),
+            chunk_ids=[r.chunk_id for r in run]
+        )
+
+    @staticmethod
+    def _join_overlapping(left: str, right: str, overlap: int) -> str:
+        if overlap and left[-overlap:] == right[:overlap]:
+            return left + right[overlap:]
+        # Unknown overlap: find the longest prefix of right that ends left
+        for size in range(min(len(left), len(right), 2 * overlap or 1000), 20, -1):
+            if left.endswith(right[:size]):
+                return left + right[size:]
+        return left + "\n" + right
+
+    def _term_vectors(self, texts: List[str]) -> np.ndarray:
+        """L2-normalized hashed term-frequency vectors, one row per text"""
+        matrix = np.zeros((len(texts), self.hash_features), dtype=np.float32)
+        for row, text in enumerate(texts):
+            words = _WORD.findall(text.lower())
+            if not words:
+                continue
+            hashes = [int.from_bytes(hashlib.blake2b(w.encode("utf-8"), digest_size=4).digest(), "little") for w in words]
+            np.add.at(matrix[row], np.asarray(hashes) % self.hash_features, 1.0)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        return matrix / np.maximum(norms, 1e-12)
+
+    def select_mmr(self, passages: List[ContextPassage]):
+        """Order passages by maximal marginal relevance, dropping near-duplicates"""
+        if len(passages) <= 1:
+            return passages, 0
+        vectors = self._term_vectors([p.text for p in passages])
+        similarity = vectors @ vectors.T
+        scores = np.array([p.score for p in passages], dtype=np.float32)
+        spread = scores.max() - scores.min()
+        relevance = (scores - scores.min()) / spread if spread > 0 else np.ones_like(scores)
+
+        remaining = np.ones(len(passages), dtype=bool)
+        max_similarity = np.zeros(len(passages), dtype=np.float32)
+        order, dropped = [], 0
+        while remaining.any():
+            mmr = self.mmr_lambda * relevance - (1 - self.mmr_lambda) * max_similarity
+            mmr[~remaining] = -np.inf
+            best = int(np.argmax(mmr))
+            remaining[best] = False
+            order.append(passages[best])
+            max_similarity = np.maximum(max_similarity, similarity[best])
+            duplicates = remaining & (similarity[best] >= self.duplicate_threshold)
+            dropped += int(duplicates.sum())
+            remaining &= ~duplicates
+        return order, dropped
+
+    def trim_to_sentences(self, text: str, max_tokens: int) -> str:
+        """Longest prefix of whole sentences within max_tokens"""
+        max_chars = int(max_tokens * self.chars_per_token)
+        kept, length = [], 0
+        for sentence in _SENTENCE_END.split(text):
+            if length + len(sentence) + 1 > max_chars:
+                break
+            kept.append(sentence)
+            length += len(sentence) + 1
+        return " ".join(kept)
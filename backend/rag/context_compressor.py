@@ -0,0 +1,114 @@
+import re
+from dataclasses import replace
+from typing import List, Dict, Any, Tuple
+
+import numpy as np
+
+from context_builder import ContextPassage
+
+_SENTENCE = re.compile(r"[^.!?\n]+(?:[.!?]+|\n|$)")
+_WORD = re.compile(r"\w+")
+_ELLIPSIS = " ... "
+_STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "can", "do", "does", "for", "from", "how", "i",
+    "in", "is", "it", "me", "of", "on", "or", "please", "tell", "that", "the", "this", "to", "was",
+    "what", "when", "where", "which", "who", "why", "with", "you", "about", "explain", "describe"
+}
+
+class ContextCompressor:
+    """Extractive compression: keep only the sentences of the selected passages that match the question
+
+    ContextBuilder calls compress() after merging overlapping chunks and dropping near-duplicates
+    with MMR. Every sentence of every passage is scored in one pass with BM25 over the query
+    terms (sentences as documents) plus a prior from the passage's retrieval score. The best
+    sentences are kept up to the builder's token budget, in their original order. No extra
+    API calls are made.
+    """
+
+    def __init__(
+        self,
+        chars_per_token: float = 4.0,
+        min_sentence_chars: int = 20,
+        chunk_weight: float = 0.3,
+        k1: float = 1.2,
+        b: float = 0.75
+    ):
+        self.chars_per_token = chars_per_token
+        self.min_sentence_chars = min_sentence_chars
+        self.chunk_weight = chunk_weight
+        self.k1 = k1
+        self.b = b
+
+    @staticmethod
+    def query_terms(query: str) -> List[str]:
+        terms = [w for w in _WORD.findall(query.lower()) if w not in _STOPWORDS]
+        return list(dict.fromkeys(terms))
+
+    def split_sentences(self, texts: List[str]) -> List[Tuple[int, str]]:
+        """(text position, sentence) for every sentence long enough to keep"""
+        sentences = []
+        for position, text in enumerate(texts):
+            for match in _SENTENCE.finditer(text):
+                sentence = match.group().strip()
+                if len(sentence) >= self.min_sentence_chars:
+                    sentences.append((position, sentence))
+        return sentences
+
+    def score_sentences(self, query: str, sentences: List[str], priors: np.ndarray) -> np.ndarray:
+        """BM25 of each sentence against the query terms, all sentences at once"""
+        terms = self.query_terms(query)
+        if not terms or not sentences:
+            return priors * self.chunk_weight
+        vocabulary = {term: column for column, term in enumerate(terms)}
+
+        counts = np.zeros((len(sentences), len(terms)), dtype=np.float32)
+        lengths = np.zeros(len(sentences), dtype=np.float32)
+        for row, sentence in enumerate(sentences):
+            words = _WORD.findall(sentence.lower())
+            lengths[row] = len(words)
+            columns = [vocabulary[w] for w in words if w in vocabulary]
+            if columns:
+                counts[row] = np.bincount(columns, minlength=len(terms))
+
+        document_freq = (counts > 0).sum(axis=0)
+        idf = np.log(1 + (len(sentences) - document_freq + 0.5) / (document_freq + 0.5))
+        norm = self.k1 * (1 - self.b + self.b * lengths / max(lengths.mean(), 1.0))
+        bm25 = (counts * (self.k1 + 1) / (counts + norm[:, None]) * idf).sum(axis=1)
+        if bm25.max() > 0:
+            bm25 = bm25 / bm25.max()
+        return bm25 + self.chunk_weight * priors
+
+    def compress(self, query: str, passages: List[ContextPassage], token_budget: int) -> List[ContextPassage]:
+        """Passages, in the given order, reduced to their kept sentences; passages with none are dropped"""
+        sentences = self.split_sentences([p.text for p in passages])
+        if not sentences:
+            return passages
+
+        positions = np.array([s[0] for s in sentences])
+        passage_scores = np.array([p.score for p in passages], dtype=np.float32)
+        spread = passage_scores.max() - passage_scores.min()
+        priors = (passage_scores - passage_scores.min()) / spread if spread > 0 else np.ones_like(passage_scores)
+        scores = self.score_sentences(query, [s[1] for s in sentences], priors[positions])
+
+        budget_chars = token_budget * self.chars_per_token
+        kept, used = [], 0
+        for index in np.argsort(-scores, kind="stable"):
+            length = len(sentences[index][1]) + len(_ELLIPSIS)
+            if used + length > budget_chars:
+                continue
+            kept.append(int(index))
+            used += length
+
+        by_passage: Dict[int, List[str]] = {}
+        for index in sorted(kept):
+            by_passage.setdefault(sentences[index][0], []).append(sentences[index][1])
+        return [
+            replace(passage, text=_ELLIPSIS.join(by_passage[position]))
+            for position, passage in enumerate(passages) if position in by_passage
+        ]
+
+    @staticmethod
+    def stats(original: List[ContextPassage], compressed: List[ContextPassage]) -> Dict[str, Any]:
+        before = sum(len(p.text) for p in original)
+        after = sum(len(p.text) for p in compressed)
+        return {"chars_before": before, "chars_after": after, "ratio": round(after / before, 3) if before else 1.0}
@@ -0,0 +1,205 @@
+import numpy as np
+from typing import List, Dict, Any, Optional, Tuple
+
+# Number of set bits for every byte value, used for Hamming distance on packed codes
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+class DenseIndex:
+    """In-memory dense index with an optional reduced first pass and full-precision rerank
+
+    Append-only: the vector store keeps its rows in SegmentedIndex, which handles deletes with
+    tombstones and uses an empty DenseIndex as the codec for dense config and PCA projection.
+    """
+
+    QUANTIZATIONS = ("truncate", "pca", "binary")
+
+    def __init__(
+        self,
+        dimension: int = 768,
+        reduced_dim: int = 128,
+        quantization: str = "truncate",
+        candidate_multiplier: int = 20
+    ):
+        if quantization not in self.QUANTIZATIONS:
+            raise ValueError(f"Unknown quantization '{quantization}', expected one of {self.QUANTIZATIONS}")
+
+        self.dimension = dimension
+        self.reduced_dim = min(reduced_dim, dimension)
+        self.quantization = quantization
+        self.candidate_multiplier = candidate_multiplier
+
+        # Full-precision, L2-normalized vectors (one row per chunk)
+        self.vectors = np.zeros((0, dimension), dtype=np.float32)
+        self.ids: List[str] = []
+        self.records: List[Dict[str, Any]] = []
+
+        # Reduced copy used for the coarse candidate pass
+        self.pca_mean = None
+        self.pca_components = None
+        self.reduced = self._reduce(self.vectors)
+
+        # Filter columns, rebuilt lazily as object arrays for vectorized masks
+        self._columns: Dict[str, np.ndarray] = {}
+
+    def config(self) -> Dict[str, Any]:
+        """Settings needed to interpret the reduced copy"""
+        return {"dimension": self.dimension, "reduced_dim": self.reduced_dim, "quantization": self.quantization}
+
+    def prepare_rows(self, vectors: List[List[float]]) -> Tuple[np.ndarray, np.ndarray]:
+        """Normalized full-precision rows and their reduced encoding, without adding them"""
+        matrix = self._normalize(np.asarray(vectors, dtype=np.float32).reshape(len(vectors), -1))
+        return matrix, self._reduce(matrix)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def add(self, ids: List[str], vectors: List[List[float]], records: List[Dict[str, Any]]):
+        """Append rows to the index and extend the reduced copy"""
+        if not ids:
+            return
+        matrix = self._normalize(np.asarray(vectors, dtype=np.float32).reshape(len(ids), -1))
+        if matrix.shape[1] != self.dimension:
+            raise ValueError(f"Expected {self.dimension}-dim vectors, got {matrix.shape[1]}")
+
+        start = len(self.ids)
+        self.vectors = np.vstack([self.vectors, matrix])
+        self.ids.extend(ids)
+        self.records.extend(records)
+        self._columns = {}
+
+        # PCA is fitted once on the initial load; later appends reuse the projection
+        if start == 0 or (self.quantization == "pca" and self.pca_components is None):
+            self.build_reduced()
+        else:
+            self.reduced = np.concatenate([self.reduced, self._reduce(matrix)])
+
+    def build_reduced(self, sample_size: int = 10000):
+        """(Re)build the reduced copy of the corpus used for candidate selection"""
+        self.fit_reduction(self.vectors, sample_size)
+        self.reduced = self._reduce(self.vectors)
+
+    def fit_reduction(self, matrix: np.ndarray, sample_size: int = 10000):
+        """Fit the PCA projection on normalized rows (no-op for other quantizations or too few rows)"""
+        if self.quantization == "pca" and len(matrix) >= self.reduced_dim:
+            sample = matrix
+            if len(sample) > sample_size:
+                rows = np.random.default_rng(0).choice(len(sample), sample_size, replace=False)
+                sample = sample[rows]
+            self.pca_mean = sample.mean(axis=0)
+            _, _, vt = np.linalg.svd(sample - self.pca_mean, full_matrices=False)
+            self.pca_components = vt[:self.reduced_dim].T.astype(np.float32)
+
+    def _normalize(self, matrix: np.ndarray) -> np.ndarray:
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return matrix / norms
+
+    def _reduce(self, matrix: np.ndarray) -> np.ndarray:
+        """Project full vectors into the reduced representation"""
+        if self.quantization == "binary":
+            return np.packbits(matrix > 0, axis=1)
+        if self.quantization == "pca" and self.pca_components is not None:
+            reduced = (matrix - self.pca_mean) @ self.pca_components
+        else:
+            reduced = matrix[:, :self.reduced_dim]
+        return self._normalize(np.ascontiguousarray(reduced, dtype=np.float32))
+
+    def filter_rows(
+        self,
+        class_name: Optional[str] = None,
+        subject_name: Optional[str] = None,
+        allowed_file_ids: Optional[List[str]] = None,
+        user_id: Optional[str] = None
+    ) -> Optional[np.ndarray]:
+        """Return row indices matching the filters, or None when unfiltered"""
+        filters = {"user_id": user_id, "class_name": class_name, "subject_name": subject_name}
+        mask = None
+        for column, value in filters.items():
+            if value:
+                column_mask = self._column(column) == value
+                mask = column_mask if mask is None else mask & column_mask
+        if allowed_file_ids:
+            file_mask = np.isin(self._column("file_id"), list(allowed_file_ids))
+            mask = file_mask if mask is None else mask & file_mask
+        return None if mask is None else np.flatnonzero(mask)
+
+    def _column(self, name: str) -> np.ndarray:
+        if name not in self._columns:
+            self._columns[name] = np.array([r.get(name) for r in self.records], dtype=object)
+        return self._columns[name]
+
+    def encode_query(self, query_vector: List[float]) -> Tuple[np.ndarray, np.ndarray]:
+        """Normalized full-precision query and its reduced encoding"""
+        query = self._normalize(np.asarray(query_vector, dtype=np.float32).reshape(1, -1))
+        return query[0], self._reduce(query)[0]
+
+    def score_codes(self, codes: np.ndarray, reduced_query: np.ndarray) -> np.ndarray:
+        """Approximate scores of reduced rows against a reduced query (higher is better)"""
+        if self.quantization == "binary":
+            xor = np.bitwise_xor(codes, reduced_query)
+            bits = np.bitwise_count(xor) if hasattr(np, "bitwise_count") else _POPCOUNT[xor]
+            distances = bits.sum(axis=1, dtype=np.int32)
+            return -distances.astype(np.float32)
+        return codes @ reduced_query
+
+    def exact_scores(self, query_vector: List[float], rows: Optional[np.ndarray] = None) -> np.ndarray:
+        """Full-precision cosine scores for the given rows (all rows when None)"""
+        query = self._normalize(np.asarray(query_vector, dtype=np.float32).reshape(1, -1))[0]
+        matrix = self.vectors if rows is None else self.vectors[rows]
+        return matrix @ query
+
+    def coarse_scores(self, query_vector: List[float], rows: Optional[np.ndarray] = None) -> np.ndarray:
+        """Approximate scores from the reduced copy (higher is better)"""
+        _, reduced_query = self.encode_query(query_vector)
+        codes = self.reduced if rows is None else self.reduced[rows]
+        return self.score_codes(codes, reduced_query)
+
+    def search(
+        self,
+        query_vector: List[float],
+        top_k: int,
+        rows: Optional[np.ndarray] = None,
+        two_stage: bool = True,
+        candidate_multiplier: Optional[int] = None
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Return (row indices, full-precision scores) of the best top_k rows"""
+        return two_stage_search(self, query_vector, top_k, rows, two_stage, candidate_multiplier)
+
+    def memory_usage(self) -> Dict[str, int]:
+        """Bytes held by the full and reduced vector copies"""
+        return {
+            "full_bytes": int(self.vectors.nbytes),
+            "reduced_bytes": int(self.reduced.nbytes)
+        }
+
+def two_stage_search(
+    index,
+    query_vector: List[float],
+    top_k: int,
+    rows: Optional[np.ndarray] = None,
+    two_stage: bool = True,
+    candidate_multiplier: Optional[int] = None
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Top rows of any index with len(), coarse_scores() and exact_scores(): reduced candidates, exact rerank"""
+    total = len(index) if rows is None else len(rows)
+    if total == 0 or top_k <= 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+
+    multiplier = candidate_multiplier or index.candidate_multiplier
+    candidates_count = top_k * multiplier
+    all_rows = np.arange(len(index)) if rows is None else np.asarray(rows)
+
+    if two_stage and candidates_count < total:
+        # Stage 1: pick candidates from the reduced copy
+        coarse = index.coarse_scores(query_vector, rows)
+        candidates = all_rows[np.argpartition(-coarse, candidates_count - 1)[:candidates_count]]
+        # Stage 2: rescore candidates with full-precision vectors
+        scores = index.exact_scores(query_vector, candidates)
+    else:
+        candidates = all_rows
+        scores = index.exact_scores(query_vector, rows)
+
+    keep = min(top_k, len(candidates))
+    best = np.argpartition(-scores, keep - 1)[:keep]
+    best = best[np.argsort(-scores[best])]
+    return candidates[best], scores[best]
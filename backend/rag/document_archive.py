@@ -0,0 +1,131 @@
+import os
+import gzip
+import json
+import hashlib
+import tempfile
+from datetime import datetime
+from typing import List, Dict, Any, Optional
+
+def source_hash(file_content: bytes) -> str:
+    """Archive key of a PDF: SHA-256 of its bytes"""
+    return hashlib.sha256(file_content).hexdigest()
+
+class DocumentArchive:
+    """Content-addressed archive of uploaded PDFs and their parsed elements
+
+    Each PDF is kept once under pdfs/<sha256>.pdf.gz and its Unstructured element stream
+    under parsed/<sha256>.json.gz, both gzip-compressed. Chunks record the hash in
+    metadata["source_sha256"], so re-chunking or re-embedding (reindex_archive.py) starts
+    from the parsed text instead of re-collecting and re-parsing every PDF, and a PDF
+    uploaded again is not parsed twice.
+    """
+
+    name = "base"
+
+    def _put(self, key: str, data: bytes):
+        raise NotImplementedError
+
+    def _get(self, key: str) -> Optional[bytes]:
+        raise NotImplementedError
+
+    def _exists(self, key: str) -> bool:
+        raise NotImplementedError
+
+    @staticmethod
+    def _pdf_key(source: str) -> str:
+        return f"pdfs/{source}.pdf.gz"
+
+    @staticmethod
+    def _parsed_key(source: str) -> str:
+        return f"parsed/{source}.json.gz"
+
+    def put_document(self, source: str, file_content: bytes, elements: List[Dict[str, Any]]):
+        """Archive a PDF and its parsed elements (the PDF is skipped if already present)"""
+        if not self._exists(self._pdf_key(source)):
+            self._put(self._pdf_key(source), gzip.compress(file_content, compresslevel=6))
+        parsed = {
+            "source_sha256": source,
+            "parser": "unstructured",
+            "parsed_at": datetime.utcnow().isoformat(),
+            "elements": elements
+        }
+        self._put(self._parsed_key(source), gzip.compress(json.dumps(parsed).encode("utf-8"), compresslevel=6))
+
+    def get_elements(self, source: str) -> Optional[List[Dict[str, Any]]]:
+        """Parsed elements of an archived PDF, or None"""
+        data = self._get(self._parsed_key(source))
+        return json.loads(gzip.decompress(data))["elements"] if data is not None else None
+
+    def get_pdf(self, source: str) -> Optional[bytes]:
+        """Original bytes of an archived PDF, or None"""
+        data = self._get(self._pdf_key(source))
+        return gzip.decompress(data) if data is not None else None
+
+class LocalArchive(DocumentArchive):
+    """Archive in a local directory (stand-in for the bucket in development and SQLite deployments)"""
+
+    name = "local"
+
+    def __init__(self, directory: str = "document_archive"):
+        self.directory = directory
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, *key.split("/"))
+
+    def _put(self, key: str, data: bytes):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Written to a temporary file and renamed, so readers never see a partial object
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(temp_path, path)
+        except Exception:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+    def _get(self, key: str) -> Optional[bytes]:
+        try:
+            with open(self._path(key), "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def _exists(self, key: str) -> bool:
+        return os.path.exists(self._path(key))
+
+class BucketArchive(DocumentArchive):
+    """Archive in the Firebase Storage bucket returned by initialize_services()"""
+
+    name = "bucket"
+
+    def __init__(self, bucket, prefix: str = "archive/"):
+        self.bucket = bucket
+        self.prefix = prefix
+
+    def _put(self, key: str, data: bytes):
+        self.bucket.blob(self.prefix + key).upload_from_string(data, content_type="application/gzip")
+
+    def _get(self, key: str) -> Optional[bytes]:
+        blob = self.bucket.blob(self.prefix + key)
+        if not blob.exists():
+            return None
+        return blob.download_as_bytes()
+
+    def _exists(self, key: str) -> bool:
+        return self.bucket.blob(self.prefix + key).exists()
+
+def create_document_archive(bucket=None) -> Optional[DocumentArchive]:
+    """Archive selected by RAG_ARCHIVE: auto (the bucket when there is one, else a local directory), bucket, local or off"""
+    mode = os.environ.get("RAG_ARCHIVE", "auto").lower()
+    if mode in ("off", "0", "none"):
+        return None
+    if mode == "bucket" or (mode == "auto" and bucket is not None):
+        if bucket is None:
+            raise ValueError("RAG_ARCHIVE=bucket needs the Firestore storage backend and FIREBASE_STORAGE_BUCKET")
+        return BucketArchive(bucket, os.environ.get("RAG_ARCHIVE_PREFIX", "archive/"))
+    if mode in ("auto", "local"):
+        return LocalArchive(os.environ.get("RAG_ARCHIVE_DIR", "document_archive"))
+    raise ValueError(f"Unknown archive '{mode}', expected 'auto', 'bucket', 'local' or 'off'")
@@ -1,42 +1,122 @@
 import os
-from typing import List, Dict, Any
+import re
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import List, Dict, Any, Optional, Tuple, Union
 from models import DocumentChunk
+from document_archive import source_hash
 import uuid
 from datetime import datetime
-from unstructured.partition.auto import partition
-from unstructured.documents.elements import Text
+
+_SENTENCE = re.compile(r"[^.!?]+(?:[.!?]+|$)\s*")
+
+def chunk_id_for(file_id: str, kind: str, index: int) -> str:
+    """Stable chunk id, so re-chunking a file (e.g. a resumed ingestion) reproduces the same ids"""
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, f"{file_id}/{kind}/{index}"))
+
+def extract_pdf_elements(file_content: bytes) -> List[Dict[str, Any]]:
+    """Parse a PDF with Unstructured.io into text elements (module-level so it can run in a worker process)
+
+    Each element is {"type", "text", "page"}; this is the stream kept in the document archive.
+    """
+    # Imported on first parse: unstructured takes seconds to import and only ingestion needs it
+    from unstructured.partition.auto import partition
+    from unstructured.documents.elements import Text
+    
+    # Write temporary file for unstructured to process
+    temp_file = f"temp_{uuid.uuid4()}.pdf"
+    
+    try:
+        with open(temp_file, 'wb') as f:
+            f.write(file_content)
+        
+        # Process with unstructured
+        elements = partition(temp_file)
+        
+        # Keep the text elements with their category and page
+        return [
+            {
+                "type": getattr(element, "category", type(element).__name__),
+                "text": str(element),
+                "page": getattr(getattr(element, "metadata", None), "page_number", None)
+            }
+            for element in elements
+            if isinstance(element, Text)
+        ]
+        
+    finally:
+        # Clean up temporary file
+        if os.path.exists(temp_file):
+            os.remove(temp_file)
+
+def elements_text(elements: List[Dict[str, Any]]) -> str:
+    """Document text from parsed elements"""
+    return "\n".join(element["text"] for element in elements)
+
+def extract_pdf_text(file_content: bytes) -> str:
+    """Parse a PDF with Unstructured.io and return its text"""
+    return elements_text(extract_pdf_elements(file_content))
 
 class DocumentProcessor:
     """Document processor using Unstructured.io for PDF parsing"""
     
-    def __init__(self, project_id: str):
+    def __init__(
+        self,
+        project_id: str,
+        hierarchical: Optional[bool] = None,
+        child_chars: Optional[int] = None,
+        archive=None
+    ):
         self.project_id = project_id
+        
+        # Optional DocumentArchive: original PDFs and parsed elements are kept for re-indexing
+        self.archive = archive
+        
+        # Hierarchical mode indexes small child passages and keeps the 3000-char chunks as parents
+        if hierarchical is None:
+            hierarchical = os.environ.get("RAG_HIERARCHICAL", "0") == "1"
+        self.hierarchical = hierarchical
+        self.child_chars = child_chars or int(os.environ.get("RAG_CHILD_CHARS", "500"))
+        
+        # Batch uploads parse PDFs in parallel worker processes (created on first use)
+        self.parse_processes = int(os.environ.get("RAG_PARSE_PROCESSES", str(min(4, os.cpu_count() or 1))))
+        self._parse_pool = None
+        self._parse_pool_lock = threading.Lock()
     
     def process_pdf_with_unstructured(self, file_content: bytes) -> str:
         """Process PDF using Unstructured.io"""
-        # Write temporary file for unstructured to process
-        temp_file = f"temp_{uuid.uuid4()}.pdf"
-        
+        return extract_pdf_text(file_content)
+    
+    def _archived_elements(self, source: Optional[str]) -> Optional[List[Dict[str, Any]]]:
+        """Parsed elements of a PDF archived earlier (same bytes), so it is not parsed again"""
+        if source is None:
+            return None
         try:
-            with open(temp_file, 'wb') as f:
-                f.write(file_content)
-            
-            # Process with unstructured
-            elements = partition(temp_file)
-            
-            # Extract text from elements
-            text_parts = []
-            for element in elements:
-                if isinstance(element, Text):
-                    text_parts.append(str(element))
-            
-            full_text = "\n".join(text_parts)
-            return full_text
-            
-        finally:
-            # Clean up temporary file
-            if os.path.exists(temp_file):
-                os.remove(temp_file)
+            return self.archive.get_elements(source)
+        except Exception as e:
+            print(f"⚠️ Could not read archived parse {source[:12]}: {e}")
+            return None
+    
+    def _archive(self, source: Optional[str], file_content: bytes, elements: List[Dict[str, Any]]):
+        # Archiving is best effort: a failed archive write never fails the upload
+        if source is None:
+            return
+        try:
+            self.archive.put_document(source, file_content, elements)
+        except Exception as e:
+            print(f"⚠️ Could not archive PDF {source[:12]}: {e}")
+    
+    def _get_parse_pool(self) -> ProcessPoolExecutor:
+        # Spawned (not forked) workers: the server process holds gRPC threads that must not be forked
+        with self._parse_pool_lock:
+            if self._parse_pool is None:
+                self._parse_pool = ProcessPoolExecutor(
+                    max_workers=self.parse_processes,
+                    mp_context=multiprocessing.get_context("spawn")
+                )
+            return self._parse_pool
     
     def create_chunks_with_overlap(
         self, 
@@ -65,30 +145,190 @@ class DocumentProcessor:
         
         return chunks
     
+    def create_child_spans(self, text: str, target_chars: int = 500) -> List[Tuple[int, int]]:
+        """Sentence groups of roughly target_chars, as (start, end) offsets into text"""
+        spans = []
+        start = end = 0
+        for match in _SENTENCE.finditer(text):
+            if end - start >= target_chars:
+                spans.append((start, end))
+                start = match.start()
+            end = match.end()
+        if text[start:end].strip():
+            spans.append((start, end))
+        return [(a, b) for a, b in spans if text[a:b].strip()]
+    
+    def create_parent_child_chunks(
+        self,
+        parent_texts: List[str],
+        document_id: str,
+        class_name: str,
+        subject_name: str,
+        file_id: str,
+        base_metadata: Dict[str, Any],
+        overlap: int = 300
+    ) -> Tuple[List[DocumentChunk], List[DocumentChunk]]:
+        """Parent chunks (stored, not embedded) and child passages (embedded) linked by parent_id"""
+        parents, children = [], []
+        for parent_index, parent_text in enumerate(parent_texts):
+            parent_id = chunk_id_for(file_id, "parent", parent_index)
+            # Skip the overlap already covered by the previous parent's children
+            lead = overlap if parent_index > 0 else 0
+            spans = [(a + lead, b + lead) for a, b in self.create_child_spans(parent_text[lead:], self.child_chars)]
+            
+            for start, end in spans:
+                children.append(DocumentChunk(
+                    id=chunk_id_for(file_id, "child", len(children)),
+                    document_id=document_id,
+                    content=parent_text[start:end].strip(),
+                    chunk_index=len(children),
+                    class_name=class_name,
+                    subject_name=subject_name,
+                    file_id=file_id,
+                    metadata={
+                        **base_metadata,
+                        "passage_type": "child",
+                        "parent_id": parent_id,
+                        "parent_index": parent_index,
+                        "parent_start": start,
+                        "parent_end": end
+                    }
+                ))
+            
+            parents.append(DocumentChunk(
+                id=parent_id,
+                document_id=document_id,
+                content=parent_text,
+                chunk_index=parent_index,
+                class_name=class_name,
+                subject_name=subject_name,
+                file_id=file_id,
+                metadata={**base_metadata, "passage_type": "parent", "child_count": len(spans)}
+            ))
+        
+        for child in children:
+            child.metadata["total_chunks"] = len(children)
+        return parents, children
+    
     def process_pdf_file(
         self,
         file_content: bytes,
         title: str,
         class_name: str,
         subject_name: str,
-        user_id: str = "default"
+        user_id: str = "default",
+        file_id: Optional[str] = None,
+        document_id: Optional[str] = None
     ) -> Dict[str, Any]:
         """Process a PDF file and return chunks"""
-        # Generate file ID
-        file_id = str(uuid.uuid4())
-        document_id = str(uuid.uuid4())
+        # Generate file ID (ingestion jobs pass theirs so a resumed job keeps the same IDs)
+        file_id = file_id or str(uuid.uuid4())
+        document_id = document_id or str(uuid.uuid4())
         
-        # Process with Unstructured.io
-        full_text = self.process_pdf_with_unstructured(file_content)
+        # Process with Unstructured.io, unless this exact PDF was parsed and archived before
+        source = source_hash(file_content) if self.archive is not None else None
+        elements = self._archived_elements(source)
+        if elements is None:
+            elements = extract_pdf_elements(file_content)
+            self._archive(source, file_content, elements)
+        
+        return self.chunk_document(
+            elements_text(elements), title, class_name, subject_name, user_id, file_id, document_id,
+            source_sha256=source
+        )
+    
+    def process_pdf_files(
+        self,
+        files: List[Dict[str, Any]],
+        class_name: str,
+        subject_name: str,
+        user_id: str = "default"
+    ) -> List[Union[Dict[str, Any], Exception]]:
+        """Parse several PDFs across the process pool; one result (or the exception) per file
+
+        Each file is a dict with file_content, title and optional file_id/document_id.
+        """
+        sources = [source_hash(f["file_content"]) if self.archive is not None else None for f in files]
+        archived = [self._archived_elements(source) for source in sources]
+        pool = self._get_parse_pool() if any(elements is None for elements in archived) else None
+        futures = [
+            pool.submit(extract_pdf_elements, f["file_content"]) if elements is None else None
+            for f, elements in zip(files, archived)
+        ]
         
+        results = []
+        for f, source, elements, future in zip(files, sources, archived, futures):
+            try:
+                if elements is None:
+                    elements = future.result()
+                    self._archive(source, f["file_content"], elements)
+                results.append(self.chunk_document(
+                    elements_text(elements), f["title"], class_name, subject_name, user_id,
+                    f.get("file_id") or str(uuid.uuid4()), f.get("document_id") or str(uuid.uuid4()),
+                    source_sha256=source
+                ))
+            except BrokenProcessPool as e:
+                # A crashed worker breaks the whole pool; start a fresh one for the next batch
+                with self._parse_pool_lock:
+                    if self._parse_pool is pool:
+                        self._parse_pool = None
+                print(f"❌ Error parsing {f['title']}: {e}")
+                results.append(e)
+            except Exception as e:
+                print(f"❌ Error parsing {f['title']}: {e}")
+                results.append(e)
+        return results
+    
+    def chunk_document(
+        self,
+        full_text: str,
+        title: str,
+        class_name: str,
+        subject_name: str,
+        user_id: str,
+        file_id: str,
+        document_id: str,
+        source_sha256: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """Split extracted text into chunks (or parent/child passages) ready to store
+
+        source_sha256 is the archive key of the PDF the text came from, kept in chunk metadata.
+        """
         # Create chunks with overlap
         text_chunks = self.create_chunks_with_overlap(full_text, 3000, 300)
+        source = {"source_sha256": source_sha256} if source_sha256 else {}
+        
+        if self.hierarchical:
+            parents, chunks = self.create_parent_child_chunks(
+                text_chunks, document_id, class_name, subject_name, file_id,
+                base_metadata={
+                    "title": title,
+                    "user_id": user_id,
+                    "total_parents": len(text_chunks),
+                    "chunk_size": 3000,
+                    "overlap": 300,
+                    "processor": "unstructured",
+                    "mime_type": "application/pdf",
+                    **source
+                }
+            )
+            return {
+                "file_id": file_id,
+                "document_id": document_id,
+                "title": title,
+                "class_name": class_name,
+                "subject_name": subject_name,
+                "chunks": chunks,
+                "parents": parents,
+                "total_chunks": len(chunks),
+                "total_text_length": len(full_text)
+            }
         
         # Create DocumentChunk objects
         chunks = []
         for i, chunk_text in enumerate(text_chunks):
             chunk = DocumentChunk(
-                id=str(uuid.uuid4()),
+                id=chunk_id_for(file_id, "chunk", i),
                 document_id=document_id,
                 content=chunk_text,
                 chunk_index=i,
@@ -102,7 +342,8 @@ class DocumentProcessor:
                     "chunk_size": 3000,
                     "overlap": 300,
                     "processor": "unstructured",
-                    "mime_type": "application/pdf"
+                    "mime_type": "application/pdf",
+                    **source
                 }
             )
             chunks.append(chunk)
@@ -114,6 +355,7 @@ class DocumentProcessor:
             "class_name": class_name,
             "subject_name": subject_name,
             "chunks": chunks,
+            "parents": [],
             "total_chunks": len(chunks),
             "total_text_length": len(full_text)
         }
@@ -0,0 +1,61 @@
+import time
+import random
+import threading
+from typing import List, Dict, Any, Union
+
+from synthetic_corpus import deterministic_embedding
+
+class FakeResponse:
+    def __init__(self, text: str):
+        self.text = text
+
+class FakeGemini:
+    """In-process stand-in for GeminiClient: deterministic embeddings and canned generations
+
+    Exposes the same embed_content / generate_content / stats surface as GeminiClient so it
+    can replace a vector store's embedding_client or a workflow's generation_client.
+    Latency per call is base_ms (+ per_item_ms per embedded text) plus uniform jitter.
+    """
+
+    def __init__(
+        self,
+        embed_latency_ms: float = 0.0,
+        embed_per_item_ms: float = 0.0,
+        generate_latency_ms: float = 0.0,
+        jitter_ms: float = 0.0,
+        dimension: int = 768,
+        seed: int = 0
+    ):
+        self.embed_latency_ms = embed_latency_ms
+        self.embed_per_item_ms = embed_per_item_ms
+        self.generate_latency_ms = generate_latency_ms
+        self.jitter_ms = jitter_ms
+        self.dimension = dimension
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.stats_data = {"embed_calls": 0, "embedded_texts": 0, "generate_calls": 0}
+
+    def _sleep(self, ms: float):
+        with self._lock:
+            ms += self._rng.uniform(0, self.jitter_ms) if self.jitter_ms else 0.0
+        if ms > 0:
+            time.sleep(ms / 1000)
+
+    def embed_content(self, model: str = "", content: Union[str, List[str]] = "", task_type: str = "", **kwargs) -> Dict[str, Any]:
+        texts = content if isinstance(content, list) else [content]
+        with self._lock:
+            self.stats_data["embed_calls"] += 1
+            self.stats_data["embedded_texts"] += len(texts)
+        self._sleep(self.embed_latency_ms + self.embed_per_item_ms * len(texts))
+        embeddings = [deterministic_embedding(text, self.dimension) for text in texts]
+        return {"embedding": embeddings if isinstance(content, list) else embeddings[0]}
+
+    def generate_content(self, model, prompt, *args, **kwargs) -> FakeResponse:
+        with self._lock:
+            self.stats_data["generate_calls"] += 1
+        self._sleep(self.generate_latency_ms)
+        return FakeResponse(f"Synthetic answer from a {len(str(prompt))}-character prompt.")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return dict(self.stats_data)
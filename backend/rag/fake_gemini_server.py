@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+"""
+Fake Gemini Server
+Local HTTP stand-in for the embedding API that enforces a request quota (429s),
+injects transient 503s and tail latency, plus a driver that measures throughput
+with and without GeminiClient rate limiting/retries (no cloud access needed)
+"""
+
+import json
+import time
+import random
+import argparse
+import threading
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+from gemini_client import GeminiClient, AdaptiveTokenBucket, GeminiError
+from synthetic_corpus import deterministic_embedding
+
+class FakeGeminiServer:
+    """Throttling embedding endpoint: POST /embed {"content": "..."} -> {"embedding": [...]}"""
+
+    def __init__(
+        self,
+        port: int = 0,
+        quota_rps: float = 20.0,
+        error_rate: float = 0.02,
+        latency_ms: float = 20.0,
+        tail_rate: float = 0.05,
+        tail_ms: float = 400.0,
+        dimension: int = 768
+    ):
+        self.quota = AdaptiveTokenBucket(quota_rps, quota_rps)
+        self.error_rate = error_rate
+        self.latency_ms = latency_ms
+        self.tail_rate = tail_rate
+        self.tail_ms = tail_ms
+        self.dimension = dimension
+        self.counts = {"ok": 0, "throttled": 0, "errors": 0}
+        self._lock = threading.Lock()
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", port), self._handler())
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}"
+
+    def _count(self, key: str):
+        with self._lock:
+            self.counts[key] += 1
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                if not server.quota.acquire(timeout=0):
+                    server._count("throttled")
+                    return self._reply(429, {"error": "RESOURCE_EXHAUSTED"})
+                delay = server.tail_ms if random.random() < server.tail_rate else server.latency_ms
+                time.sleep(delay / 1000)
+                if random.random() < server.error_rate:
+                    server._count("errors")
+                    return self._reply(503, {"error": "UNAVAILABLE"})
+                server._count("ok")
+                self._reply(200, {"embedding": deterministic_embedding(body.get("content", ""), server.dimension)})
+
+            def _reply(self, status: int, payload):
+                data = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    def start(self) -> "FakeGeminiServer":
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+
+def embed_via_http(url: str, content: str):
+    """Minimal embedding call against the fake server; HTTPError.code carries the status"""
+    request = urllib.request.Request(
+        f"{url}/embed", data=json.dumps({"content": content}).encode("utf-8"),
+        headers={"Content-Type": "application/json"}, method="POST"
+    )
+    with urllib.request.urlopen(request, timeout=10) as response:
+        return json.loads(response.read())
+
+def drive(url: str, requests_total: int, concurrency: int, client: GeminiClient = None):
+    """Send requests_total embeddings with `concurrency` workers; returns (latencies ms, failures, seconds)"""
+    latencies, failures = [], 0
+    lock = threading.Lock()
+
+    def one(i: int):
+        nonlocal failures
+        start = time.perf_counter()
+        try:
+            if client is None:
+                embed_via_http(url, f"chunk {i}")
+            else:
+                client.call(embed_via_http, url, f"chunk {i}", hedge=True)
+            with lock:
+                latencies.append((time.perf_counter() - start) * 1000)
+        except (GeminiError, OSError):
+            with lock:
+                failures += 1
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(one, range(requests_total)))
+    return latencies, failures, time.perf_counter() - start
+
+def main():
+    """Main function"""
+    parser = argparse.ArgumentParser(description="Throughput under throttling against a fake Gemini server")
+    parser.add_argument("--requests", type=int, default=400, help="Embedding calls per run")
+    parser.add_argument("--concurrency", type=int, default=16, help="Concurrent callers")
+    parser.add_argument("--quota-rps", type=float, default=40.0, help="Server-side quota")
+    parser.add_argument("--client-rps", type=float, default=40.0, help="GeminiClient token bucket rate")
+    parser.add_argument("--hedge-ms", type=float, default=150.0, help="Hedge delay (0 disables)")
+    args = parser.parse_args()
+
+    runs = [
+        ("naive", None),
+        ("client", GeminiClient("embed", requests_per_second=args.client_rps, base_delay=0.05, max_delay=1.0)),
+        ("client+hedge", GeminiClient(
+            "embed", requests_per_second=args.client_rps, base_delay=0.05, max_delay=1.0,
+            hedge_after=args.hedge_ms / 1000 if args.hedge_ms else None
+        ))
+    ]
+
+    print(f"{'run':<14}{'ok':>6}{'failed':>8}{'429s':>7}{'503s':>7}{'req/s':>8}{'p50 ms':>9}{'p99 ms':>9}")
+    for name, client in runs:
+        server = FakeGeminiServer(quota_rps=args.quota_rps).start()
+        try:
+            latencies, failures, seconds = drive(server.url, args.requests, args.concurrency, client)
+        finally:
+            server.stop()
+        p50, p99 = (np.percentile(latencies, [50, 99]) if latencies else (0.0, 0.0))
+        print(f"{name:<14}{len(latencies):>6}{failures:>8}{server.counts['throttled']:>7}"
+              f"{server.counts['errors']:>7}{len(latencies) / seconds:>8.1f}{p50:>9.1f}{p99:>9.1f}")
+        if client is not None:
+            print(f"{'':<14}{client.stats()}")
+
+if __name__ == "__main__":
+    main()
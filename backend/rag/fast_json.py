@@ -0,0 +1,49 @@
+import json
+import math
+from typing import Any
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Which encoder dumps() uses, reported by /health
+BACKEND = "orjson" if orjson is not None else "json"
+
+def _default(value: Any) -> Any:
+    """Fallback for values the stdlib encoder cannot handle (NumPy scalars and arrays)"""
+    if hasattr(value, "tolist"):
+        return value.tolist()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+def _finite(value: Any) -> Any:
+    """Copy of value with NaN and +/-Infinity replaced by None, as orjson writes them"""
+    if isinstance(value, float):
+        return value if math.isfinite(value) else None
+    if isinstance(value, dict):
+        return {key: _finite(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_finite(item) for item in value]
+    if hasattr(value, "tolist"):
+        return _finite(value.tolist())
+    return value
+
+def _stdlib_dumps(content: Any) -> bytes:
+    return json.dumps(
+        content, ensure_ascii=False, allow_nan=False, separators=(",", ":"), default=_default
+    ).encode("utf-8")
+
+def dumps(content: Any) -> bytes:
+    """Compact UTF-8 JSON for an API response; orjson when installed, else the stdlib encoder
+
+    Both write non-finite floats (e.g. a NaN score) as null.
+    """
+    if orjson is not None:
+        return orjson.dumps(content, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS)
+    try:
+        return _stdlib_dumps(content)
+    except ValueError as e:
+        if "Out of range float" not in str(e):
+            raise
+        # Rare, so the copy is only made once the fast path has failed
+        return _stdlib_dumps(_finite(content))
@@ -32,10 +32,13 @@ def initialize_services():
     db = firestore.client()
     bucket = storage.bucket()
 
-    # Configure Gemini API
+    initialize_gemini()
+
+    return db, bucket
+
+def initialize_gemini():
+    """Configures the Gemini API client (used on its own by the local storage backends)"""
     gemini_api_key = os.environ.get("GEMINI_API_KEY")
     if not gemini_api_key:
         raise ValueError("GEMINI_API_KEY not set in environment")
     genai.configure(api_key=gemini_api_key)
-
-    return db, bucket
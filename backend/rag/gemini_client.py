@@ -0,0 +1,283 @@
+import os
+import time
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Dict, Any, Optional, Callable
+
+# HTTP statuses worth retrying: rate limited or a transient server-side failure
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+class GeminiError(Exception):
+    """A Gemini call failed after retries"""
+
+class GeminiUnavailableError(GeminiError):
+    """The circuit breaker is open; calls are rejected without reaching Gemini"""
+
+def status_code(error: Exception) -> Optional[int]:
+    """HTTP status of an API error from google-api-core, google-genai, requests or urllib"""
+    for candidate in (
+        getattr(error, "code", None),
+        getattr(error, "status_code", None),
+        getattr(getattr(error, "response", None), "status_code", None)
+    ):
+        if isinstance(candidate, int):
+            return candidate
+    return None
+
+def is_retryable(error: Exception) -> bool:
+    code = status_code(error)
+    if code is not None:
+        return code in RETRYABLE_STATUS
+    # Timeouts and dropped connections carry no status
+    return isinstance(error, (TimeoutError, ConnectionError))
+
+class AdaptiveTokenBucket:
+    """Token bucket whose refill rate halves on throttling and creeps back up on success (AIMD)"""
+
+    def __init__(self, rate: float, capacity: float, min_rate: float = 0.5):
+        self.max_rate = rate
+        self.rate = rate
+        self.min_rate = min(min_rate, rate)
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self, timeout: Optional[float] = None) -> bool:
+        """Take one token, sleeping until one is available; False if timeout passes first"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return True
+                wait_seconds = (1 - self.tokens) / self.rate
+            if deadline is not None and now + wait_seconds > deadline:
+                return False
+            time.sleep(wait_seconds)
+
+    def on_throttled(self):
+        with self._lock:
+            self.rate = max(self.min_rate, self.rate / 2)
+            self.tokens = min(self.tokens, 0)
+
+    def on_success(self):
+        with self._lock:
+            self.rate = min(self.max_rate, self.rate + self.max_rate * 0.05)
+
+class CircuitBreaker:
+    """Opens after consecutive failures, then lets a single probe through after reset_timeout"""
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.state = "closed"
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == "closed":
+                return True
+            # One probe per reset_timeout while open or while a probe is still outstanding
+            if time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = "half_open"
+                self.opened_at = time.monotonic()
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.state = "closed"
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == "half_open" or self.failures >= self.failure_threshold:
+                self.state = "open"
+                self.opened_at = time.monotonic()
+
+class GeminiClient:
+    """Rate-limited, retrying, optionally hedged wrapper around Gemini API calls"""
+
+    def __init__(
+        self,
+        name: str = "default",
+        requests_per_second: float = 10.0,
+        burst: Optional[float] = None,
+        max_retries: int = 5,
+        base_delay: float = 0.5,
+        max_delay: float = 20.0,
+        hedge_after: Optional[float] = None,
+        failure_threshold: int = 5,
+        reset_timeout: float = 30.0,
+        acquire_timeout: float = 30.0,
+        hedge_threads: int = 32
+    ):
+        self.name = name
+        self.bucket = AdaptiveTokenBucket(requests_per_second, burst or max(1.0, requests_per_second))
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.hedge_after = hedge_after
+        self.acquire_timeout = acquire_timeout
+        # Hedged calls run here; sized like the query embedding pool (RAG_QUERY_THREADS) so calls rarely queue
+        self._executor = ThreadPoolExecutor(max_workers=hedge_threads, thread_name_prefix=f"gemini-{name}")
+        self._stats_lock = threading.Lock()
+
+        # Metrics
+        self.stats_data = {
+            "calls": 0,
+            "attempts": 0,
+            "retries": 0,
+            "throttled": 0,
+            "failures": 0,
+            "rejected": 0,
+            "hedges": 0,
+            "hedge_wins": 0
+        }
+
+    @classmethod
+    def from_env(cls, name: str, default_rps: float) -> "GeminiClient":
+        """Configure from GEMINI_<NAME>_RPS and the shared GEMINI_* settings"""
+        hedge_ms = os.environ.get(f"GEMINI_{name.upper()}_HEDGE_MS", os.environ.get("GEMINI_HEDGE_MS"))
+        return cls(
+            name=name,
+            requests_per_second=float(os.environ.get(f"GEMINI_{name.upper()}_RPS", default_rps)),
+            max_retries=int(os.environ.get("GEMINI_MAX_RETRIES", "5")),
+            hedge_after=float(hedge_ms) / 1000 if hedge_ms else None,
+            failure_threshold=int(os.environ.get("GEMINI_BREAKER_THRESHOLD", "5")),
+            reset_timeout=float(os.environ.get("GEMINI_BREAKER_RESET", "30")),
+            hedge_threads=int(os.environ.get("GEMINI_HEDGE_THREADS", "32"))
+        )
+
+    def _count(self, key: str, amount: int = 1):
+        with self._stats_lock:
+            self.stats_data[key] += amount
+
+    def _attempt(self, fn: Callable, args, kwargs):
+        if not self.bucket.acquire(timeout=self.acquire_timeout):
+            raise GeminiError(f"Gemini {self.name} rate limiter: no capacity within {self.acquire_timeout}s")
+        self._count("attempts")
+        return fn(*args, **kwargs)
+
+    def _hedged_attempt(self, fn: Callable, args, kwargs):
+        """Send a duplicate request if the first is slower than hedge_after; first success wins
+
+        The hedge timer starts when the primary request is actually running on a pool thread
+        (time spent queued for a thread is not the API being slow), and a hedge is only sent
+        when the bucket has a spare token, so hedging never eats into throttled capacity.
+        """
+        if not self.bucket.acquire(timeout=self.acquire_timeout):
+            raise GeminiError(f"Gemini {self.name} rate limiter: no capacity within {self.acquire_timeout}s")
+        self._count("attempts")
+        started = threading.Event()
+        
+        def run_primary():
+            started.set()
+            return fn(*args, **kwargs)
+        
+        primary = self._executor.submit(run_primary)
+        while not started.wait(timeout=0.05) and not primary.done():
+            pass
+        done, _ = wait([primary], timeout=self.hedge_after)
+        if done or not self.bucket.acquire(timeout=0):
+            return primary.result()
+
+        self._count("attempts")
+        self._count("hedges")
+        hedge = self._executor.submit(fn, *args, **kwargs)
+        pending = {primary, hedge}
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    if future is hedge:
+                        self._count("hedge_wins")
+                    return future.result()
+                error = future.exception()
+        raise error
+
+    def call(self, fn: Callable, *args, hedge: bool = False, **kwargs):
+        """Run fn(*args, **kwargs) with rate limiting, backoff on 429/5xx and circuit breaking
+
+        hedge should only be set for idempotent calls such as embeddings.
+        """
+        self._count("calls")
+        if not self.breaker.allow():
+            self._count("rejected")
+            raise GeminiUnavailableError(f"Gemini {self.name} circuit open after repeated failures")
+
+        for attempt in range(self.max_retries + 1):
+            try:
+                if hedge and self.hedge_after is not None:
+                    result = self._hedged_attempt(fn, args, kwargs)
+                else:
+                    result = self._attempt(fn, args, kwargs)
+                self.bucket.on_success()
+                self.breaker.record_success()
+                return result
+            except GeminiError:
+                raise
+            except Exception as e:
+                if status_code(e) == 429:
+                    self._count("throttled")
+                    self.bucket.on_throttled()
+                if not is_retryable(e) or attempt == self.max_retries:
+                    self._count("failures")
+                    if is_retryable(e):
+                        self.breaker.record_failure()
+                    else:
+                        # Gemini answered (e.g. 400); the service itself is healthy
+                        self.breaker.record_success()
+                    raise GeminiError(f"Gemini {self.name} call failed after {attempt + 1} attempts: {e}") from e
+
+                # Full jitter exponential backoff
+                self._count("retries")
+                time.sleep(random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt)))
+
+    def embed_content(self, **kwargs) -> Dict[str, Any]:
+        """genai.embed_content with retries and hedging"""
+        # Imported here so services on the google-genai SDK (ai/llmasssist.py) don't need this one
+        import google.generativeai as genai
+        return self.call(genai.embed_content, hedge=True, **kwargs)
+
+    def generate_content(self, model, *args, **kwargs):
+        """model.generate_content with retries (never hedged: generation is not free to duplicate)"""
+        return self.call(model.generate_content, *args, **kwargs)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **self.stats_data,
+            "rate_per_second": round(self.bucket.rate, 3),
+            "circuit": self.breaker.state
+        }
+
+_clients: Dict[str, GeminiClient] = {}
+_clients_lock = threading.Lock()
+
+# Default request rates per call type; override with GEMINI_EMBED_RPS / GEMINI_GENERATE_RPS
+_DEFAULT_RPS = {"embed": 20.0, "generate": 5.0}
+
+def get_gemini_client(name: str = "generate") -> GeminiClient:
+    """Process-wide client per call type so every caller shares one rate limit and breaker"""
+    with _clients_lock:
+        if name not in _clients:
+            _clients[name] = GeminiClient.from_env(name, _DEFAULT_RPS.get(name, 5.0))
+        return _clients[name]
+
+def gemini_stats() -> Dict[str, Any]:
+    """Stats for every client created in this process"""
+    with _clients_lock:
+        return {name: client.stats() for name, client in _clients.items()}
@@ -1,47 +1,237 @@
 import os
+import contextvars
 import numpy as np
-from typing import List, Dict, Any, Optional
-from google.cloud import firestore
-import google.generativeai as genai
-from models import DocumentChunk, SearchResult
-from firebase_gemini_init import initialize_services
-from rank_bm25 import BM25Okapi
+from typing import List, Dict, Any, Optional, Callable, Tuple
+from models import DocumentChunk, SearchResult, as_vector
+from storage_backends import StorageBackend, FirestoreStorage, create_storage_backend
+from dense_index import DenseIndex
+from index_state import IndexState
+from index_snapshot import IndexSnapshotStore
+from segmented_index import SegmentedIndex, Segment
+from segment_compactor import SegmentCompactor
+from sparse_index import tokenize
+from gemini_client import get_gemini_client
+from singleflight import SingleFlight
+from micro_batcher import MicroBatcher
+from tracing import stage
 import uuid
+import time
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 import json
 
+def _elapsed_ms(start: float) -> float:
+    return round((time.perf_counter() - start) * 1000, 3)
+
 class HybridVectorStore:
     """Hybrid vector store using Gemini embeddings and BM25"""
     
-    def __init__(self, project_id: str):
+    def __init__(
+        self,
+        project_id: str,
+        dense_mode: Optional[str] = None,
+        reduced_dim: Optional[int] = None,
+        quantization: Optional[str] = None,
+        candidate_multiplier: Optional[int] = None,
+        snapshot_dir: Optional[str] = None,
+        db=None,
+        bucket=None,
+        partition_filter: Optional[Callable[[Dict[str, Any]], bool]] = None,
+        storage: Optional[StorageBackend] = None
+    ):
         self.project_id = project_id
-        self.db, self.bucket = initialize_services()
+        # An explicit Firestore client (or LocalFirestore) wins over RAG_STORAGE_BACKEND
+        if storage is None:
+            storage = FirestoreStorage(db, bucket) if db is not None else create_storage_backend()
+        self.storage = storage
+        self.bucket = storage.bucket
+
+        # Sharded deployments index only the embedding docs this node owns
+        self.partition_filter = partition_filter
+        
+        # Gemini embeddings go through the shared rate-limited, retrying client
+        self.embedding_client = get_gemini_client("embed")
+        self.embedding_flight = SingleFlight("embedding")
+        
+        # Query embeddings from concurrent searches are sent as one batched API call
+        self.query_batcher = MicroBatcher(
+            self._embed_batch,
+            max_batch_size=int(os.environ.get("RAG_EMBED_BATCH_SIZE", "16")),
+            max_wait_ms=float(os.environ.get("RAG_EMBED_BATCH_WAIT_MS", "5")),
+            name="query-embedding"
+        )
+        # Batch ingestion: chunks per embed_content call, written together in one bulk put
+        self.ingest_embed_batch_size = int(os.environ.get("RAG_INGEST_EMBED_BATCH", "50"))
+        # Called before each ingestion embedding call; the server uses it to let chats go first
+        self.ingest_gate: Optional[Callable[[], None]] = None
         
-        # Initialize Gemini for embeddings - use the module directly
-        self.embedding_model = None  # We'll use genai.embed_content directly
+        # The remote query embedding runs here while the local sparse/filter legs proceed
+        self._query_executor = ThreadPoolExecutor(
+            max_workers=int(os.environ.get("RAG_QUERY_THREADS", "32")),
+            thread_name_prefix="query-embedding"
+        )
         
         # Collection names
         self.chunks_collection = "chunks"
         self.embeddings_collection = "embeddings"
+        self.deletions_collection = "index_deletions"
+        self.parents_collection = "parent_chunks"
+        
+        # Hierarchical mode: children are retrieved, then expanded to a bounded parent window
+        self.hierarchical = os.environ.get("RAG_HIERARCHICAL", "0") == "1"
+        self.parent_window_chars = int(os.environ.get("RAG_PARENT_WINDOW_CHARS", "1500"))
+        # LRU of parent docs shared by concurrent searches; entries are dropped when the index
+        # applies new children of a parent, and fetches that raced an invalidation are not cached
+        self.parent_cache_size = int(os.environ.get("RAG_PARENT_CACHE_SIZE", "4096"))
+        self._parent_cache: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._parent_lock = threading.Lock()
+        self._parent_generation = 0
+        
+        # Dense retrieval mode: "exact" scores every streamed document,
+        # "two_stage" picks candidates from a reduced in-memory copy and reranks them
+        self.dense_mode = dense_mode or os.environ.get("RAG_DENSE_MODE", "exact")
+        dense_index = None
+        if self.dense_mode == "two_stage":
+            dense_index = DenseIndex(
+                reduced_dim=reduced_dim or int(os.environ.get("RAG_REDUCED_DIM", "128")),
+                quantization=quantization or os.environ.get("RAG_QUANTIZATION", "truncate"),
+                candidate_multiplier=candidate_multiplier or int(os.environ.get("RAG_CANDIDATE_MULTIPLIER", "20"))
+            )
         
-        # BM25 index for sparse retrieval
-        self.bm25_index = None
-        self.bm25_documents = []
-        self.bm25_document_ids = []
+        # BM25 (and in two-stage mode dense) indexes, published as immutable IndexState versions:
+        # searches read self._state without locking, writers (uploads, background sync, loads,
+        # compaction) serialize on _write_lock and swap in an updated version
+        self._dense_template = dense_index
+        self._state = IndexState(dense=dense_index)
+        self._write_lock = threading.RLock()
+        self.synchronizer = None
         
+        # Segmented in-memory indexes: new rows collect in a head segment that is sealed at
+        # RAG_HEAD_SEGMENT_ROWS; a background compactor merges segments and purges deletes
+        self.head_segment_rows = int(os.environ.get("RAG_HEAD_SEGMENT_ROWS", "1000"))
+        self.compactor = None
+        
+        # Memory-mapped index snapshots shared by every worker on the host (two-stage mode only)
+        snapshot_dir = snapshot_dir or os.environ.get("RAG_SNAPSHOT_DIR")
+        self.snapshot_store = None
+        if snapshot_dir and dense_index is not None:
+            # Segments are merged when a publish leaves too many or too many deleted rows
+            self.snapshot_store = IndexSnapshotStore(
+                snapshot_dir,
+                check_interval=float(os.environ.get("RAG_SNAPSHOT_CHECK_INTERVAL", "5")),
+                max_segments=int(os.environ.get("RAG_MAX_SEGMENTS", "8")),
+                tombstone_ratio=float(os.environ.get("RAG_COMPACTION_TOMBSTONE_RATIO", "0.2")),
+                max_merge_mb=float(os.environ.get("RAG_COMPACTION_MAX_MERGE_MB", "256"))
+            )
+        elif os.environ.get("RAG_COMPACTION", "1") == "1":
+            self.compactor = SegmentCompactor(self)
+    
+    @property
+    def bm25_index(self):
+        return self._state.bm25
+    
+    @property
+    def dense_index(self) -> Optional[DenseIndex]:
+        return self._state.dense
+    
+    @property
+    def segmented_index(self) -> Optional[SegmentedIndex]:
+        return self._state.segments
+    
+    @property
+    def snapshot(self):
+        return self._state.snapshot
+    
+    @property
+    def loaded_watermark(self) -> Optional[str]:
+        return self._state.watermark
+    
+    def _publish(self, state: IndexState):
+        """Make a new index version visible to searches (callers hold _write_lock)"""
+        self._state = state
+    
+    def replace_segments(self, inputs: List[Segment], merged: Segment, remaps: List[np.ndarray]) -> bool:
+        """Publish a compacted segment in place of its inputs; False if the index moved on meanwhile"""
+        with self._write_lock:
+            state = self._state
+            if state.segments is None:
+                return False
+            segments = state.segments.replace(inputs, merged, remaps)
+            if segments is None:
+                return False
+            self._publish(IndexState.from_segments(
+                segments, state.dense is not None, state.watermark, state.generation + 1
+            ))
+            return True
+    
+    def segment_stats(self) -> Optional[Dict[str, Any]]:
+        """Segment layout and compaction metrics, None until the in-memory indexes are loaded"""
+        segments = self._state.segments
+        if segments is None:
+            return None
+        stats = segments.stats()
+        if self.compactor is not None:
+            stats["compaction"] = self.compactor.stats()
+        return stats
+        
+    def warm_up(self, load_indexes: bool = True, embed: bool = True) -> Dict[str, Any]:
+        """Load (or map) the indexes and open the embedding connection before traffic arrives
+
+        Index loading must succeed; the embedding call is best effort so a Gemini outage
+        does not keep every instance out of rotation.
+        """
+        timings: Dict[str, Any] = {}
+        if load_indexes:
+            stage_start = time.perf_counter()
+            if not self._state.loaded:
+                self._load_bm25_index()
+            if not self._state.loaded:
+                raise RuntimeError("index load failed")
+            timings["index_load"] = _elapsed_ms(stage_start)
+        if embed:
+            stage_start = time.perf_counter()
+            try:
+                self.embed_query("warm-up")
+            except Exception as e:
+                timings["embedding_error"] = str(e)
+                print(f"⚠️ Embedding warm-up failed: {e}")
+            timings["embedding"] = _elapsed_ms(stage_start)
+        return timings
+    
     def get_dense_embedding(self, text: str) -> List[float]:
         """Generate dense embedding using Gemini"""
+        # Concurrent requests for the same text share one API call
+        with stage("embedding.document"):
+            return self.embedding_flight.do(text, self._embed, text)
+    
+    def embed_query(self, text: str) -> List[float]:
+        """Query embedding, micro-batched with other in-flight searches"""
+        with stage("embedding.query"):
+            return self.embedding_flight.do(text, self.query_batcher.call, text)
+    
+    def _embed_batch(self, texts: List[str]) -> List[List[float]]:
+        """One embed_content call for a list of texts"""
+        result = self.embedding_client.embed_content(
+            model="embedding-001",
+            content=texts,
+            task_type="retrieval_document"
+        )
+        return result['embedding']
+    
+    def _embed(self, text: str) -> List[float]:
         try:
-            # Use genai.embed_content directly
-            result = genai.embed_content(
+            result = self.embedding_client.embed_content(
                 model="embedding-001",
                 content=text,
                 task_type="retrieval_document"
             )
             return result['embedding']
         except Exception as e:
-            print(f"Error generating dense embedding: {e}")
-            return self._simple_embedding(text)
+            # No fallback vector: a placeholder embedding would silently corrupt the index
+            print(f"❌ Error generating dense embedding: {e}")
+            raise
     
     def get_sparse_embedding(self, text: str) -> List[float]:
         """Generate sparse embedding using TF-IDF approach"""
@@ -67,49 +257,18 @@ class HybridVectorStore:
             print(f"Error generating sparse embedding: {e}")
             return [0.0] * 1000
     
-    def _simple_embedding(self, text: str) -> List[float]:
-        """Simple fallback embedding function"""
-        import hashlib
-        hash_obj = hashlib.md5(text.encode())
-        hash_hex = hash_obj.hexdigest()
-        embedding = []
-        for i in range(0, len(hash_hex), 2):
-            if len(embedding) >= 768:
-                break
-            embedding.append(float(int(hash_hex[i:i+2], 16)) / 255.0)
-        while len(embedding) < 768:
-            embedding.append(0.0)
-        return embedding[:768]
-    
     def store_chunk(self, chunk: DocumentChunk) -> str:
         """Store document chunk with both dense and sparse embeddings"""
         try:
             # Generate embeddings
-            chunk.dense_embedding = self.get_dense_embedding(chunk.content)
-            chunk.sparse_embedding = self.get_sparse_embedding(chunk.content)
-            
-            # Store chunk
-            chunk_ref = self.db.collection(self.chunks_collection).document(chunk.id)
-            chunk_ref.set(chunk.to_dict())
-            
-            # Store embeddings separately for efficient querying
-            embedding_doc = {
-                "chunk_id": chunk.id,
-                "document_id": chunk.document_id,
-                "dense_embedding": chunk.dense_embedding,
-                "sparse_embedding": chunk.sparse_embedding,
-                "content": chunk.content,
-                "class_name": chunk.class_name,
-                "subject_name": chunk.subject_name,
-                "file_id": chunk.file_id,
-                "chunk_index": chunk.chunk_index,
-                "metadata": chunk.metadata,
-                "user_id": chunk.metadata.get("user_id", "default"),
-                "created_at": chunk.created_at.isoformat()
-            }
-            
-            embedding_ref = self.db.collection(self.embeddings_collection).document(chunk.id)
-            embedding_ref.set(embedding_doc)
+            chunk.dense_embedding = as_vector(self.get_dense_embedding(chunk.content))
+            chunk.sparse_embedding = as_vector(self.get_sparse_embedding(chunk.content))
+            
+            # Store chunk, and its embeddings separately for efficient querying
+            self.storage.put_many([
+                (self.chunks_collection, chunk.id, chunk.to_dict(plain=False)),
+                (self.embeddings_collection, chunk.id, self._embedding_doc(chunk))
+            ])
             
             print(f"✅ Stored chunk {chunk.id} with hybrid embeddings")
             return chunk.id
@@ -118,23 +277,49 @@ class HybridVectorStore:
             print(f"❌ Error storing chunk: {e}")
             raise
     
-    def store_chunks(self, chunks: List[DocumentChunk]) -> List[str]:
-        """Store multiple chunks and update BM25 index"""
+    def _embedding_doc(self, chunk: DocumentChunk) -> Dict[str, Any]:
+        """Document written to the embeddings collection for a chunk (embeddings stay arrays; storage converts them)"""
+        return {
+            "chunk_id": chunk.id,
+            "document_id": chunk.document_id,
+            "dense_embedding": chunk.dense_embedding,
+            "sparse_embedding": chunk.sparse_embedding,
+            "content": chunk.content,
+            "class_name": chunk.class_name,
+            "subject_name": chunk.subject_name,
+            "file_id": chunk.file_id,
+            "chunk_index": chunk.chunk_index,
+            "metadata": chunk.metadata,
+            "user_id": chunk.metadata.get("user_id", "default"),
+            "created_at": chunk.created_at.isoformat(),
+            # Write time, used as the watermark by IndexSynchronizer polling
+            "indexed_at": datetime.utcnow().isoformat()
+        }
+    
+    def store_chunks(
+        self,
+        chunks: List[DocumentChunk],
+        parents: Optional[List[DocumentChunk]] = None,
+        progress: Optional[Callable[[int, int], None]] = None
+    ) -> List[str]:
+        """Store multiple chunks and update BM25 index; progress(done, total) after each chunk"""
         try:
             chunk_ids = []
-            documents = []
-            document_ids = []
+            
+            # Parent chunks are stored for expansion only; they are not embedded or indexed
+            if parents:
+                self.storage.put_many([(self.parents_collection, parent.id, parent.to_dict(plain=False)) for parent in parents])
             
             for chunk in chunks:
+                if self.ingest_gate is not None:
+                    self.ingest_gate()
                 chunk_id = self.store_chunk(chunk)
                 chunk_ids.append(chunk_id)
-                
-                # Add to BM25 documents
-                documents.append(chunk.content)
-                document_ids.append(chunk.id)
+                if progress is not None:
+                    progress(len(chunk_ids), len(chunks))
             
-            # Update BM25 index
-            self._update_bm25_index(documents, document_ids)
+            # Make the new chunks searchable in this process right away
+            self.apply_changes(upserts=[self._embedding_doc(chunk) for chunk in chunks])
             
             return chunk_ids
             
@@ -142,49 +327,223 @@ class HybridVectorStore:
             print(f"❌ Error storing chunks: {e}")
             raise
     
-    def _update_bm25_index(self, documents: List[str], document_ids: List[str]):
-        """Update BM25 index with new documents"""
+    def store_chunks_batched(
+        self,
+        chunks: List[DocumentChunk],
+        parents: Optional[List[DocumentChunk]] = None,
+        progress: Optional[Callable[[List[DocumentChunk]], None]] = None
+    ) -> List[str]:
+        """Store chunks from any number of files with batched embedding calls and bulk writes
+
+        progress(committed_chunks) is called after each embedded group has been written.
+        """
         try:
-            # Tokenize documents for BM25
-            tokenized_docs = [doc.lower().split() for doc in documents]
-            
-            # Create or update BM25 index
-            if self.bm25_index is None:
-                self.bm25_index = BM25Okapi(tokenized_docs)
-            else:
-                # Add new documents to existing index
-                for doc in tokenized_docs:
-                    self.bm25_index.add_doc(doc)
-            
-            self.bm25_documents.extend(documents)
-            self.bm25_document_ids.extend(document_ids)
+            # Parent chunks are stored for expansion only; they are not embedded or indexed
+            if parents:
+                self.storage.put_many([(self.parents_collection, parent.id, parent.to_dict(plain=False)) for parent in parents])
+            
+            embedding_docs = []
+            for start in range(0, len(chunks), self.ingest_embed_batch_size):
+                group = chunks[start:start + self.ingest_embed_batch_size]
+                if self.ingest_gate is not None:
+                    self.ingest_gate()
+                embeddings = self._embed_batch([chunk.content for chunk in group])
+                writes = []
+                for chunk, embedding in zip(group, embeddings):
+                    chunk.dense_embedding = as_vector(embedding)
+                    chunk.sparse_embedding = as_vector(self.get_sparse_embedding(chunk.content))
+                    embedding_docs.append(self._embedding_doc(chunk))
+                    writes.append((self.chunks_collection, chunk.id, chunk.to_dict(plain=False)))
+                    writes.append((self.embeddings_collection, chunk.id, embedding_docs[-1]))
+                self.storage.put_many(writes)
+                if progress is not None:
+                    progress(group)
+            
+            # Make the new chunks searchable in this process right away
+            self.apply_changes(upserts=embedding_docs)
+            
+            print(f"✅ Stored {len(chunks)} chunks with batched embeddings and writes")
+            return [chunk.id for chunk in chunks]
             
         except Exception as e:
-            print(f"❌ Error updating BM25 index: {e}")
+            print(f"❌ Error storing chunk batch: {e}")
+            raise
+    
+    def apply_changes(
+        self,
+        upserts: Optional[List[Dict[str, Any]]] = None,
+        deleted_ids: Optional[List[str]] = None
+    ):
+        """Apply inserted/updated and deleted embedding docs to the local dense and sparse indexes"""
+        upserts = upserts or []
+        if self.partition_filter is not None:
+            upserts = [doc for doc in upserts if self.partition_filter(doc)]
+        deleted_ids = list(deleted_ids or [])
+        if not upserts and not deleted_ids:
+            return
+        
+        # Snapshot mode: publish a new shared snapshot instead of mutating local copies
+        if self.snapshot_store is not None:
+            if self._state.dense_loaded:
+                self._publish_snapshot(upserts, deleted_ids)
+        else:
+            self._apply_to_segments(upserts, deleted_ids)
+        
+        # Re-indexing rewrites parents in place; drop them once their new children are searchable
+        self._forget_parents({doc.get("metadata", {}).get("parent_id") for doc in upserts} - {None})
+    
+    def _apply_to_segments(self, upserts: List[Dict[str, Any]], deleted_ids: List[str]):
+        """Publish a new in-memory SegmentedIndex version with the changes applied"""
+        with self._write_lock:
+            # Not loaded yet: the first search loads the full collection, including these
+            state = self._state
+            if state.segments is None:
+                return
+            
+            # Updated docs are replaced: their old rows are tombstoned, the new version goes to the head segment
+            dimension = state.segments.dimension if state.dense is not None else None
+            segments = state.segments.apply(
+                [self._index_record(doc) for doc in upserts],
+                [self._dense_vector(doc, dimension) for doc in upserts] if dimension else None,
+                deleted_ids
+            )
+            self._publish(IndexState.from_segments(
+                segments, state.dense is not None, state.watermark, state.generation + 1
+            ))
+    
+    def indexed_chunk_ids(self, chunk_ids: List[str]) -> set:
+        """Subset of chunk_ids already present in the local indexes"""
+        state = self._state
+        return {chunk_id for chunk_id in chunk_ids if chunk_id in state.rows}
     
     def _load_bm25_index(self):
-        """Load BM25 index from stored documents"""
+        """Load BM25 index (and the dense index in two-stage mode) from stored documents
+
+        Concurrent first searches wait for one load instead of each streaming the collection.
+        """
+        with self._write_lock:
+            if self._state.loaded:
+                return
+            if self.snapshot_store is not None:
+                self._load_from_snapshot()
+            else:
+                self._stream_indexes()
+    
+    def _read_embeddings(self) -> Tuple[List[str], List[List[float]], List[Dict[str, Any]], Optional[str]]:
+        """Chunk ids, dense vectors, index records and the newest indexed_at of the embeddings collection"""
+        dimension = self._dense_template.dimension if self._dense_template is not None else 0
+        ids, vectors, records = [], [], []
+        watermark = None
+        for _, doc_data in self.storage.stream(self.embeddings_collection):
+            if self.partition_filter is not None and not self.partition_filter(doc_data):
+                continue
+            ids.append(doc_data["chunk_id"])
+            records.append(self._index_record(doc_data))
+            if dimension:
+                vectors.append(self._dense_vector(doc_data, dimension))
+            indexed_at = doc_data.get("indexed_at", doc_data.get("created_at"))
+            if indexed_at and (watermark is None or indexed_at > watermark):
+                watermark = indexed_at
+        return ids, vectors, records, watermark
+    
+    def _stream_indexes(self):
+        """Stream the embeddings collection into segmented BM25 and dense indexes (holding _write_lock)"""
         try:
-            embeddings_ref = self.db.collection(self.embeddings_collection)
-            embeddings_docs = embeddings_ref.stream()
-            
-            documents = []
-            document_ids = []
-            
-            for doc in embeddings_docs:
-                doc_data = doc.to_dict()
-                documents.append(doc_data["content"])
-                document_ids.append(doc_data["chunk_id"])
-            
-            if documents:
-                tokenized_docs = [doc.lower().split() for doc in documents]
-                self.bm25_index = BM25Okapi(tokenized_docs)
-                self.bm25_documents = documents
-                self.bm25_document_ids = document_ids
+            ids, vectors, records, watermark = self._read_embeddings()
+            template = self._dense_template
+            codec = None
+            if template is not None:
+                codec = DenseIndex(**template.config(), candidate_multiplier=template.candidate_multiplier)
+            
+            segments = SegmentedIndex.build(records, vectors, codec, head_rows=self.head_segment_rows)
+            self._publish(IndexState.from_segments(
+                segments, template is not None, watermark, self._state.generation + 1
+            ))
+            if template is not None:
+                usage = segments.memory_usage()
+                print(f"✅ Loaded dense index: {len(segments)} rows, "
+                      f"{usage['full_bytes']} full / {usage['reduced_bytes']} reduced bytes")
+            if self.compactor is not None:
+                self.compactor.start()
             
         except Exception as e:
             print(f"❌ Error loading BM25 index: {e}")
     
+    def _load_from_snapshot(self):
+        """Open the shared snapshot, building it from Firestore if no worker has yet"""
+        try:
+            with self.snapshot_store.lock():
+                snapshot = self.snapshot_store.open_current()
+                if snapshot is None:
+                    print("📦 No index snapshot found, building one from Firestore...")
+                    _, vectors, records, watermark = self._read_embeddings()
+                    template = self._dense_template
+                    codec = DenseIndex(**template.config(), candidate_multiplier=template.candidate_multiplier)
+                    self.snapshot_store.publish(
+                        SegmentedIndex.build(records, vectors, codec, head_rows=self.head_segment_rows),
+                        watermark=watermark
+                    )
+                    snapshot = self.snapshot_store.open_current()
+            self._use_snapshot(snapshot)
+        except Exception as e:
+            print(f"❌ Error loading index snapshot: {e}")
+    
+    def _use_snapshot(self, snapshot):
+        """Swap the in-process indexes to the segments of a memory-mapped snapshot"""
+        segments = snapshot.index(self._dense_template.candidate_multiplier, self.head_segment_rows)
+        with self._write_lock:
+            self._publish(IndexState.from_segments(
+                segments, True, snapshot.manifest.get("watermark"), self._state.generation + 1, snapshot=snapshot
+            ))
+        print(f"✅ Opened index snapshot {os.path.basename(snapshot.path)} "
+              f"({len(snapshot)} rows in {len(snapshot.segment_names)} segments, mmap)")
+    
+    def _publish_snapshot(self, upserts: List[Dict[str, Any]], deleted_ids: List[str]):
+        """Apply changes to the latest snapshot and publish the result for all workers"""
+        try:
+            with self.snapshot_store.lock():
+                # Re-open under the lock so rows published by other workers are kept
+                base = self.snapshot_store.open_current()
+                segments = base.index(head_rows=self.head_segment_rows) if base is not None else self._state.segments
+                
+                # Same update as the in-memory indexes: tombstones plus a new head segment
+                segments = segments.apply(
+                    [self._index_record(doc) for doc in upserts],
+                    [self._dense_vector(doc, segments.dimension) for doc in upserts],
+                    deleted_ids
+                )
+                watermarks = [doc.get("indexed_at") for doc in upserts if doc.get("indexed_at")]
+                base_watermark = base.manifest.get("watermark") if base is not None else None
+                self.snapshot_store.publish(
+                    segments, watermark=max(filter(None, watermarks + [base_watermark]), default=None)
+                )
+                snapshot = self.snapshot_store.open_current()
+            self._use_snapshot(snapshot)
+        except Exception as e:
+            print(f"❌ Error publishing index snapshot: {e}")
+    
+    def _dense_vector(self, doc_data: Dict[str, Any], dimension: int) -> np.ndarray:
+        """Stored dense embedding as float32, zeros when missing"""
+        vector = doc_data.get("dense_embedding")
+        if vector is None or len(vector) == 0:
+            return np.zeros(dimension, dtype=np.float32)
+        return as_vector(vector)
+    
+    def _index_record(self, doc_data: Dict[str, Any]) -> Dict[str, Any]:
+        """Row metadata for the in-memory indexes, stored columnar by ChunkTable"""
+        metadata = doc_data.get("metadata", {})
+        return {
+            "chunk_id": doc_data.get("chunk_id", doc_data.get("id")),
+            "document_id": doc_data["document_id"],
+            "content": doc_data["content"],
+            "class_name": doc_data["class_name"],
+            "subject_name": doc_data["subject_name"],
+            "file_id": doc_data["file_id"],
+            "chunk_index": doc_data.get("chunk_index"),
+            "user_id": doc_data.get("user_id", metadata.get("user_id", "default")),
+            "metadata": metadata
+        }
+    
     def hybrid_search(
         self, 
         query: str, 
@@ -194,52 +553,125 @@ class HybridVectorStore:
         top_k: int = 5, 
         user_id: Optional[str] = None,
         dense_weight: float = 0.7,
-        sparse_weight: float = 0.3
+        sparse_weight: float = 0.3,
+        query_embedding: Optional[List[float]] = None,
+        timings: Optional[Dict[str, float]] = None
     ) -> List[SearchResult]:
-        """Hybrid search combining dense and sparse retrieval"""
+        """Hybrid search; child passages are expanded to their parent window for the final top_k
+
+        Pass a dict as timings to receive per-stage durations in milliseconds.
+        """
+        # Several children of one parent can match, so over-fetch before grouping by parent
+        retrieve_k = top_k * 3 if self.hierarchical else top_k
+        results = self._search_passages(
+            query, class_name, subject_name, allowed_file_ids, retrieve_k,
+            user_id, dense_weight, sparse_weight, query_embedding, timings
+        )
+        return self.expand_to_parents(results, top_k)
+    
+    def _search_passages(
+        self, 
+        query: str, 
+        class_name: Optional[str] = None,
+        subject_name: Optional[str] = None,
+        allowed_file_ids: Optional[List[str]] = None,
+        top_k: int = 5, 
+        user_id: Optional[str] = None,
+        dense_weight: float = 0.7,
+        sparse_weight: float = 0.3,
+        query_embedding: Optional[List[float]] = None,
+        timings: Optional[Dict[str, float]] = None
+    ) -> List[SearchResult]:
+        """Hybrid search combining dense and sparse retrieval
+
+        The query embedding (remote) runs concurrently with index loading, BM25 scoring and
+        filter resolution (local), and the two legs join for fusion.
+        """
+        timings = timings if timings is not None else {}
+        search_start = time.perf_counter()
+        embedding_future = None
         try:
-            # Generate query embeddings
-            query_dense_embedding = self.get_dense_embedding(query)
-            query_sparse_embedding = self.get_sparse_embedding(query)
+            # Start the query embedding first (a shard coordinator passes one in, computed once per query)
+            if query_embedding is None:
+                # Run in a copy of this context so the embedding stage lands in the caller's request trace
+                embedding_future = self._query_executor.submit(
+                    contextvars.copy_context().run, self._timed_embed_query, query, timings
+                )
             
+            stage_start = time.perf_counter()
             # Load BM25 index if not loaded
-            if self.bm25_index is None:
+            if not self._state.loaded:
                 self._load_bm25_index()
             
-            # Get embeddings from Firestore with filters
-            embeddings_ref = self.db.collection(self.embeddings_collection)
+            # Catch up with changes made by other instances if the sync has fallen behind
+            if self.synchronizer is not None:
+                self.synchronizer.ensure_fresh()
+            
+            # Pick up snapshots published by other workers
+            if self.snapshot_store is not None and self._state.dense_loaded:
+                snapshot = self.snapshot_store.refresh()
+                if snapshot is not None:
+                    self._use_snapshot(snapshot)
+                    # The publishing worker may have rewritten parents this one has cached
+                    self._forget_parents()
+            
+            # Everything below reads this one consistent version of the indexes
+            state = self._state
+            timings["index_load"] = _elapsed_ms(stage_start)
+            
+            if state.dense is not None and state.dense_loaded:
+                index, rows, sparse_all = self._prepare_two_stage(
+                    state, query, class_name, subject_name, allowed_file_ids, user_id, timings
+                )
+                query_dense_embedding = self._join_embedding(embedding_future, query_embedding, timings)
+                results = self._two_stage_search(
+                    index, rows, sparse_all, query_dense_embedding, top_k, dense_weight, sparse_weight, timings
+                )
+                timings["total"] = _elapsed_ms(search_start)
+                return results
             
-            # Apply filters
+            stage_start = time.perf_counter()
+            # Get embeddings from storage with filters
+            filters = []
             if user_id:
-                embeddings_ref = embeddings_ref.where("user_id", "==", user_id)
+                filters.append(("user_id", "==", user_id))
             if class_name:
-                embeddings_ref = embeddings_ref.where("class_name", "==", class_name)
+                filters.append(("class_name", "==", class_name))
             if subject_name:
-                embeddings_ref = embeddings_ref.where("subject_name", "==", subject_name)
+                filters.append(("subject_name", "==", subject_name))
             if allowed_file_ids:
-                embeddings_ref = embeddings_ref.where("file_id", "in", allowed_file_ids)
+                filters.append(("file_id", "in", allowed_file_ids))
+            
+            # Read the filtered documents while the embedding is still in flight
+            embeddings_docs = [doc for _, doc in self.storage.stream(self.embeddings_collection, filters)]
+            timings["filters"] = _elapsed_ms(stage_start)
+            
+            # BM25 scores for the whole corpus, computed once per query
+            stage_start = time.perf_counter()
+            sparse_scores = None
+            if state.bm25 is not None:
+                sparse_scores = state.bm25.get_scores(tokenize(query))
+            timings["sparse"] = _elapsed_ms(stage_start)
             
-            embeddings_docs = embeddings_ref.stream()
+            query_dense_embedding = self._join_embedding(embedding_future, query_embedding, timings)
+            stage_start = time.perf_counter()
             
             # Calculate similarities
             similarities = []
-            for doc in embeddings_docs:
-                doc_data = doc.to_dict()
+            for doc_data in embeddings_docs:
                 chunk_id = doc_data["chunk_id"]
                 
                 # Dense similarity
-                doc_dense_embedding = doc_data.get("dense_embedding", [])
+                doc_dense_embedding = doc_data.get("dense_embedding")
                 dense_similarity = 0.0
-                if doc_dense_embedding:
+                if doc_dense_embedding is not None and len(doc_dense_embedding):
                     dense_similarity = self._cosine_similarity(query_dense_embedding, doc_dense_embedding)
                 
                 # Sparse similarity (BM25)
                 sparse_similarity = 0.0
-                if self.bm25_index and chunk_id in self.bm25_document_ids:
-                    doc_index = self.bm25_document_ids.index(chunk_id)
-                    sparse_scores = self.bm25_index.get_scores(query.lower().split())
-                    if doc_index < len(sparse_scores):
-                        sparse_similarity = sparse_scores[doc_index]
+                doc_index = state.rows.get(chunk_id)
+                if sparse_scores is not None and doc_index is not None and doc_index < len(sparse_scores):
+                    sparse_similarity = sparse_scores[doc_index]
                 
                 # Normalize sparse similarity
                 if sparse_similarity > 0:
@@ -255,6 +687,7 @@ class HybridVectorStore:
                     "class_name": doc_data["class_name"],
                     "subject_name": doc_data["subject_name"],
                     "file_id": doc_data["file_id"],
+                    "chunk_index": doc_data.get("chunk_index"),
                     "dense_score": dense_similarity,
                     "sparse_score": sparse_similarity,
                     "hybrid_score": hybrid_score,
@@ -278,16 +711,204 @@ class HybridVectorStore:
                     dense_score=result["dense_score"],
                     sparse_score=result["sparse_score"],
                     hybrid_score=result["hybrid_score"],
-                    metadata=result["metadata"]
+                    metadata=result["metadata"],
+                    chunk_index=result["chunk_index"]
                 )
                 search_results.append(search_result)
             
+            timings["fusion"] = _elapsed_ms(stage_start)
+            timings["total"] = _elapsed_ms(search_start)
             return search_results
             
         except Exception as e:
             print(f"❌ Error in hybrid search: {e}")
+            if embedding_future is not None:
+                embedding_future.cancel()
             return []
     
+    def _timed_embed_query(self, query: str, timings: Dict[str, float]) -> List[float]:
+        start = time.perf_counter()
+        try:
+            return self.embed_query(query)
+        finally:
+            timings["embedding"] = _elapsed_ms(start)
+    
+    def _join_embedding(self, embedding_future, query_embedding: Optional[List[float]], timings: Dict[str, float]) -> List[float]:
+        """Wait for the concurrent query embedding; embedding_wait is the part not hidden by local work"""
+        if embedding_future is None:
+            return query_embedding
+        start = time.perf_counter()
+        embedding = embedding_future.result()
+        timings["embedding_wait"] = _elapsed_ms(start)
+        return embedding
+    
+    def expand_to_parents(self, results: List[SearchResult], top_k: int) -> List[SearchResult]:
+        """Group child hits by parent and replace each group with a bounded window of the parent"""
+        groups: Dict[str, List[SearchResult]] = {}
+        for result in results:
+            key = result.metadata.get("parent_id") or result.chunk_id
+            if key in groups or len(groups) < top_k:
+                groups.setdefault(key, []).append(result)
+        
+        parents = self._get_parents([key for key, group in groups.items() if group[0].metadata.get("parent_id")])
+        expanded = []
+        for key, group in groups.items():
+            best = group[0]
+            parent = parents.get(key)
+            if parent is None:
+                expanded.append(best)
+                continue
+            start = min(r.metadata["parent_start"] for r in group)
+            end = max(r.metadata["parent_end"] for r in group)
+            window_start, window = self._parent_window(parent["content"], start, end)
+            expanded.append(SearchResult(
+                chunk_id=best.chunk_id,
+                document_id=best.document_id,
+                content=window,
+                class_name=best.class_name,
+                subject_name=best.subject_name,
+                file_id=best.file_id,
+                dense_score=best.dense_score,
+                sparse_score=best.sparse_score,
+                hybrid_score=best.hybrid_score,
+                metadata={**best.metadata, "child_ids": [r.chunk_id for r in group], "window_start": window_start},
+                chunk_index=parent["chunk_index"]
+            ))
+        return expanded
+    
+    def _get_parents(self, parent_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        """Parent chunk docs by id, from the in-process LRU or storage"""
+        with self._parent_lock:
+            parents = {}
+            for parent_id in parent_ids:
+                parent = self._parent_cache.get(parent_id)
+                if parent is not None:
+                    self._parent_cache.move_to_end(parent_id)
+                    parents[parent_id] = parent
+            generation = self._parent_generation
+        
+        missing = [parent_id for parent_id in parent_ids if parent_id not in parents]
+        if missing:
+            fetched = self.storage.get_many(self.parents_collection, missing)
+            parents.update(fetched)
+            with self._parent_lock:
+                # Parents invalidated while the read was in flight may be the old versions
+                if generation == self._parent_generation:
+                    self._parent_cache.update(fetched)
+                    while len(self._parent_cache) > self.parent_cache_size:
+                        self._parent_cache.popitem(last=False)
+        return parents
+    
+    def _forget_parents(self, parent_ids=None):
+        """Drop cached parents (all of them when parent_ids is None)"""
+        if parent_ids is not None and not parent_ids:
+            return
+        with self._parent_lock:
+            self._parent_generation += 1
+            if parent_ids is None:
+                self._parent_cache.clear()
+            for parent_id in parent_ids or ():
+                self._parent_cache.pop(parent_id, None)
+    
+    def _parent_window(self, text: str, start: int, end: int) -> Tuple[int, str]:
+        """Matched span padded with surrounding parent text up to parent_window_chars, at sentence edges"""
+        pad = max(0, self.parent_window_chars - (end - start)) // 2
+        window_start, window_end = max(0, start - pad), min(len(text), end + pad)
+        if window_start > 0:
+            boundary = text.find(". ", window_start, start)
+            window_start = boundary + 2 if boundary != -1 else start
+        if window_end < len(text):
+            boundary = text.rfind(". ", end, window_end)
+            window_end = boundary + 1 if boundary != -1 else end
+        window = text[window_start:window_end]
+        stripped = window.lstrip()
+        return window_start + len(window) - len(stripped), stripped.rstrip()
+    
+    def _prepare_two_stage(
+        self,
+        state: IndexState,
+        query: str,
+        class_name: Optional[str],
+        subject_name: Optional[str],
+        allowed_file_ids: Optional[List[str]],
+        user_id: Optional[str],
+        timings: Dict[str, float]
+    ) -> Tuple[DenseIndex, Optional[np.ndarray], np.ndarray]:
+        """Local leg of the in-memory search: filter rows and BM25 scores aligned to dense rows"""
+        index = state.dense
+        stage_start = time.perf_counter()
+        rows = index.filter_rows(class_name, subject_name, allowed_file_ids, user_id)
+        timings["filters"] = _elapsed_ms(stage_start)
+        
+        # BM25 scores for every row, aligned to dense index rows
+        stage_start = time.perf_counter()
+        sparse_all = np.zeros(len(index), dtype=np.float32)
+        if state.bm25 is not None:
+            bm25_scores = np.asarray(state.bm25.get_scores(tokenize(query)), dtype=np.float32)
+            bm25_rows = state.bm25_alignment()
+            valid = bm25_rows >= 0
+            sparse_all[valid] = bm25_scores[bm25_rows[valid]]
+        timings["sparse"] = _elapsed_ms(stage_start)
+        return index, rows, sparse_all
+    
+    def _two_stage_search(
+        self,
+        index: DenseIndex,
+        rows: Optional[np.ndarray],
+        sparse_all: np.ndarray,
+        query_dense_embedding: List[float],
+        top_k: int,
+        dense_weight: float,
+        sparse_weight: float,
+        timings: Dict[str, float]
+    ) -> List[SearchResult]:
+        """Hybrid search over the in-memory index: reduced-dim candidates, full-precision rerank"""
+        stage_start = time.perf_counter()
+        results = self._two_stage_rank(
+            index, rows, sparse_all, query_dense_embedding, top_k, dense_weight, sparse_weight
+        )
+        timings["dense_fusion"] = _elapsed_ms(stage_start)
+        return results
+    
+    def _two_stage_rank(
+        self,
+        index: DenseIndex,
+        rows: Optional[np.ndarray],
+        sparse_all: np.ndarray,
+        query_dense_embedding: List[float],
+        top_k: int,
+        dense_weight: float,
+        sparse_weight: float
+    ) -> List[SearchResult]:
+        indexed_rows = len(sparse_all)
+        if indexed_rows == 0 or (rows is not None and len(rows) == 0):
+            return []
+        
+        pool_size = top_k * index.candidate_multiplier
+        dense_rows, _ = index.search(query_dense_embedding, pool_size, rows=rows)
+        
+        # Strong lexical matches join the dense candidates before fusion
+        sparse_pool = sparse_all if rows is None else sparse_all[rows]
+        sparse_rows = np.arange(indexed_rows) if rows is None else rows
+        if len(sparse_pool) > pool_size:
+            sparse_rows = sparse_rows[np.argpartition(-sparse_pool, pool_size - 1)[:pool_size]]
+        candidates = np.union1d(dense_rows, sparse_rows[sparse_all[sparse_rows] > 0])
+        
+        dense_scores = index.exact_scores(query_dense_embedding, candidates)
+        sparse_scores = sparse_all[candidates]
+        # Same normalization as the exact path: s / max(s, 1) for positive scores
+        sparse_scores = np.where(sparse_scores > 0, sparse_scores / np.maximum(sparse_scores, 1.0), 0.0)
+        hybrid_scores = dense_weight * dense_scores + sparse_weight * sparse_scores
+        
+        order = np.argsort(-hybrid_scores)[:top_k]
+        search_results = []
+        for position in order:
+            record = index.records[candidates[position]]
+            search_results.append(record.to_search_result(
+                float(dense_scores[position]), float(sparse_scores[position]), float(hybrid_scores[position])
+            ))
+        return search_results
+    
     def _cosine_similarity(self, vec1: List[float], vec2: List[float]) -> float:
         """Calculate cosine similarity between two vectors"""
         try:
@@ -311,12 +932,8 @@ class HybridVectorStore:
     def get_chunks_by_file_id(self, file_id: str) -> List[DocumentChunk]:
         """Get all chunks for a specific file"""
         try:
-            chunks_ref = self.db.collection(self.chunks_collection).where("file_id", "==", file_id)
-            chunks = chunks_ref.stream()
-            
             document_chunks = []
-            for chunk in chunks:
-                data = chunk.to_dict()
+            for _, data in self.storage.stream(self.chunks_collection, [("file_id", "==", file_id)]):
                 document_chunk = DocumentChunk(
                     id=data["id"],
                     document_id=data["document_id"],
@@ -340,20 +957,61 @@ class HybridVectorStore:
     def delete_chunks_by_file_id(self, file_id: str) -> bool:
         """Delete all chunks for a specific file"""
         try:
+            by_file = [("file_id", "==", file_id)]
             # Delete chunks
-            chunks_ref = self.db.collection(self.chunks_collection).where("file_id", "==", file_id)
-            chunks = chunks_ref.stream()
-            for chunk in chunks:
-                chunk.reference.delete()
+            self.storage.delete_where(self.chunks_collection, by_file)
+            
+            # Delete parent chunks (hierarchical mode)
+            self._forget_parents(self.storage.delete_where(self.parents_collection, by_file))
             
             # Delete embeddings
-            embeddings_ref = self.db.collection(self.embeddings_collection).where("file_id", "==", file_id)
-            embeddings = embeddings_ref.stream()
-            for embedding in embeddings:
-                embedding.reference.delete()
+            deleted_ids = self.storage.delete_where(self.embeddings_collection, by_file)
+            
+            # Record the deletion so polling synchronizers on other instances can apply it
+            if deleted_ids:
+                self.storage.put(self.deletions_collection, str(uuid.uuid4()), {
+                    "file_id": file_id,
+                    "chunk_ids": deleted_ids,
+                    "deleted_at": datetime.utcnow().isoformat()
+                })
+            self.apply_changes(deleted_ids=deleted_ids)
             
             print(f"✅ Deleted all chunks for file {file_id}")
             return True
         except Exception as e:
             print(f"❌ Error deleting chunks: {e}")
-            return False 
\ No newline at end of file
+            return False
+
+    def replace_file_chunks(
+        self,
+        file_id: str,
+        chunks: List[DocumentChunk],
+        parents: Optional[List[DocumentChunk]] = None
+    ) -> Dict[str, int]:
+        """Store a file's re-chunked passages, then delete its chunks that were not reproduced
+
+        Chunk ids are derived from the file id, so positions that still exist are overwritten
+        in place and searches keep finding the file while it is re-indexed.
+        """
+        by_file = [("file_id", "==", file_id)]
+        old_ids = {doc_id for doc_id, _ in self.storage.stream(self.embeddings_collection, by_file)}
+        old_parent_ids = {doc_id for doc_id, _ in self.storage.stream(self.parents_collection, by_file)}
+
+        self.store_chunks_batched(chunks, parents=parents)
+
+        stale_ids = sorted(old_ids - {chunk.id for chunk in chunks})
+        stale_parent_ids = sorted(old_parent_ids - {parent.id for parent in parents or []})
+        if stale_ids:
+            self.storage.delete_many(self.chunks_collection, stale_ids)
+            self.storage.delete_many(self.embeddings_collection, stale_ids)
+            self.storage.put(self.deletions_collection, str(uuid.uuid4()), {
+                "file_id": file_id,
+                "chunk_ids": stale_ids,
+                "deleted_at": datetime.utcnow().isoformat()
+            })
+            self.apply_changes(deleted_ids=stale_ids)
+        if stale_parent_ids:
+            self.storage.delete_many(self.parents_collection, stale_parent_ids)
+        # Parents may have been rewritten in place
+        self._forget_parents(old_parent_ids)
+        return {"stored": len(chunks), "deleted": len(stale_ids)}
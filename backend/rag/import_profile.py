@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+"""
+Import-time profile
+Imports a module in a fresh interpreter with `python -X importtime` and reports the total
+import time and the slowest imports, so heavy dependencies creeping onto the startup path show up.
+"""
+
+import sys
+import time
+import argparse
+import subprocess
+
+def profile_imports(module: str):
+    """(wall seconds, [(cumulative_us, self_us, name)]) for importing module in a new process"""
+    started = time.perf_counter()
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True
+    )
+    wall = time.perf_counter() - started
+    if proc.returncode != 0:
+        tail = proc.stderr.strip().splitlines()[-1:] or ["unknown error"]
+        raise RuntimeError(f"import {module} failed: {tail[0]}")
+
+    rows = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        # Nested imports are indented below the module that triggered them
+        rows.append((int(cumulative_us), int(self_us), name[1:]))
+    return wall, rows
+
+def main():
+    """Main function"""
+    parser = argparse.ArgumentParser(description="Report import time of a module and its slowest imports")
+    parser.add_argument("module", nargs="?", default="server", help="Module to import (default: server)")
+    parser.add_argument("--top", type=int, default=20, help="Slowest imports to list")
+    parser.add_argument("--max-seconds", type=float, help="Exit non-zero when the import takes longer")
+    args = parser.parse_args()
+
+    wall, rows = profile_imports(args.module)
+    top_level = [row for row in rows if not row[2].startswith(" ")]
+    total_us = sum(cumulative for cumulative, _, _ in top_level)
+
+    print("=" * 80)
+    print(f"IMPORT PROFILE: import {args.module}")
+    print("=" * 80)
+    print(f"Interpreter wall time: {wall:.3f}s   imports: {total_us / 1e6:.3f}s   modules: {len(rows)}")
+    print(f"\n{'cumulative ms':>14}{'self ms':>10}  module")
+    for cumulative, self_us, name in sorted(rows, reverse=True)[:args.top]:
+        print(f"{cumulative / 1000:>14.1f}{self_us / 1000:>10.1f}  {name.strip()}")
+    print("=" * 80)
+
+    if args.max_seconds is not None and total_us / 1e6 > args.max_seconds:
+        print(f"❌ import {args.module} took {total_us / 1e6:.3f}s (limit {args.max_seconds}s)")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
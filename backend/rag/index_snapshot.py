@@ -0,0 +1,301 @@
+import os
+import json
+import mmap
+import time
+import uuid
+import fcntl
+import shutil
+from contextlib import contextmanager
+from typing import List, Dict, Optional
+
+import numpy as np
+
+from chunk_table import ChunkTable, CODED_COLUMNS
+from dense_index import DenseIndex
+from segmented_index import Segment, SegmentedIndex
+
+POSTINGS_ARRAYS = ("term_hashes", "offsets", "doc_ids", "term_freqs")
+
+def _map_buffer(path: str):
+    """Read-only mmap of a UTF-8 buffer file; slices are bytes, like ChunkTable's in-memory buffers"""
+    if os.path.getsize(path) == 0:
+        return b""
+    with open(path, "rb") as f:
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+def write_segment(path: str, segment: Segment):
+    """Write a segment's columns, dense rows and postings (not its tombstones) to a new directory"""
+    os.makedirs(path)
+    save = lambda name, array: np.save(os.path.join(path, f"{name}.npy"), np.asarray(array))
+    table = segment.records
+    save("ids", np.array(table.ids, dtype=str))
+    for name in CODED_COLUMNS:
+        save(f"{name}_codes", table.codes[name])
+    with open(os.path.join(path, "values.json"), "w") as f:
+        json.dump(table.values, f)
+    save("chunk_index", table.chunk_index)
+    for name in ("content", "metadata"):
+        with open(os.path.join(path, f"{name}.bin"), "wb") as f:
+            f.write(getattr(table, f"{name}_buffer"))
+        save(f"{name}_offsets", getattr(table, f"{name}_offsets"))
+    save("vectors", segment.vectors)
+    save("reduced", segment.reduced)
+    for name in POSTINGS_ARRAYS:
+        save(name, getattr(segment, name))
+    save("doc_lengths", segment.doc_lengths)
+
+def read_segment(path: str) -> Segment:
+    """Segment over the memory-mapped files of a written segment directory"""
+    load = lambda name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r")
+    with open(os.path.join(path, "values.json")) as f:
+        values = json.load(f)
+    table = ChunkTable(
+        load("ids").tolist(),
+        {name: load(f"{name}_codes") for name in CODED_COLUMNS},
+        values,
+        load("chunk_index"),
+        _map_buffer(os.path.join(path, "content.bin")),
+        load("content_offsets"),
+        _map_buffer(os.path.join(path, "metadata.bin")),
+        load("metadata_offsets")
+    )
+    segment = Segment(table, load("vectors"), load("reduced"), {name: load(name) for name in POSTINGS_ARRAYS}, load("doc_lengths"))
+    segment.file_name = os.path.basename(path)
+    return segment
+
+class IndexSnapshot:
+    """One published snapshot: its manifest, memory-mapped segments and tombstones
+
+    While the object is alive it holds a shared flock() on the manifest, the reader lease
+    that keeps IndexSnapshotStore from deleting the snapshot. States serving searches
+    reference their snapshot, so the lease ends once the last search on it returns.
+    """
+
+    def __init__(self, path: str, cache: Dict[str, Segment]):
+        self.path = path
+        self._lease = open(os.path.join(path, "manifest.json"))
+        try:
+            fcntl.flock(self._lease, fcntl.LOCK_SH | fcntl.LOCK_NB)
+        except BlockingIOError:
+            # Being garbage-collected right now
+            self._lease.close()
+            raise FileNotFoundError(path)
+        self.manifest = json.load(self._lease)
+
+        segments_root = os.path.join(os.path.dirname(path), "segments")
+        parts = []
+        for name in self.manifest["segments"] + ([self.manifest["head"]] if self.manifest["head"] else []):
+            segment = cache.get(name) or read_segment(os.path.join(segments_root, name))
+            cache[name] = segment
+            tombstones_path = os.path.join(path, f"{name}.tombstones.npy")
+            if os.path.exists(tombstones_path):
+                segment = segment.with_tombstones(np.flatnonzero(np.load(tombstones_path)))
+            parts.append(segment)
+        self.segments = parts[:len(self.manifest["segments"])]
+        self.head = parts[-1] if self.manifest["head"] else None
+
+        has_pca = self.manifest.get("has_pca")
+        self.pca_mean = np.load(os.path.join(path, "pca_mean.npy")) if has_pca else None
+        self.pca_components = np.load(os.path.join(path, "pca_components.npy")) if has_pca else None
+
+    @property
+    def segment_names(self) -> List[str]:
+        return self.manifest["segments"] + ([self.manifest["head"]] if self.manifest["head"] else [])
+
+    def index(self, candidate_multiplier: int = 20, head_rows: int = 1000) -> SegmentedIndex:
+        """SegmentedIndex over the snapshot's segments, searched and updated like the in-memory one"""
+        manifest = self.manifest
+        codec = DenseIndex(
+            dimension=manifest["dimension"],
+            reduced_dim=manifest["reduced_dim"],
+            quantization=manifest["quantization"],
+            candidate_multiplier=candidate_multiplier
+        )
+        codec.pca_mean = self.pca_mean
+        codec.pca_components = self.pca_components
+        return SegmentedIndex(self.segments, self.head, codec, head_rows)
+
+    def __len__(self) -> int:
+        return self.manifest["rows"]
+
+class IndexSnapshotStore:
+    """Publishes and opens memory-mapped index snapshots shared by all workers on a host
+
+    Layout:
+        <root>/CURRENT             name of the active snapshot directory
+        <root>/LOCK                flock() held while publishing
+        <root>/segments/seg-*/     immutable segments: columns, dense rows and BM25 postings
+        <root>/snap-<ts>-<id>/     manifest.json listing the segments, per-segment tombstones
+                                   and the PCA projection
+
+    A publish writes only the segments that are new since the base snapshot (the head segment
+    holding recent uploads, or a merge) plus small tombstone files, so an upload costs I/O in
+    proportion to the change rather than the corpus. Segments past max_segments or
+    tombstone_ratio are merged at publish time, purging deleted rows. Superseded snapshots
+    are removed once no process holds a lease on them, then segments no snapshot lists.
+    """
+
+    def __init__(
+        self,
+        root: str,
+        check_interval: float = 5.0,
+        max_segments: int = 8,
+        tombstone_ratio: float = 0.2,
+        max_merge_mb: float = 256.0
+    ):
+        self.root = root
+        self.check_interval = check_interval
+        self.max_segments = max_segments
+        self.tombstone_ratio = tombstone_ratio
+        self.max_merge_bytes = int(max_merge_mb * 1e6)
+        self._current_name = None
+        self._last_check = 0.0
+        # Segments opened by this process, by directory name; shared by every snapshot listing them
+        self._segments: Dict[str, Segment] = {}
+        os.makedirs(os.path.join(root, "segments"), exist_ok=True)
+
+    @contextmanager
+    def lock(self):
+        """Exclusive publish lock across processes"""
+        with open(os.path.join(self.root, "LOCK"), "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def current_name(self) -> Optional[str]:
+        try:
+            with open(os.path.join(self.root, "CURRENT")) as f:
+                return f.read().strip() or None
+        except FileNotFoundError:
+            return None
+
+    def open_current(self) -> Optional[IndexSnapshot]:
+        """Open the active snapshot (mmap opens; only segments new to this process are mapped)"""
+        for _ in range(5):
+            name = self.current_name()
+            if not name:
+                return None
+            try:
+                snapshot = IndexSnapshot(os.path.join(self.root, name), self._segments)
+            except FileNotFoundError:
+                # Superseded and collected between reading CURRENT and taking the lease
+                continue
+            self._segments = {segment: self._segments[segment] for segment in snapshot.segment_names}
+            self._current_name = name
+            self._last_check = time.monotonic()
+            return snapshot
+        raise RuntimeError(f"Index snapshot in {self.root} kept changing while opening it")
+
+    def refresh(self) -> Optional[IndexSnapshot]:
+        """Return a newly published snapshot, or None if the active one is unchanged"""
+        now = time.monotonic()
+        if now - self._last_check < self.check_interval:
+            return None
+        self._last_check = now
+        name = self.current_name()
+        if not name or name == self._current_name:
+            return None
+        return self.open_current()
+
+    def publish(self, index: SegmentedIndex, watermark: Optional[str] = None) -> str:
+        """Compact, write the new segments and tombstones of index and make it the current snapshot
+
+        Must be called while holding lock() so concurrent publishers don't drop rows.
+        """
+        index = self._compact(index)
+        name = f"snap-{int(time.time() * 1000)}-{uuid.uuid4().hex[:8]}"
+        tmp_path = os.path.join(self.root, f".tmp-{name}")
+        os.makedirs(tmp_path)
+        try:
+            names = []
+            for part in index.parts:
+                part_name = getattr(part, "file_name", None)
+                if part_name is None:
+                    part_name = self._write_segment(part)
+                names.append(part_name)
+                if part.deleted:
+                    np.save(os.path.join(tmp_path, f"{part_name}.tombstones.npy"), part.tombstones)
+            codec = index.codec
+            if codec.pca_components is not None:
+                np.save(os.path.join(tmp_path, "pca_mean.npy"), np.asarray(codec.pca_mean))
+                np.save(os.path.join(tmp_path, "pca_components.npy"), np.asarray(codec.pca_components))
+            manifest = dict(codec.config())
+            manifest.update({
+                "segments": names[:len(index.segments)],
+                "head": names[-1] if index.head is not None else None,
+                "rows": len(index),
+                "live_rows": index.live_count,
+                "has_pca": codec.pca_components is not None,
+                # Newest indexed_at contained in the snapshot, the resume point for index sync
+                "watermark": watermark,
+                "created_at": time.time()
+            })
+            with open(os.path.join(tmp_path, "manifest.json"), "w") as f:
+                json.dump(manifest, f)
+            os.rename(tmp_path, os.path.join(self.root, name))
+        except Exception:
+            shutil.rmtree(tmp_path, ignore_errors=True)
+            raise
+
+        pointer_tmp = os.path.join(self.root, f"CURRENT.{uuid.uuid4().hex}")
+        with open(pointer_tmp, "w") as f:
+            f.write(name)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(pointer_tmp, os.path.join(self.root, "CURRENT"))
+
+        self._collect(keep_name=name)
+        return name
+
+    def _compact(self, index: SegmentedIndex) -> SegmentedIndex:
+        """Merge the segments compaction_plan() picks, purging their tombstones"""
+        plan = index.compaction_plan(self.max_segments, self.tombstone_ratio, self.max_merge_bytes)
+        if not plan:
+            return index
+        merged, remaps = Segment.merge(plan)
+        return index.replace(plan, merged, remaps) or index
+
+    def _write_segment(self, segment: Segment) -> str:
+        name = f"seg-{int(time.time() * 1000)}-{uuid.uuid4().hex[:8]}"
+        tmp_path = os.path.join(self.root, "segments", f".tmp-{name}")
+        try:
+            write_segment(tmp_path, segment)
+            os.rename(tmp_path, os.path.join(self.root, "segments", name))
+        except Exception:
+            shutil.rmtree(tmp_path, ignore_errors=True)
+            raise
+        return name
+
+    def _collect(self, keep_name: str):
+        """Remove superseded snapshots no reader holds, then segments no remaining snapshot lists
+
+        Runs under lock(), so leftover .tmp- directories are from publishers that crashed.
+        """
+        listed = set()
+        for name in os.listdir(self.root):
+            path = os.path.join(self.root, name)
+            if name.startswith(".tmp-"):
+                shutil.rmtree(path, ignore_errors=True)
+            elif name.startswith("snap-"):
+                if name == keep_name or not self._remove_unleased(path):
+                    with open(os.path.join(path, "manifest.json")) as f:
+                        manifest = json.load(f)
+                    listed.update(manifest["segments"])
+                    if manifest["head"]:
+                        listed.add(manifest["head"])
+        segments_root = os.path.join(self.root, "segments")
+        for name in os.listdir(segments_root):
+            if name not in listed:
+                shutil.rmtree(os.path.join(segments_root, name), ignore_errors=True)
+
+    def _remove_unleased(self, path: str) -> bool:
+        """Delete a snapshot directory unless some process holds a reader lease on it"""
+        with open(os.path.join(path, "manifest.json")) as manifest:
+            try:
+                fcntl.flock(manifest, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return False
+            shutil.rmtree(path, ignore_errors=True)
+        return True
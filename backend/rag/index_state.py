@@ -0,0 +1,80 @@
+import numpy as np
+from typing import List, Dict, Any, Optional
+
+class IndexState:
+    """One published version of a vector store's in-process indexes
+
+    A state is never modified after it has been published. Searches read the store's
+    current state once and use only that object, so they take no locks and always see
+    BM25 rows, document ids and dense rows that belong together. Writers derive a new
+    SegmentedIndex version from the current one and publish it with one assignment.
+    """
+
+    __slots__ = (
+        "bm25", "documents", "document_ids", "rows", "dense", "dense_loaded",
+        "segments", "snapshot", "watermark", "generation", "_alignment"
+    )
+
+    def __init__(
+        self,
+        dense=None,
+        bm25=None,
+        documents: Optional[List[Any]] = None,
+        document_ids: Optional[List[str]] = None,
+        rows: Optional[Dict[str, int]] = None,
+        dense_loaded: bool = False,
+        segments=None,
+        snapshot=None,
+        watermark: Optional[str] = None,
+        generation: int = 0
+    ):
+        self.bm25 = bm25
+        self.documents = documents if documents is not None else []
+        self.document_ids = document_ids if document_ids is not None else []
+        # chunk_id -> BM25 row
+        self.rows = rows if rows is not None else {}
+        self.dense = dense
+        self.dense_loaded = dense_loaded
+        # SegmentedIndex serving the state (None before the first load)
+        self.segments = segments
+        # IndexSnapshot the segments are mapped from; holding it keeps the snapshot's reader lease
+        self.snapshot = snapshot
+        self.watermark = watermark
+        self.generation = generation
+        self._alignment = None
+
+    @property
+    def loaded(self) -> bool:
+        return self.bm25 is not None and (self.dense is None or self.dense_loaded)
+
+    @classmethod
+    def from_segments(
+        cls,
+        segments,
+        dense: bool,
+        watermark: Optional[str] = None,
+        generation: int = 0,
+        snapshot=None
+    ) -> "IndexState":
+        """State backed by a SegmentedIndex, which serves as BM25 index, row map and (optionally) dense index"""
+        return cls(
+            dense=segments if dense else None,
+            bm25=segments,
+            rows=segments.rows,
+            dense_loaded=dense,
+            segments=segments,
+            snapshot=snapshot,
+            watermark=watermark,
+            generation=generation
+        )
+
+    def bm25_alignment(self) -> np.ndarray:
+        """Map each dense index row to its BM25 document position (-1 when missing)"""
+        if self._alignment is None:
+            if self.dense is self.bm25 or self.document_ids is self.dense.ids:
+                alignment = np.arange(len(self.dense))
+            else:
+                alignment = np.array([self.rows.get(chunk_id, -1) for chunk_id in self.dense.ids], dtype=np.int64)
+            # Computed at most a few times per version; a racing reader just computes the same array
+            self._alignment = alignment
+        return self._alignment
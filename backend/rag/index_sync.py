@@ -0,0 +1,256 @@
+import os
+import time
+import fcntl
+import threading
+from datetime import datetime, timedelta
+from typing import Dict, Any, Optional, List
+
+class IndexSynchronizer:
+    """Keeps a HybridVectorStore's in-process indexes in sync with the embeddings collection
+
+    Modes:
+        listener  Firestore on_snapshot change stream (ADDED / MODIFIED / REMOVED)
+        poll      periodic queries on the indexed_at watermark plus the index_deletions log;
+                  works with every storage backend
+    """
+
+    def __init__(
+        self,
+        vector_store,
+        mode: str = "poll",
+        poll_interval: float = 5.0,
+        max_staleness: float = 30.0,
+        overlap_seconds: float = 5.0
+    ):
+        if mode not in ("listener", "poll"):
+            raise ValueError(f"Unknown sync mode '{mode}', expected 'listener' or 'poll'")
+        if mode == "listener" and not vector_store.storage.supports_listener:
+            print(f"⚠️ {vector_store.storage.name} storage has no change listener, falling back to polling")
+            mode = "poll"
+
+        self.vector_store = vector_store
+        self.mode = mode
+        self.poll_interval = poll_interval
+        self.max_staleness = max_staleness
+        # Re-read a small window behind the watermark to absorb clock skew between writers
+        self.overlap = timedelta(seconds=overlap_seconds)
+
+        self.watermark: Optional[str] = None
+        self.deletions_watermark: Optional[str] = None
+        self._thread = None
+        self._watch = None
+        self._stop = threading.Event()
+        self._sync_lock = threading.Lock()
+        self._leader_file = None
+
+        # Metrics
+        self.stats_data = {
+            "applied_inserts": 0,
+            "applied_deletes": 0,
+            "sync_runs": 0,
+            "errors": 0,
+            "last_sync_at": None,
+            "last_change_lag_seconds": None,
+            "last_error": None
+        }
+
+    def start(self):
+        """Start the background sync and attach it to the vector store"""
+        self.vector_store.synchronizer = self
+        if self.mode == "listener":
+            self._start_listener()
+        else:
+            self._thread = threading.Thread(target=self._poll_loop, name="index-sync", daemon=True)
+            self._thread.start()
+        print(f"🔄 Index sync started ({self.mode})")
+
+    def stop(self):
+        self._stop.set()
+        if self._watch is not None:
+            self._watch.unsubscribe()
+            self._watch = None
+        if self._thread is not None:
+            self._thread.join(timeout=self.poll_interval + 1)
+
+    def _is_leader(self) -> bool:
+        """With shared snapshots only one process per host applies changes; others just reopen"""
+        snapshot_store = self.vector_store.snapshot_store
+        if snapshot_store is None:
+            return True
+        if self._leader_file is None:
+            leader_file = open(os.path.join(snapshot_store.root, "SYNC_LEADER"), "a")
+            try:
+                fcntl.flock(leader_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                leader_file.close()
+                return False
+            self._leader_file = leader_file
+        return True
+
+    # Polling mode
+
+    def _poll_loop(self):
+        while not self._stop.wait(self.poll_interval):
+            self.sync_once()
+
+    def sync_once(self) -> bool:
+        """Fetch and apply changes since the watermarks; returns True on success"""
+        if not self._sync_lock.acquire(blocking=False):
+            # Another thread is already syncing; wait for it instead of duplicating the reads
+            with self._sync_lock:
+                return True
+        try:
+            store = self.vector_store
+            if not self._ready() or not self._is_leader():
+                self._record_success()
+                return True
+
+            since = self._rewind(self.watermark)
+            changed = [doc for _, doc in store.storage.stream(
+                store.embeddings_collection, [("indexed_at", ">", since)], order_by="indexed_at"
+            )]
+
+            deletion_since = self._rewind(self.deletions_watermark)
+            deletions = [doc for _, doc in store.storage.stream(
+                store.deletions_collection, [("deleted_at", ">", deletion_since)], order_by="deleted_at"
+            )]
+
+            # The overlap window re-reads recent docs; skip the ones already applied. Chunk ids
+            # are deterministic and re-indexing overwrites them in place, so a known id written
+            # after the watermark is a new version and is applied as an upsert.
+            known = store.indexed_chunk_ids([doc["chunk_id"] for doc in changed])
+            upserts = [
+                doc for doc in changed
+                if doc["chunk_id"] not in known or (doc.get("indexed_at") or "") > (self.watermark or "")
+            ]
+            deleted_candidates = [chunk_id for d in deletions for chunk_id in d.get("chunk_ids", [])]
+            deleted_ids = list(store.indexed_chunk_ids(deleted_candidates))
+
+            self._apply(upserts, deleted_ids)
+
+            if changed:
+                self.watermark = max(self.watermark, changed[-1]["indexed_at"])
+            if deletions:
+                self.deletions_watermark = max(self.deletions_watermark, deletions[-1]["deleted_at"])
+            self._record_success()
+            return True
+
+        except Exception as e:
+            self._record_error(e)
+            return False
+        finally:
+            self._sync_lock.release()
+
+    def _ready(self) -> bool:
+        """Changes before the first full index load are picked up by that load itself"""
+        if self.vector_store.bm25_index is None:
+            return False
+        if self.watermark is None:
+            self.watermark = self.vector_store.loaded_watermark or ""
+            self.deletions_watermark = self.watermark
+        return True
+
+    def _rewind(self, watermark: str) -> str:
+        try:
+            return (datetime.fromisoformat(watermark) - self.overlap).isoformat()
+        except ValueError:
+            return watermark
+
+    # Listener mode
+
+    def _start_listener(self):
+        store = self.vector_store
+        self._watch = store.storage.watch(store.embeddings_collection, self._on_snapshot)
+
+    def _on_snapshot(self, collection_snapshot, changes, read_time):
+        """Firestore change-stream callback (runs on the listener thread)"""
+        try:
+            if not self._ready() or not self._is_leader():
+                self._record_success()
+                return
+
+            added, removed = [], []
+            for change in changes:
+                if change.type.name == "REMOVED":
+                    removed.append(change.document.id)
+                else:
+                    added.append(change.document.to_dict())
+
+            # The first callback replays the whole collection; skip rows already loaded
+            store = self.vector_store
+            known = store.indexed_chunk_ids([doc["chunk_id"] for doc in added])
+            upserts = [
+                doc for doc in added
+                if doc["chunk_id"] not in known or (doc.get("indexed_at") or "") > (self.watermark or "")
+            ]
+            self._apply(upserts, list(store.indexed_chunk_ids(removed)))
+
+            watermarks = [doc.get("indexed_at") for doc in added if doc.get("indexed_at")]
+            if watermarks:
+                self.watermark = max([self.watermark] + watermarks)
+            self._record_success()
+        except Exception as e:
+            self._record_error(e)
+
+    # Shared helpers
+
+    def _apply(self, upserts: List[Dict[str, Any]], deleted_ids: List[str]):
+        # Shard workers only index (and count) the docs of their own partition
+        partition_filter = self.vector_store.partition_filter
+        if partition_filter is not None:
+            upserts = [doc for doc in upserts if partition_filter(doc)]
+        if not upserts and not deleted_ids:
+            return
+        self.vector_store.apply_changes(upserts=upserts, deleted_ids=deleted_ids)
+        self.stats_data["applied_inserts"] += len(upserts)
+        self.stats_data["applied_deletes"] += len(deleted_ids)
+
+        # Replication lag: how long the newest applied change took to reach this node
+        newest = max((doc.get("indexed_at") for doc in upserts if doc.get("indexed_at")), default=None)
+        if newest:
+            lag = (datetime.utcnow() - datetime.fromisoformat(newest)).total_seconds()
+            self.stats_data["last_change_lag_seconds"] = max(lag, 0.0)
+        print(f"🔄 Index sync applied {len(upserts)} inserts, {len(deleted_ids)} deletes")
+
+    def _record_success(self):
+        self.stats_data["sync_runs"] += 1
+        self.stats_data["last_sync_at"] = time.time()
+
+    def _record_error(self, error: Exception):
+        self.stats_data["errors"] += 1
+        self.stats_data["last_error"] = str(error)
+        print(f"❌ Index sync error: {error}")
+
+    def staleness_seconds(self) -> Optional[float]:
+        """Seconds since the local indexes were last confirmed up to date"""
+        last_sync_at = self.stats_data["last_sync_at"]
+        return None if last_sync_at is None else time.time() - last_sync_at
+
+    def ensure_fresh(self):
+        """Bound staleness: synchronously catch up when the background sync has fallen behind"""
+        if self.mode != "poll":
+            # The listener pushes changes as they happen; re-subscribe if it has died
+            if not self._listener_active():
+                self._start_listener()
+            return
+        staleness = self.staleness_seconds()
+        if staleness is None or staleness > self.max_staleness:
+            self.sync_once()
+
+    def _listener_active(self) -> bool:
+        return self._watch is not None and getattr(self._watch, "is_active", True) is not False
+
+    def stats(self) -> Dict[str, Any]:
+        """Sync metrics for health/metrics endpoints"""
+        staleness = self.staleness_seconds()
+        if self.mode == "poll":
+            stale = staleness is None or staleness > self.max_staleness
+        else:
+            stale = not self._listener_active()
+        return {
+            "mode": self.mode,
+            "watermark": self.watermark,
+            "staleness_seconds": staleness,
+            "stale": stale,
+            **{k: v for k, v in self.stats_data.items() if k != "last_sync_at"}
+        }
@@ -0,0 +1,127 @@
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+from typing import List, Dict, Any, Optional
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS ingest_files (
+    path TEXT PRIMARY KEY,
+    content_hash TEXT NOT NULL,
+    file_size INTEGER NOT NULL,
+    status TEXT NOT NULL,
+    file_id TEXT NOT NULL,
+    document_id TEXT NOT NULL,
+    title TEXT NOT NULL,
+    class_name TEXT NOT NULL,
+    subject_name TEXT NOT NULL,
+    user_id TEXT NOT NULL,
+    total_chunks INTEGER NOT NULL DEFAULT 0,
+    chunks_committed INTEGER NOT NULL DEFAULT 0,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    completed_at REAL
+);
+CREATE INDEX IF NOT EXISTS ingest_files_hash ON ingest_files (content_hash, status);
+"""
+
+def content_hash(file_path: str, block_size: int = 1 << 20) -> str:
+    """SHA-256 of a file's bytes"""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+class IngestManifest:
+    """SQLite checkpoint store for directory ingestion (ingest_pdfs.py)
+
+    One row per PDF path with its content hash, the file_id/document_id its chunks are
+    stored under and how many chunks have been embedded and written, in order. A rerun
+    with --resume skips completed files and continues partial ones after the last
+    committed chunk; chunk ids are derived from the file_id, so nothing is duplicated.
+    Status is 'pending', 'embedding', 'completed' or 'failed'.
+    """
+
+    def __init__(self, path: str = "ingest_manifest.db"):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+
+    def _execute(self, sql: str, params: tuple = ()) -> sqlite3.Cursor:
+        with self._lock:
+            return self._conn.execute(sql, params)
+
+    def get(self, path: str) -> Optional[Dict[str, Any]]:
+        row = self._execute("SELECT * FROM ingest_files WHERE path = ?", (path,)).fetchone()
+        return dict(row) if row is not None else None
+
+    def completed_with_hash(self, digest: str) -> Optional[Dict[str, Any]]:
+        """A completed file with this content, under any path"""
+        row = self._execute(
+            "SELECT * FROM ingest_files WHERE content_hash = ? AND status = 'completed' LIMIT 1", (digest,)
+        ).fetchone()
+        return dict(row) if row is not None else None
+
+    def start(
+        self,
+        path: str,
+        digest: str,
+        file_size: int,
+        file_id: str,
+        document_id: str,
+        title: str,
+        class_name: str,
+        subject_name: str,
+        user_id: str
+    ) -> Dict[str, Any]:
+        """Record a file about to be ingested from its first chunk (replacing any earlier row)"""
+        now = time.time()
+        self._execute(
+            "INSERT OR REPLACE INTO ingest_files (path, content_hash, file_size, status, file_id, document_id, "
+            "title, class_name, subject_name, user_id, created_at, updated_at) "
+            "VALUES (?, ?, ?, 'pending', ?, ?, ?, ?, ?, ?, ?, ?)",
+            (path, digest, file_size, file_id, document_id, title, class_name, subject_name, user_id, now, now)
+        )
+        return self.get(path)
+
+    def begin_attempt(self, path: str, total_chunks: int, chunks_committed: int):
+        """File parsed: total_chunks to store, continuing after chunks_committed"""
+        self._execute(
+            "UPDATE ingest_files SET status = 'embedding', total_chunks = ?, chunks_committed = ?, "
+            "attempts = attempts + 1, error = NULL, updated_at = ? WHERE path = ?",
+            (total_chunks, chunks_committed, time.time(), path)
+        )
+
+    def commit_chunks(self, path: str, chunks: int):
+        """chunks more chunks have been embedded and written"""
+        self._execute(
+            "UPDATE ingest_files SET chunks_committed = chunks_committed + ?, updated_at = ? WHERE path = ?",
+            (chunks, time.time(), path)
+        )
+
+    def finish(self, path: str, error: Optional[str] = None):
+        now = time.time()
+        self._execute(
+            "UPDATE ingest_files SET status = ?, error = ?, updated_at = ?, completed_at = ? WHERE path = ?",
+            ("failed" if error else "completed", error, now, None if error else now, path)
+        )
+
+    def list(self, paths: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        rows = self._execute("SELECT * FROM ingest_files ORDER BY path").fetchall()
+        if paths is not None:
+            wanted = set(paths)
+            rows = [row for row in rows if row["path"] in wanted]
+        return [dict(row) for row in rows]
+
+    def counts(self) -> Dict[str, int]:
+        rows = self._execute("SELECT status, COUNT(*) AS n FROM ingest_files GROUP BY status").fetchall()
+        return {row["status"]: row["n"] for row in rows}
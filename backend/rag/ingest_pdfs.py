@@ -1,12 +1,16 @@
 #!/usr/bin/env python3
 """
 PDF Directory Ingestion Script
-Ingests all PDF files from a directory into cloud storage and creates vector embeddings
+Ingests all PDF files from a directory into cloud storage and creates vector embeddings.
+Progress is checkpointed per file in a local manifest: --resume skips completed files and
+continues partial ones, --dry-run estimates embedding calls and cost without calling Gemini.
 """
 
 import os
 import sys
 import glob
+import math
+import uuid
 from pathlib import Path
 from typing import List, Dict, Any
 import argparse
@@ -16,23 +20,44 @@ from datetime import datetime
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 from document_processor import DocumentProcessor
-from hybrid_vector_store import HybridVectorStore
+from document_archive import create_document_archive
+from ingest_manifest import IngestManifest, content_hash
 from models import DocumentChunk
 
+# Rough token count of chunk text for --dry-run cost estimates
+CHARS_PER_TOKEN = 4
+
 class PDFIngestionPipeline:
     """Pipeline for ingesting PDF files from a directory"""
     
-    def __init__(self, project_id: str):
+    def __init__(self, project_id: str, manifest_path: str = "ingest_manifest.db", dry_run: bool = False):
         self.project_id = project_id
-        self.document_processor = DocumentProcessor(project_id)
-        self.vector_store = HybridVectorStore(project_id)
+        self.dry_run = dry_run
+        self.manifest = IngestManifest(manifest_path)
+        
+        # A dry run only parses and counts chunks; it never touches storage, the archive or Gemini
+        if dry_run:
+            self.vector_store = None
+            self.embed_batch_size = int(os.environ.get("RAG_INGEST_EMBED_BATCH", "50"))
+            self.document_processor = DocumentProcessor(project_id)
+        else:
+            from hybrid_vector_store import HybridVectorStore
+            self.vector_store = HybridVectorStore(project_id)
+            self.embed_batch_size = self.vector_store.ingest_embed_batch_size
+            self.document_processor = DocumentProcessor(
+                project_id, archive=create_document_archive(self.vector_store.bucket)
+            )
         
         # Statistics
         self.stats = {
             "total_files": 0,
             "processed_files": 0,
+            "skipped_files": 0,
+            "resumed_files": 0,
             "failed_files": 0,
             "total_chunks": 0,
+            "embedding_calls": 0,
+            "estimated_tokens": 0,
             "start_time": None,
             "end_time": None
         }
@@ -71,14 +96,17 @@ class PDFIngestionPipeline:
             "subject_name": subject_name
         }
     
-    def process_single_pdf(self, file_path: str, user_id: str = "default") -> Dict[str, Any]:
-        """Process a single PDF file"""
+    def process_single_pdf(self, file_path: str, user_id: str = "default", resume: bool = False) -> Dict[str, Any]:
+        """Process a single PDF file, checkpointing committed chunks in the manifest"""
+        path = os.path.abspath(file_path)
+        record = None
         try:
             print(f"Processing: {file_path}")
             
             # Read file content
             with open(file_path, 'rb') as f:
                 file_content = f.read()
+            digest = content_hash(path)
             
             # Extract metadata from path
             metadata = self.extract_metadata_from_path(file_path)
@@ -87,45 +115,98 @@ class PDFIngestionPipeline:
             
             # Use filename as title
             title = Path(file_path).stem
+            summary = {"success": True, "file_path": file_path, "title": title, "class_name": class_name, "subject_name": subject_name}
             
-            # Process PDF
+            if resume:
+                record = self.manifest.get(path)
+                if record is not None and record["content_hash"] != digest:
+                    # Changed since the last run: its old chunks are replaced, not kept alongside
+                    print(f"  ⚠️ Changed since last run, re-ingesting (old file ID {record['file_id']})")
+                    if not self.dry_run and record["chunks_committed"]:
+                        self.vector_store.delete_chunks_by_file_id(record["file_id"])
+                    record = None
+                if record is not None and record["status"] == "completed":
+                    print(f"  ⏭️ Already ingested: {record['chunks_committed']} chunks, File ID: {record['file_id']}")
+                    return {**summary, "skipped": True, "file_id": record["file_id"], "chunks_count": 0}
+                duplicate = self.manifest.completed_with_hash(digest) if record is None else None
+                if duplicate is not None:
+                    print(f"  ⏭️ Same content as {duplicate['path']}, skipping")
+                    return {**summary, "skipped": True, "file_id": duplicate["file_id"], "chunks_count": 0}
+            
+            if record is not None:
+                file_id, document_id, committed = record["file_id"], record["document_id"], record["chunks_committed"]
+            else:
+                file_id, document_id, committed = str(uuid.uuid4()), str(uuid.uuid4()), 0
+                if not self.dry_run:
+                    record = self.manifest.start(
+                        path, digest, len(file_content), file_id, document_id, title, class_name, subject_name, user_id
+                    )
+            
+            # Process PDF (chunk ids are derived from file_id, so a resumed file gets the same ones)
             result = self.document_processor.process_pdf_file(
                 file_content=file_content,
                 title=title,
                 class_name=class_name,
                 subject_name=subject_name,
-                user_id=user_id
+                user_id=user_id,
+                file_id=file_id,
+                document_id=document_id
             )
+            chunks = result["chunks"]
+            if committed and (record["total_chunks"] != len(chunks) or committed > len(chunks)):
+                # Chunking changed since the checkpoint (parser or RAG_HIERARCHICAL): start the file over
+                print("  ⚠️ Chunking changed since last run, restarting file")
+                if not self.dry_run:
+                    self.vector_store.delete_chunks_by_file_id(file_id)
+                committed = 0
+            remaining = chunks[committed:]
+            embedding_calls = math.ceil(len(remaining) / self.embed_batch_size)
+            estimated_tokens = sum(len(chunk.content) for chunk in remaining) // CHARS_PER_TOKEN
+            summary.update({
+                "file_id": file_id,
+                "resumed": committed > 0,
+                "chunks_count": len(remaining),
+                "embedding_calls": embedding_calls,
+                "estimated_tokens": estimated_tokens,
+                "total_text_length": result["total_text_length"]
+            })
+            
+            if self.dry_run:
+                print(f"  🔍 {len(remaining)} chunks to embed ({committed} already committed), {embedding_calls} embedding calls")
+                return summary
+            
+            if committed:
+                print(f"  🔄 Resuming after chunk {committed}/{len(chunks)}")
+            self.manifest.begin_attempt(path, len(chunks), committed)
             
-            # Store chunks with embeddings
-            chunk_ids = self.vector_store.store_chunks(result["chunks"])
+            # Store chunks with embeddings; each embedded group is checkpointed once written
+            self.vector_store.store_chunks_batched(
+                remaining,
+                parents=result["parents"],
+                progress=lambda group: self.manifest.commit_chunks(path, len(group))
+            )
+            self.manifest.finish(path)
             
             print(f"  ✅ Processed: {title}")
             print(f"     Class: {class_name}, Subject: {subject_name}")
-            print(f"     Chunks: {len(chunk_ids)}, File ID: {result['file_id']}")
+            print(f"     Chunks: {len(chunks)}, File ID: {file_id}")
             
-            return {
-                "success": True,
-                "file_path": file_path,
-                "file_id": result["file_id"],
-                "title": title,
-                "class_name": class_name,
-                "subject_name": subject_name,
-                "chunks_count": len(chunk_ids),
-                "total_text_length": result["total_text_length"]
-            }
+            return summary
             
         except Exception as e:
             print(f"  ❌ Failed: {file_path} - {str(e)}")
+            if record is not None and not self.dry_run:
+                self.manifest.finish(path, error=str(e))
             return {
                 "success": False,
                 "file_path": file_path,
                 "error": str(e)
             }
     
-    def ingest_directory(self, directory: str, user_id: str = "default") -> Dict[str, Any]:
-        """Ingest all PDF files from a directory"""
-        print(f"Starting PDF ingestion from: {directory}")
+    def ingest_directory(self, directory: str, user_id: str = "default", resume: bool = False) -> Dict[str, Any]:
+        """Ingest all PDF files from a directory; resume=True continues from the manifest"""
+        mode = "dry run" if self.dry_run else "resume" if resume else "fresh"
+        print(f"Starting PDF ingestion from: {directory} ({mode}, manifest: {self.manifest.path})")
         print("=" * 60)
         
         # Get all PDF files
@@ -138,20 +219,29 @@ class PDFIngestionPipeline:
             return self.stats
         
         print(f"Found {len(pdf_files)} PDF files")
+        if not resume:
+            known = [r for r in self.manifest.list([os.path.abspath(p) for p in pdf_files]) if r["chunks_committed"]]
+            if known:
+                print(f"⚠️ {len(known)} of these files were ingested before; without --resume they are stored again")
         print()
         
         # Process each file
         results = []
         for i, file_path in enumerate(pdf_files, 1):
             print(f"[{i}/{len(pdf_files)}] ", end="")
-            result = self.process_single_pdf(file_path, user_id)
+            result = self.process_single_pdf(file_path, user_id, resume=resume)
             results.append(result)
             
-            if result["success"]:
+            if not result["success"]:
+                self.stats["failed_files"] += 1
+            elif result.get("skipped"):
+                self.stats["skipped_files"] += 1
+            else:
                 self.stats["processed_files"] += 1
+                self.stats["resumed_files"] += int(result["resumed"])
                 self.stats["total_chunks"] += result["chunks_count"]
-            else:
-                self.stats["failed_files"] += 1
+                self.stats["embedding_calls"] += result["embedding_calls"]
+                self.stats["estimated_tokens"] += result["estimated_tokens"]
         
         self.stats["end_time"] = datetime.now()
         
@@ -169,15 +259,17 @@ class PDFIngestionPipeline:
         duration = self.stats["end_time"] - self.stats["start_time"]
         
         print(f"Total files: {self.stats['total_files']}")
-        print(f"Processed: {self.stats['processed_files']}")
+        print(f"Processed: {self.stats['processed_files']} ({self.stats['resumed_files']} resumed)")
+        print(f"Skipped (already ingested): {self.stats['skipped_files']}")
         print(f"Failed: {self.stats['failed_files']}")
         print(f"Total chunks: {self.stats['total_chunks']}")
+        print(f"Embedding calls: {self.stats['embedding_calls']} (batches of {self.embed_batch_size})")
         print(f"Duration: {duration}")
         
         # Group by class and subject
         class_subject_stats = {}
         for result in results:
-            if result["success"]:
+            if result["success"] and not result.get("skipped"):
                 key = f"{result['class_name']} - {result['subject_name']}"
                 if key not in class_subject_stats:
                     class_subject_stats[key] = {"files": 0, "chunks": 0}
@@ -202,6 +294,10 @@ def main():
     parser.add_argument("directory", help="Directory containing PDF files")
     parser.add_argument("--user-id", default="default", help="User ID for the files")
     parser.add_argument("--project-id", help="Google Cloud Project ID")
+    parser.add_argument("--manifest", default="ingest_manifest.db", help="Checkpoint database recording per-file progress")
+    parser.add_argument("--resume", action="store_true", help="Skip files completed in an earlier run and continue partial ones")
+    parser.add_argument("--dry-run", action="store_true", help="Parse and count chunks, estimate embedding calls and cost; store nothing")
+    parser.add_argument("--cost-per-million-tokens", type=float, default=0.15, help="Embedding price (USD per 1M input tokens) for --dry-run")
     
     args = parser.parse_args()
     
@@ -211,7 +307,7 @@ def main():
         sys.exit(1)
     
     # Get project ID
-    project_id = args.project_id or os.environ.get("GOOGLE_CLOUD_PROJECT")
+    project_id = args.project_id or os.environ.get("GOOGLE_CLOUD_PROJECT") or ("dry-run" if args.dry_run else None)
     if not project_id:
         print("Error: Google Cloud Project ID not provided")
         print("Set GOOGLE_CLOUD_PROJECT environment variable or use --project-id")
@@ -221,16 +317,22 @@ def main():
     required_vars = ["GOOGLE_APPLICATION_CREDENTIALS", "GEMINI_API_KEY"]
     missing_vars = [var for var in required_vars if not os.getenv(var)]
     
-    if missing_vars:
+    if missing_vars and not args.dry_run:
         print("Error: Missing required environment variables:")
         for var in missing_vars:
             print(f"  - {var}")
         sys.exit(1)
     
     # Create and run pipeline
-    pipeline = PDFIngestionPipeline(project_id)
-    stats = pipeline.ingest_directory(args.directory, args.user_id)
+    pipeline = PDFIngestionPipeline(project_id, manifest_path=args.manifest, dry_run=args.dry_run)
+    stats = pipeline.ingest_directory(args.directory, args.user_id, resume=args.resume)
     
+    if args.dry_run:
+        cost = stats["estimated_tokens"] / 1e6 * args.cost_per_million_tokens
+        print(f"\n🔍 Dry run: {stats['total_chunks']} chunks in {stats['processed_files']} files would need "
+              f"{stats['embedding_calls']} embedding calls, ~{stats['estimated_tokens']:,} tokens, "
+              f"~${cost:.2f} at ${args.cost_per_million_tokens}/1M tokens")
+        return
     print(f"\nIngestion completed with {stats['processed_files']} files processed")
 
 if __name__ == "__main__":
@@ -0,0 +1,414 @@
+import io
+import os
+import json
+import time
+import uuid
+import sqlite3
+import zipfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Optional
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS ingestion_jobs (
+    id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    stage TEXT NOT NULL,
+    title TEXT NOT NULL,
+    class_name TEXT NOT NULL,
+    subject_name TEXT NOT NULL,
+    user_id TEXT NOT NULL,
+    batch_id TEXT,
+    file_path TEXT,
+    file_size INTEGER NOT NULL DEFAULT 0,
+    file_id TEXT NOT NULL,
+    document_id TEXT NOT NULL,
+    total_chunks INTEGER NOT NULL DEFAULT 0,
+    chunks_done INTEGER NOT NULL DEFAULT 0,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    worker_pid INTEGER,
+    error TEXT,
+    result TEXT,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    embedding_started_at REAL,
+    updated_at REAL NOT NULL,
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS ingestion_jobs_status ON ingestion_jobs (status, created_at);
+"""
+
+# Columns added after the first release, applied to existing job databases on open
+_MIGRATIONS = {
+    "batch_id": "ALTER TABLE ingestion_jobs ADD COLUMN batch_id TEXT"
+}
+
+def pdfs_from_upload(filename: str, content: bytes, max_bytes: int) -> List[Dict[str, Any]]:
+    """Upload contents as (file_content, title) dicts; a .zip contributes every PDF inside it"""
+    name = os.path.basename(filename or "")
+    if name.lower().endswith(".pdf"):
+        return [{"file_content": content, "title": os.path.splitext(name)[0]}]
+    if not name.lower().endswith(".zip"):
+        raise ValueError(f"{name}: only PDF and zip files are supported")
+
+    with zipfile.ZipFile(io.BytesIO(content)) as archive:
+        members = [
+            m for m in archive.infolist()
+            if not m.is_dir() and m.filename.lower().endswith(".pdf") and not m.filename.startswith("__MACOSX/")
+        ]
+        # Check declared sizes before inflating anything
+        if sum(m.file_size for m in members) > max_bytes:
+            raise ValueError(f"{name}: uncompressed PDFs exceed {max_bytes} bytes")
+        return [
+            {"file_content": archive.read(m), "title": os.path.splitext(os.path.basename(m.filename))[0]}
+            for m in sorted(members, key=lambda m: m.filename)
+        ]
+
+def _pid_alive(pid: Optional[int]) -> bool:
+    if not pid:
+        return False
+    try:
+        os.kill(pid, 0)
+        return True
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+
+class JobStore:
+    """SQLite-backed ingestion job table shared by every server process on the host
+
+    WAL mode lets the status endpoints read while workers write progress. Jobs are
+    claimed with a conditional UPDATE so a job is only ever run by one process.
+    """
+
+    def __init__(self, path: str = "ingestion_jobs.db"):
+        self.path = path
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+        columns = {row["name"] for row in self._conn.execute("PRAGMA table_info(ingestion_jobs)")}
+        for column, statement in _MIGRATIONS.items():
+            if column not in columns:
+                self._conn.execute(statement)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS ingestion_jobs_batch ON ingestion_jobs (batch_id)")
+
+    def _execute(self, sql: str, params: tuple = ()) -> sqlite3.Cursor:
+        with self._lock:
+            return self._conn.execute(sql, params)
+
+    def create(
+        self,
+        title: str,
+        class_name: str,
+        subject_name: str,
+        user_id: str,
+        file_path: str,
+        file_size: int,
+        job_id: Optional[str] = None,
+        batch_id: Optional[str] = None
+    ) -> Dict[str, Any]:
+        now = time.time()
+        job_id = job_id or str(uuid.uuid4())
+        self._execute(
+            "INSERT INTO ingestion_jobs (id, status, stage, title, class_name, subject_name, user_id, "
+            "batch_id, file_path, file_size, file_id, document_id, created_at, updated_at) "
+            "VALUES (?, 'queued', 'queued', ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (job_id, title, class_name, subject_name, user_id, batch_id, file_path, file_size,
+             str(uuid.uuid4()), str(uuid.uuid4()), now, now)
+        )
+        return self.get(job_id)
+
+    def claim(self, job_id: str) -> bool:
+        """Mark a queued job as running in this process; False if another worker has it"""
+        now = time.time()
+        cursor = self._execute(
+            "UPDATE ingestion_jobs SET status = 'running', worker_pid = ?, attempts = attempts + 1, "
+            "started_at = ?, updated_at = ?, chunks_done = 0, embedding_started_at = NULL, error = NULL "
+            "WHERE id = ? AND status = 'queued'",
+            (os.getpid(), now, now, job_id)
+        )
+        return cursor.rowcount == 1
+
+    def set_progress(self, job_id: str, stage: str, chunks_done: int, total_chunks: int):
+        now = time.time()
+        self._execute(
+            "UPDATE ingestion_jobs SET stage = ?, chunks_done = ?, total_chunks = ?, updated_at = ?, "
+            "embedding_started_at = CASE WHEN ? = 'embedding' AND embedding_started_at IS NULL "
+            "THEN ? ELSE embedding_started_at END WHERE id = ?",
+            (stage, chunks_done, total_chunks, now, stage, now, job_id)
+        )
+
+    def finish(self, job_id: str, result: Optional[Dict[str, Any]] = None, error: Optional[str] = None):
+        now = time.time()
+        self._execute(
+            "UPDATE ingestion_jobs SET status = ?, stage = ?, result = ?, error = ?, file_path = NULL, "
+            "updated_at = ?, finished_at = ? WHERE id = ?",
+            ("failed" if error else "completed", "failed" if error else "done",
+             json.dumps(result) if result is not None else None, error, now, now, job_id)
+        )
+
+    def requeue_orphans(self) -> List[str]:
+        """Jobs left queued, or running in a process that no longer exists, back to queued"""
+        rows = self._execute(
+            "SELECT id, status, worker_pid FROM ingestion_jobs WHERE status IN ('queued', 'running') "
+            "ORDER BY created_at"
+        ).fetchall()
+        orphans = []
+        for row in rows:
+            if row["status"] == "running":
+                if _pid_alive(row["worker_pid"]) and row["worker_pid"] != os.getpid():
+                    continue
+                self._execute(
+                    "UPDATE ingestion_jobs SET status = 'queued', stage = 'queued', updated_at = ? "
+                    "WHERE id = ? AND status = 'running'",
+                    (time.time(), row["id"])
+                )
+            orphans.append(row["id"])
+        return orphans
+
+    def record(self, job_id: str) -> Optional[sqlite3.Row]:
+        """Raw row, including the spooled file path, for the worker running the job"""
+        return self._execute("SELECT * FROM ingestion_jobs WHERE id = ?", (job_id,)).fetchone()
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        row = self.record(job_id)
+        return self._to_dict(row) if row is not None else None
+
+    def list(
+        self,
+        status: Optional[str] = None,
+        limit: int = 50,
+        batch_id: Optional[str] = None
+    ) -> List[Dict[str, Any]]:
+        clauses, params = [], []
+        if status:
+            clauses.append("status = ?")
+            params.append(status)
+        if batch_id:
+            clauses.append("batch_id = ?")
+            params.append(batch_id)
+        where = f"WHERE {' AND '.join(clauses)} " if clauses else ""
+        rows = self._execute(
+            f"SELECT * FROM ingestion_jobs {where}ORDER BY created_at DESC LIMIT ?", tuple(params) + (limit,)
+        ).fetchall()
+        return [self._to_dict(row) for row in rows]
+
+    def counts(self) -> Dict[str, int]:
+        rows = self._execute("SELECT status, COUNT(*) AS n FROM ingestion_jobs GROUP BY status").fetchall()
+        return {row["status"]: row["n"] for row in rows}
+
+    @staticmethod
+    def _to_dict(row: sqlite3.Row) -> Dict[str, Any]:
+        job = dict(row)
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        job.pop("file_path", None)
+        job.pop("worker_pid", None)
+
+        # Throughput covers the embedding stage, which dominates ingestion time
+        embedding_started = job.pop("embedding_started_at")
+        end = job["finished_at"] or job["updated_at"]
+        elapsed = end - embedding_started if embedding_started else 0.0
+        job["chunks_per_second"] = round(job["chunks_done"] / elapsed, 3) if elapsed > 0 else None
+        job["progress"] = round(job["chunks_done"] / job["total_chunks"], 3) if job["total_chunks"] else 0.0
+        job["elapsed_seconds"] = round(end - job["started_at"], 3) if job["started_at"] else None
+        return job
+
+class IngestionQueue:
+    """Runs PDF uploads in the background on a bounded worker pool
+
+    Uploaded bytes are spooled to upload_dir and the job row is written before the upload
+    returns, so queued and interrupted jobs are picked up again by resume() after a restart.
+    workflow may be a zero-argument factory, called by the first job that needs it.
+    """
+
+    def __init__(
+        self,
+        workflow,
+        store: Optional[JobStore] = None,
+        upload_dir: str = "ingestion_uploads",
+        max_workers: int = 2
+    ):
+        self._workflow = workflow
+        self.store = store or JobStore()
+        self.upload_dir = upload_dir
+        self.max_workers = max_workers
+        os.makedirs(upload_dir, exist_ok=True)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="ingest")
+        self._active = 0
+        self._queued = 0
+        self._active_lock = threading.Lock()
+
+    @property
+    def workflow(self):
+        return self._workflow() if callable(self._workflow) else self._workflow
+
+    @classmethod
+    def from_env(cls, workflow) -> "IngestionQueue":
+        return cls(
+            workflow,
+            store=JobStore(os.environ.get("RAG_JOB_DB", "ingestion_jobs.db")),
+            upload_dir=os.environ.get("RAG_JOB_UPLOAD_DIR", "ingestion_uploads"),
+            max_workers=int(os.environ.get("RAG_INGEST_WORKERS", "2"))
+        )
+
+    def submit(
+        self,
+        file_content: bytes,
+        title: str,
+        class_name: str,
+        subject_name: str,
+        user_id: str = "default"
+    ) -> Dict[str, Any]:
+        """Spool the PDF, record the job and queue it; returns the job immediately"""
+        job_id = str(uuid.uuid4())
+        file_path = os.path.join(self.upload_dir, f"{job_id}.pdf")
+        with open(file_path, "wb") as f:
+            f.write(file_content)
+        job = self.store.create(title, class_name, subject_name, user_id, file_path, len(file_content), job_id=job_id)
+        self._enqueue(self._run, job_id, jobs=1)
+        return job
+
+    def submit_batch(
+        self,
+        files: List[Dict[str, Any]],
+        class_name: str,
+        subject_name: str,
+        user_id: str = "default"
+    ) -> Dict[str, Any]:
+        """Queue several PDFs (dicts with file_content and title) to be processed together
+
+        Each file gets its own job row under a shared batch_id. A batch interrupted by a
+        restart is resumed file by file.
+        """
+        batch_id = str(uuid.uuid4())
+        jobs = []
+        for f in files:
+            job_id = str(uuid.uuid4())
+            file_path = os.path.join(self.upload_dir, f"{job_id}.pdf")
+            with open(file_path, "wb") as out:
+                out.write(f["file_content"])
+            jobs.append(self.store.create(
+                f["title"], class_name, subject_name, user_id, file_path, len(f["file_content"]),
+                job_id=job_id, batch_id=batch_id
+            ))
+        self._enqueue(self._run_batch, [job["id"] for job in jobs], jobs=len(jobs))
+        return {"batch_id": batch_id, "jobs": jobs}
+
+    def resume(self) -> int:
+        """Re-queue jobs that were waiting or interrupted when the previous process stopped"""
+        job_ids = self.store.requeue_orphans()
+        for job_id in job_ids:
+            self._enqueue(self._run, job_id, jobs=1)
+        if job_ids:
+            print(f"🔄 Resuming {len(job_ids)} ingestion jobs")
+        return len(job_ids)
+
+    @property
+    def backlog(self) -> int:
+        """Jobs accepted by this process that no worker has started yet"""
+        with self._active_lock:
+            return self._queued
+
+    def _enqueue(self, fn, arg, jobs: int):
+        with self._active_lock:
+            self._queued += jobs
+        self._executor.submit(fn, arg)
+
+    def _dequeue(self, jobs: int):
+        with self._active_lock:
+            self._queued -= jobs
+
+    def shutdown(self, wait: bool = False):
+        # Unfinished jobs stay 'running' in the store and are re-queued by the next resume()
+        self._executor.shutdown(wait=wait, cancel_futures=True)
+
+    def _run(self, job_id: str):
+        self._dequeue(1)
+        if not self.store.claim(job_id):
+            return
+        with self._active_lock:
+            self._active += 1
+        row = self.store.record(job_id)
+        try:
+            # A retried job may have stored some chunks before it was interrupted
+            if row["attempts"] > 1:
+                self.workflow.delete_file(row["file_id"])
+
+            with open(row["file_path"], "rb") as f:
+                file_content = f.read()
+
+            result = self.workflow.process_pdf_upload(
+                file_content=file_content,
+                title=row["title"],
+                class_name=row["class_name"],
+                subject_name=row["subject_name"],
+                user_id=row["user_id"],
+                progress=lambda stage, done, total: self.store.set_progress(job_id, stage, done, total),
+                file_id=row["file_id"],
+                document_id=row["document_id"]
+            )
+            result.pop("chunk_ids", None)
+            self.store.finish(job_id, result=result)
+            print(f"✅ Ingestion job {job_id} completed ({result['total_chunks']} chunks)")
+        except Exception as e:
+            print(f"❌ Ingestion job {job_id} failed: {e}")
+            self.store.finish(job_id, error=str(e))
+        finally:
+            with self._active_lock:
+                self._active -= 1
+            if row["file_path"] and os.path.exists(row["file_path"]):
+                os.remove(row["file_path"])
+
+    def _run_batch(self, job_ids: List[str]):
+        self._dequeue(len(job_ids))
+        rows = [self.store.record(job_id) for job_id in job_ids if self.store.claim(job_id)]
+        if not rows:
+            return
+        with self._active_lock:
+            self._active += 1
+        try:
+            files = []
+            for row in rows:
+                with open(row["file_path"], "rb") as f:
+                    files.append({
+                        "file_content": f.read(),
+                        "title": row["title"],
+                        "file_id": row["file_id"],
+                        "document_id": row["document_id"]
+                    })
+
+            first = rows[0]
+            results = self.workflow.process_pdf_batch(
+                files,
+                class_name=first["class_name"],
+                subject_name=first["subject_name"],
+                user_id=first["user_id"],
+                progress=lambda position, stage, done, total: self.store.set_progress(
+                    rows[position]["id"], stage, done, total
+                )
+            )
+            for row, result in zip(rows, results):
+                self.store.finish(row["id"], result=result if "error" not in result else None, error=result.get("error"))
+            failed = sum(1 for result in results if "error" in result)
+            print(f"✅ Ingestion batch finished: {len(rows) - failed} stored, {failed} failed")
+        except Exception as e:
+            print(f"❌ Ingestion batch failed: {e}")
+            for row in rows:
+                self.store.finish(row["id"], error=str(e))
+        finally:
+            with self._active_lock:
+                self._active -= 1
+            for row in rows:
+                if row["file_path"] and os.path.exists(row["file_path"]):
+                    os.remove(row["file_path"])
+
+    def stats(self) -> Dict[str, Any]:
+        with self._active_lock:
+            active = self._active
+        return {"workers": self.max_workers, "active": active, "backlog": self.backlog, "jobs": self.store.counts()}
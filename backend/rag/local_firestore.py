@@ -0,0 +1,164 @@
+import threading
+import uuid
+from typing import List, Dict, Any, Optional, Tuple
+
+class LocalDocumentSnapshot:
+    """Mirror of google.cloud.firestore.DocumentSnapshot"""
+
+    def __init__(self, reference: "LocalDocumentReference", data: Optional[Dict[str, Any]]):
+        self.reference = reference
+        self.id = reference.id
+        self._data = data
+
+    @property
+    def exists(self) -> bool:
+        return self._data is not None
+
+    def to_dict(self) -> Optional[Dict[str, Any]]:
+        return dict(self._data) if self._data is not None else None
+
+    def get(self, field: str) -> Any:
+        return (self._data or {}).get(field)
+
+class LocalDocumentReference:
+    """Mirror of google.cloud.firestore.DocumentReference"""
+
+    def __init__(self, collection: "LocalCollectionReference", doc_id: str):
+        self.collection = collection
+        self.id = doc_id
+
+    def set(self, data: Dict[str, Any], merge: bool = False):
+        with self.collection.db.lock:
+            docs = self.collection._docs
+            if merge and self.id in docs:
+                docs[self.id] = {**docs[self.id], **data}
+            else:
+                docs[self.id] = dict(data)
+
+    def update(self, data: Dict[str, Any]):
+        with self.collection.db.lock:
+            if self.id not in self.collection._docs:
+                raise KeyError(f"No document to update: {self.collection.name}/{self.id}")
+            self.collection._docs[self.id].update(data)
+
+    def get(self) -> LocalDocumentSnapshot:
+        with self.collection.db.lock:
+            data = self.collection._docs.get(self.id)
+            return LocalDocumentSnapshot(self, dict(data) if data is not None else None)
+
+    def delete(self):
+        with self.collection.db.lock:
+            self.collection._docs.pop(self.id, None)
+
+_OPERATORS = {
+    "==": lambda a, b: a == b,
+    "!=": lambda a, b: a != b,
+    "<": lambda a, b: a is not None and a < b,
+    "<=": lambda a, b: a is not None and a <= b,
+    ">": lambda a, b: a is not None and a > b,
+    ">=": lambda a, b: a is not None and a >= b,
+    "in": lambda a, b: a in b,
+    "not-in": lambda a, b: a not in b,
+    "array_contains": lambda a, b: isinstance(a, list) and b in a,
+    "array_contains_any": lambda a, b: isinstance(a, list) and any(v in a for v in b),
+}
+
+class LocalQuery:
+    """Subset of the Firestore query API used by this codebase: where / order_by / limit / stream"""
+
+    def __init__(
+        self,
+        collection: "LocalCollectionReference",
+        filters: Tuple = (),
+        orders: Tuple = (),
+        limit_count: Optional[int] = None
+    ):
+        self.collection = collection
+        self.filters = filters
+        self.orders = orders
+        self.limit_count = limit_count
+
+    def where(self, field: str, op: str, value: Any) -> "LocalQuery":
+        if op not in _OPERATORS:
+            raise ValueError(f"Unsupported operator: {op}")
+        return LocalQuery(self.collection, self.filters + ((field, op, value),), self.orders, self.limit_count)
+
+    def order_by(self, field: str, direction: str = "ASCENDING") -> "LocalQuery":
+        return LocalQuery(self.collection, self.filters, self.orders + ((field, direction),), self.limit_count)
+
+    def limit(self, count: int) -> "LocalQuery":
+        return LocalQuery(self.collection, self.filters, self.orders, count)
+
+    def stream(self):
+        with self.collection.db.lock:
+            items = [(doc_id, dict(data)) for doc_id, data in self.collection._docs.items()]
+        matches = [
+            (doc_id, data) for doc_id, data in items
+            if all(_OPERATORS[op](data.get(field), value) for field, op, value in self.filters)
+        ]
+        for field, direction in reversed(self.orders):
+            # Firestore drops documents missing an order_by field
+            matches = [m for m in matches if m[1].get(field) is not None]
+            matches.sort(key=lambda m: m[1][field], reverse=str(direction).upper().startswith("DESC"))
+        if self.limit_count is not None:
+            matches = matches[:self.limit_count]
+        for doc_id, data in matches:
+            yield LocalDocumentSnapshot(LocalDocumentReference(self.collection, doc_id), data)
+
+    def get(self) -> List[LocalDocumentSnapshot]:
+        return list(self.stream())
+
+class LocalCollectionReference(LocalQuery):
+    """Mirror of google.cloud.firestore.CollectionReference"""
+
+    def __init__(self, db: "LocalFirestore", name: str):
+        self.db = db
+        self.name = name
+        self._docs: Dict[str, Dict[str, Any]] = {}
+        super().__init__(self)
+
+    def document(self, doc_id: Optional[str] = None) -> LocalDocumentReference:
+        return LocalDocumentReference(self, doc_id or uuid.uuid4().hex)
+
+    def add(self, data: Dict[str, Any]) -> Tuple[None, LocalDocumentReference]:
+        ref = self.document()
+        ref.set(data)
+        return None, ref
+
+class LocalWriteBatch:
+    """Mirror of google.cloud.firestore.WriteBatch; writes apply atomically on commit()"""
+
+    def __init__(self, db: "LocalFirestore"):
+        self.db = db
+        self._writes = []
+
+    def set(self, reference: LocalDocumentReference, data: Dict[str, Any], merge: bool = False):
+        self._writes.append(("set", reference, data, merge))
+
+    def delete(self, reference: LocalDocumentReference):
+        self._writes.append(("delete", reference, None, False))
+
+    def commit(self):
+        with self.db.lock:
+            for op, reference, data, merge in self._writes:
+                if op == "set":
+                    reference.set(data, merge=merge)
+                else:
+                    reference.delete()
+        self._writes = []
+
+class LocalFirestore:
+    """In-process stand-in for the Firestore client, for offline harnesses and benchmarks"""
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self._collections: Dict[str, LocalCollectionReference] = {}
+
+    def collection(self, name: str) -> LocalCollectionReference:
+        with self.lock:
+            if name not in self._collections:
+                self._collections[name] = LocalCollectionReference(self, name)
+            return self._collections[name]
+
+    def batch(self) -> LocalWriteBatch:
+        return LocalWriteBatch(self)
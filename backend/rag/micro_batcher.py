@@ -0,0 +1,102 @@
+import time
+import queue
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import List, Dict, Any, Callable, Optional
+
+class MicroBatcher:
+    """Collects concurrent single-item calls into one batched call
+
+    A worker thread takes the first queued item, keeps collecting for up to max_wait_ms
+    or until max_batch_size items are queued, calls batch_fn(items) once and resolves
+    each caller's future with its own result.
+    """
+
+    def __init__(
+        self,
+        batch_fn: Callable[[List[Any]], List[Any]],
+        max_batch_size: int = 16,
+        max_wait_ms: float = 5.0,
+        name: str = "batcher",
+        max_concurrent_batches: int = 4
+    ):
+        self.batch_fn = batch_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.name = name
+        self._queue: "queue.Queue" = queue.Queue()
+        self._stats_lock = threading.Lock()
+        # Batches run on a small pool so collection continues while a batch call is in flight
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrent_batches, thread_name_prefix=f"micro-batch-{name}")
+        self._thread = threading.Thread(target=self._run, name=f"micro-batch-{name}", daemon=True)
+        self._thread.start()
+
+        # Metrics
+        self.stats_data = {
+            "items": 0,
+            "batches": 0,
+            "max_batch_size_seen": 0,
+            "flushed_full": 0,
+            "flushed_timeout": 0,
+            "errors": 0,
+            "queue_wait_ms_total": 0.0
+        }
+
+    def submit(self, item: Any) -> Future:
+        future = Future()
+        self._queue.put((item, future, time.perf_counter()))
+        return future
+
+    def call(self, item: Any, timeout: Optional[float] = None) -> Any:
+        """Submit one item and block for its result"""
+        return self.submit(item).result(timeout=timeout)
+
+    def _collect(self) -> List:
+        batch = [self._queue.get()]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            self._executor.submit(self._execute, self._collect())
+
+    def _execute(self, batch: List):
+        started = time.perf_counter()
+        items = [item for item, _, _ in batch]
+        try:
+            results = self.batch_fn(items)
+            if len(results) != len(items):
+                raise ValueError(f"{self.name}: batch returned {len(results)} results for {len(items)} items")
+            for (_, future, _), result in zip(batch, results):
+                future.set_result(result)
+        except Exception as e:
+            with self._stats_lock:
+                self.stats_data["errors"] += 1
+            for _, future, _ in batch:
+                future.set_exception(e)
+        self._record(batch, started)
+
+    def _record(self, batch: List, started: float):
+        with self._stats_lock:
+            self.stats_data["items"] += len(batch)
+            self.stats_data["batches"] += 1
+            self.stats_data["max_batch_size_seen"] = max(self.stats_data["max_batch_size_seen"], len(batch))
+            self.stats_data["flushed_full" if len(batch) >= self.max_batch_size else "flushed_timeout"] += 1
+            self.stats_data["queue_wait_ms_total"] += sum((started - queued) * 1000 for _, _, queued in batch)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._stats_lock:
+            data = dict(self.stats_data)
+        batches = data["batches"] or 1
+        data["avg_batch_size"] = round(data["items"] / batches, 2)
+        data["avg_queue_wait_ms"] = round(data.pop("queue_wait_ms_total") / (data["items"] or 1), 3)
+        data["queued"] = self._queue.qsize()
+        return data
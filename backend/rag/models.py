@@ -1,15 +1,31 @@
+import sys
 from datetime import datetime
-from typing import List, Dict, Optional, Any
+from typing import List, Dict, Optional, Any, TYPE_CHECKING
 from dataclasses import dataclass, field
 from enum import Enum
 import uuid
 
+if TYPE_CHECKING:
+    import numpy as np
+
+# Slotted dataclasses (no per-instance __dict__) where the interpreter supports them
+_SLOTS = {"slots": True} if sys.version_info >= (3, 10) else {}
+
+# numpy is imported on first use so importing the API models stays cheap at server startup
+def as_vector(values) -> "np.ndarray":
+    """Embedding as a float32 array (lists are converted, arrays kept when already float32)"""
+    import numpy as np
+    return np.asarray(values if values is not None else (), dtype=np.float32)
+
+def _empty_vector() -> "np.ndarray":
+    return as_vector(())
+
 class DocumentType(Enum):
     PDF = "pdf"
 
-@dataclass
+@dataclass(**_SLOTS)
 class DocumentChunk:
-    """Represents a chunk of a document with embeddings"""
+    """Represents a chunk of a document with embeddings (float32 arrays; lists only in to_dict())"""
     id: str
     document_id: str
     content: str
@@ -17,12 +33,20 @@ class DocumentChunk:
     class_name: str
     subject_name: str
     file_id: str
-    dense_embedding: List[float] = field(default_factory=list)
-    sparse_embedding: List[float] = field(default_factory=list)
+    dense_embedding: "np.ndarray" = field(default_factory=_empty_vector)
+    sparse_embedding: "np.ndarray" = field(default_factory=_empty_vector)
     metadata: Dict[str, Any] = field(default_factory=dict)
     created_at: datetime = field(default_factory=datetime.utcnow)
     
-    def to_dict(self) -> Dict[str, Any]:
+    def __post_init__(self):
+        self.dense_embedding = as_vector(self.dense_embedding)
+        self.sparse_embedding = as_vector(self.sparse_embedding)
+    
+    def to_dict(self, plain: bool = True) -> Dict[str, Any]:
+        """Dict form; plain=False keeps the embedding arrays for storage backends, which convert them"""
+        dense, sparse = self.dense_embedding, self.sparse_embedding
+        if plain:
+            dense, sparse = dense.tolist(), sparse.tolist()
         return {
             "id": self.id,
             "document_id": self.document_id,
@@ -31,13 +55,13 @@ class DocumentChunk:
             "class_name": self.class_name,
             "subject_name": self.subject_name,
             "file_id": self.file_id,
-            "dense_embedding": self.dense_embedding,
-            "sparse_embedding": self.sparse_embedding,
+            "dense_embedding": dense,
+            "sparse_embedding": sparse,
             "metadata": self.metadata,
             "created_at": self.created_at.isoformat()
         }
 
-@dataclass
+@dataclass(**_SLOTS)
 class SearchResult:
     """Represents a search result from the knowledge base"""
     chunk_id: str
@@ -50,6 +74,7 @@ class SearchResult:
     sparse_score: float
     hybrid_score: float
     metadata: Dict[str, Any] = field(default_factory=dict)
+    chunk_index: Optional[int] = None
     
     def to_dict(self) -> Dict[str, Any]:
         return {
@@ -62,8 +87,70 @@ class SearchResult:
             "dense_score": self.dense_score,
             "sparse_score": self.sparse_score,
             "hybrid_score": self.hybrid_score,
-            "metadata": self.metadata
+            "metadata": self.metadata,
+            "chunk_index": self.chunk_index
+        }
+    
+    def to_preview(self, snippet_chars: int) -> Dict[str, Any]:
+        """Lean form for API responses: ids, scores, title and the first snippet_chars of content"""
+        snippet = self.content
+        if len(snippet) > snippet_chars:
+            snippet = snippet[:snippet_chars].rstrip() + "…"
+        return {
+            "chunk_id": self.chunk_id,
+            "document_id": self.document_id,
+            "file_id": self.file_id,
+            "chunk_index": self.chunk_index,
+            "title": self.metadata.get("title"),
+            "snippet": snippet,
+            "dense_score": self.dense_score,
+            "sparse_score": self.sparse_score,
+            "hybrid_score": self.hybrid_score
         }
+    
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "SearchResult":
+        return cls(
+            chunk_id=data["chunk_id"],
+            document_id=data["document_id"],
+            content=data["content"],
+            class_name=data["class_name"],
+            subject_name=data["subject_name"],
+            file_id=data["file_id"],
+            dense_score=data["dense_score"],
+            sparse_score=data["sparse_score"],
+            hybrid_score=data["hybrid_score"],
+            metadata=data.get("metadata", {}),
+            chunk_index=data.get("chunk_index")
+        )
+
+@dataclass(**_SLOTS)
+class ChunkRecord:
+    """Index-resident metadata of one chunk, materialized from columnar storage for search results"""
+    chunk_id: str
+    document_id: str
+    content: str
+    class_name: str
+    subject_name: str
+    file_id: str
+    user_id: Optional[str] = None
+    chunk_index: Optional[int] = None
+    metadata: Dict[str, Any] = field(default_factory=dict)
+    
+    def to_search_result(self, dense_score: float, sparse_score: float, hybrid_score: float) -> SearchResult:
+        return SearchResult(
+            chunk_id=self.chunk_id,
+            document_id=self.document_id,
+            content=self.content,
+            class_name=self.class_name,
+            subject_name=self.subject_name,
+            file_id=self.file_id,
+            dense_score=dense_score,
+            sparse_score=sparse_score,
+            hybrid_score=hybrid_score,
+            metadata=self.metadata,
+            chunk_index=self.chunk_index
+        )
 
 @dataclass
 class ChatRequest:
@@ -94,10 +181,15 @@ class ChatResponse:
     retrieved_chunks: List[SearchResult] = field(default_factory=list)
     metadata: Dict[str, Any] = field(default_factory=dict)
     
-    def to_dict(self) -> Dict[str, Any]:
+    def to_dict(self, include_content: bool = True, snippet_chars: int = 240) -> Dict[str, Any]:
+        """Full chunks (content and metadata) by default; include_content=False returns snippet previews"""
+        if include_content:
+            chunks = [chunk.to_dict() for chunk in self.retrieved_chunks]
+        else:
+            chunks = [chunk.to_preview(snippet_chars) for chunk in self.retrieved_chunks]
         return {
             "response": self.response,
-            "retrieved_chunks": [chunk.to_dict() for chunk in self.retrieved_chunks],
+            "retrieved_chunks": chunks,
             "metadata": self.metadata
         }
 
@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+"""
+Archive Re-indexing Script
+Re-chunks and re-embeds stored files from the parsed text kept in the document archive,
+so changing chunking (RAG_HIERARCHICAL, RAG_CHILD_CHARS) or embedding settings needs
+neither the original PDFs nor another Unstructured.io parse
+"""
+
+import os
+import sys
+import math
+import argparse
+from datetime import datetime
+from typing import List, Dict, Any, Optional
+
+# Add current directory to path for imports
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from document_archive import create_document_archive
+from document_processor import DocumentProcessor, elements_text, extract_pdf_elements
+
+class ArchiveReindexer:
+    """Rebuilds the chunks of stored files from their archived parse"""
+
+    def __init__(self, project_id: str):
+        from hybrid_vector_store import HybridVectorStore
+
+        self.vector_store = HybridVectorStore(project_id)
+        self.archive = create_document_archive(self.vector_store.bucket)
+        if self.archive is None:
+            raise ValueError("Document archive is disabled (RAG_ARCHIVE=off)")
+        self.document_processor = DocumentProcessor(project_id, archive=self.archive)
+
+        # Statistics
+        self.stats = {
+            "files": 0,
+            "reindexed_files": 0,
+            "not_archived": 0,
+            "failed_files": 0,
+            "chunks_stored": 0,
+            "chunks_deleted": 0,
+            "embedding_calls": 0
+        }
+
+    def stored_files(self, file_ids: Optional[List[str]] = None) -> Dict[str, Dict[str, Any]]:
+        """One record per stored file (taken from its first embedding doc) with its archive key"""
+        storage, collection = self.vector_store.storage, self.vector_store.embeddings_collection
+        if file_ids:
+            docs = (doc for file_id in file_ids for _, doc in storage.stream(collection, [("file_id", "==", file_id)]))
+        else:
+            docs = (doc for _, doc in storage.stream(collection))
+
+        files = {}
+        for doc in docs:
+            if doc["file_id"] in files:
+                continue
+            metadata = doc.get("metadata") or {}
+            files[doc["file_id"]] = {
+                "file_id": doc["file_id"],
+                "document_id": doc["document_id"],
+                "title": metadata.get("title", ""),
+                "class_name": doc["class_name"],
+                "subject_name": doc["subject_name"],
+                "user_id": metadata.get("user_id", doc.get("user_id", "default")),
+                "source_sha256": metadata.get("source_sha256")
+            }
+        return files
+
+    def reindex_file(self, info: Dict[str, Any], reparse: bool = False, dry_run: bool = False) -> Dict[str, Any]:
+        """Re-chunk one file from its archived elements (re-parsing the archived PDF if reparse) and re-embed it"""
+        source = info["source_sha256"]
+        elements = None
+        if source is not None:
+            if reparse:
+                file_content = self.archive.get_pdf(source)
+                if file_content is not None:
+                    elements = extract_pdf_elements(file_content)
+                    if not dry_run:
+                        self.archive.put_document(source, file_content, elements)
+            else:
+                elements = self.archive.get_elements(source)
+        if elements is None:
+            return {"success": False, "archived": False, "file_id": info["file_id"]}
+
+        result = self.document_processor.chunk_document(
+            elements_text(elements), info["title"], info["class_name"], info["subject_name"],
+            info["user_id"], info["file_id"], info["document_id"], source_sha256=source
+        )
+        summary = {
+            "success": True,
+            "archived": True,
+            "file_id": info["file_id"],
+            "chunks_count": result["total_chunks"],
+            "embedding_calls": math.ceil(result["total_chunks"] / self.vector_store.ingest_embed_batch_size),
+            "chunks_deleted": 0
+        }
+        if not dry_run:
+            replaced = self.vector_store.replace_file_chunks(info["file_id"], result["chunks"], parents=result["parents"])
+            summary["chunks_deleted"] = replaced["deleted"]
+        return summary
+
+    def reindex(
+        self,
+        file_ids: Optional[List[str]] = None,
+        reparse: bool = False,
+        dry_run: bool = False
+    ) -> Dict[str, Any]:
+        """Re-index the given files (all stored files by default)"""
+        start_time = datetime.now()
+        files = self.stored_files(file_ids)
+        self.stats["files"] = len(files)
+        print(f"Re-indexing {len(files)} files from the {self.archive.name} archive"
+              f"{' (re-parsing archived PDFs)' if reparse else ''}{' (dry run)' if dry_run else ''}")
+        print("=" * 60)
+
+        for i, info in enumerate(files.values(), 1):
+            print(f"[{i}/{len(files)}] {info['title']} ({info['file_id']})")
+            try:
+                result = self.reindex_file(info, reparse=reparse, dry_run=dry_run)
+            except Exception as e:
+                print(f"  ❌ Failed: {e}")
+                self.stats["failed_files"] += 1
+                continue
+            if not result["archived"]:
+                print("  ⚠️ Not in the archive (ingested before archiving was enabled); re-upload the PDF instead")
+                self.stats["not_archived"] += 1
+                continue
+            self.stats["reindexed_files"] += 1
+            self.stats["chunks_stored"] += result["chunks_count"]
+            self.stats["chunks_deleted"] += result["chunks_deleted"]
+            self.stats["embedding_calls"] += result["embedding_calls"]
+            print(f"  ✅ {result['chunks_count']} chunks, {result['chunks_deleted']} stale chunks removed")
+
+        print("\n" + "=" * 60)
+        print("RE-INDEX SUMMARY")
+        print("=" * 60)
+        print(f"Files: {self.stats['files']}")
+        print(f"Re-indexed: {self.stats['reindexed_files']}")
+        print(f"Not archived: {self.stats['not_archived']}")
+        print(f"Failed: {self.stats['failed_files']}")
+        print(f"Chunks: {self.stats['chunks_stored']} ({self.stats['chunks_deleted']} stale removed)")
+        print(f"Embedding calls: {self.stats['embedding_calls']}")
+        print(f"Duration: {datetime.now() - start_time}")
+        return self.stats
+
+def main():
+    """Main function"""
+    parser = argparse.ArgumentParser(description="Re-chunk and re-embed stored files from the document archive")
+    parser.add_argument("--file-id", action="append", dest="file_ids", help="Only this file (repeatable); default all stored files")
+    parser.add_argument("--reparse", action="store_true", help="Parse the archived PDFs again (after a parser upgrade) instead of reusing the archived text")
+    parser.add_argument("--dry-run", action="store_true", help="Re-chunk and count embedding calls; store nothing")
+    parser.add_argument("--project-id", help="Google Cloud Project ID")
+    args = parser.parse_args()
+
+    project_id = args.project_id or os.environ.get("GOOGLE_CLOUD_PROJECT")
+    if not project_id:
+        print("Error: Google Cloud Project ID not provided")
+        print("Set GOOGLE_CLOUD_PROJECT environment variable or use --project-id")
+        sys.exit(1)
+
+    reindexer = ArchiveReindexer(project_id)
+    stats = reindexer.reindex(args.file_ids, reparse=args.reparse, dry_run=args.dry_run)
+    if stats["failed_files"]:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
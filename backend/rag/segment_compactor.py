@@ -0,0 +1,111 @@
+import os
+import time
+import threading
+from typing import Dict, Any, Optional
+
+from segmented_index import Segment
+
+class SegmentCompactor:
+    """Background merging of a HybridVectorStore's index segments
+
+    Each run merges either the segment with the most tombstones (once past tombstone_ratio,
+    purging them) or, when there are more than max_segments sealed segments, the smallest
+    ones. Merges are built from immutable segments without holding the store's write lock
+    and swapped in with one publish. Work is paced to mb_per_second of merged segment bytes
+    so compaction does not compete with searches and uploads for memory bandwidth and CPU.
+    """
+
+    def __init__(
+        self,
+        vector_store,
+        interval: Optional[float] = None,
+        max_segments: Optional[int] = None,
+        tombstone_ratio: Optional[float] = None,
+        mb_per_second: Optional[float] = None,
+        max_merge_mb: Optional[float] = None
+    ):
+        self.vector_store = vector_store
+        self.interval = interval or float(os.environ.get("RAG_COMPACTION_INTERVAL", "10"))
+        self.max_segments = max_segments or int(os.environ.get("RAG_MAX_SEGMENTS", "8"))
+        self.tombstone_ratio = tombstone_ratio or float(os.environ.get("RAG_COMPACTION_TOMBSTONE_RATIO", "0.2"))
+        self.mb_per_second = mb_per_second or float(os.environ.get("RAG_COMPACTION_MB_PER_SEC", "50"))
+        self.max_merge_bytes = int((max_merge_mb or float(os.environ.get("RAG_COMPACTION_MAX_MERGE_MB", "256"))) * 1e6)
+
+        self._thread = None
+        self._stop = threading.Event()
+        self._run_lock = threading.Lock()
+
+        # Metrics
+        self.stats_data = {
+            "merges": 0,
+            "segments_merged": 0,
+            "rows_purged": 0,
+            "bytes_merged": 0,
+            "discarded_merges": 0,
+            "throttled_seconds": 0.0,
+            "last_merge_ms": None,
+            "errors": 0,
+            "last_error": None
+        }
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name="segment-compactor", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.interval + 1)
+
+    def _loop(self):
+        while not self._stop.wait(self.interval):
+            try:
+                while not self._stop.is_set() and self.compact_once():
+                    pass
+            except Exception as e:
+                self.stats_data["errors"] += 1
+                self.stats_data["last_error"] = str(e)
+                print(f"❌ Segment compaction failed: {e}")
+
+    def compact_once(self) -> bool:
+        """Run one merge if the index needs one; returns whether a merge was published"""
+        with self._run_lock:
+            index = self.vector_store.segmented_index
+            if index is None:
+                return False
+            plan = index.compaction_plan(self.max_segments, self.tombstone_ratio, self.max_merge_bytes)
+            if not plan:
+                return False
+
+            started = time.perf_counter()
+            merged, remaps = Segment.merge(plan)
+            applied = self.vector_store.replace_segments(plan, merged, remaps)
+            elapsed = time.perf_counter() - started
+
+            work_bytes = sum(segment.nbytes for segment in plan) + merged.nbytes
+            if applied:
+                self.stats_data["merges"] += 1
+                self.stats_data["segments_merged"] += len(plan)
+                self.stats_data["rows_purged"] += sum(len(segment) for segment in plan) - len(merged)
+                self.stats_data["bytes_merged"] += work_bytes
+                self.stats_data["last_merge_ms"] = round(elapsed * 1000, 3)
+            else:
+                self.stats_data["discarded_merges"] += 1
+
+            # I/O budget: a merge touching B bytes takes at least B / rate seconds, pausing for the rest
+            pause = work_bytes / (self.mb_per_second * 1e6) - elapsed
+            if pause > 0:
+                self.stats_data["throttled_seconds"] = round(self.stats_data["throttled_seconds"] + pause, 3)
+                self._stop.wait(pause)
+            return applied
+
+    def stats(self) -> Dict[str, Any]:
+        """Compaction metrics for the health endpoint"""
+        return {
+            "running": self._thread is not None and self._thread.is_alive(),
+            "mb_per_second": self.mb_per_second,
+            **self.stats_data
+        }
@@ -0,0 +1,537 @@
+import itertools
+import numpy as np
+from typing import List, Dict, Any, Optional, Tuple, Sequence, Set
+
+from models import ChunkRecord
+from chunk_table import ChunkTable
+from dense_index import DenseIndex, two_stage_search
+from sparse_index import tokenize, term_hash, build_postings, sort_postings
+
+_segment_uids = itertools.count(1)
+
+class Segment:
+    """Immutable slice of the index: a columnar ChunkTable, dense rows and CSR BM25 postings
+
+    Deletes never write into a segment: with_tombstones() returns a new Segment that shares
+    every array and carries an updated tombstone bitmap. The uid survives tombstone updates,
+    so compaction can tell which segment version it started from.
+    """
+
+    def __init__(
+        self,
+        records: ChunkTable,
+        vectors: Optional[np.ndarray],
+        reduced: Optional[np.ndarray],
+        postings: Dict[str, np.ndarray],
+        doc_lengths: np.ndarray
+    ):
+        self.uid = next(_segment_uids)
+        self.records = records
+        self.ids = records.ids
+        # L2-normalized full-precision rows and their reduced encoding (None without a dense index)
+        self.vectors = vectors
+        self.reduced = reduced
+        self.term_hashes = postings["term_hashes"]
+        self.offsets = postings["offsets"]
+        self.doc_ids = postings["doc_ids"]
+        self.term_freqs = postings["term_freqs"]
+        self.doc_lengths = doc_lengths
+        self.id_to_row = {chunk_id: row for row, chunk_id in enumerate(self.ids)}
+        self.tombstones: Optional[np.ndarray] = None
+        # Snapshot segment directory holding these arrays (None until IndexSnapshotStore writes them)
+        self.file_name: Optional[str] = None
+        self._frequencies = None
+        self.deleted = 0
+        self.live_length = float(doc_lengths.sum())
+
+    @classmethod
+    def build(
+        cls,
+        records: List[Dict[str, Any]],
+        vectors: Optional[np.ndarray] = None,
+        reduced: Optional[np.ndarray] = None
+    ) -> "Segment":
+        """Segment over new rows from index record dicts (chunk_id, content, filter columns, metadata)"""
+        tokenized = [tokenize(record["content"]) for record in records]
+        triplets = build_postings(tokenized)
+        postings = sort_postings(triplets["hashes"], triplets["docs"], triplets["freqs"])
+        doc_lengths = np.array([len(tokens) for tokens in tokenized], dtype=np.int32)
+        return cls(ChunkTable.from_records(records), vectors, reduced, postings, doc_lengths)
+
+    @classmethod
+    def merge(cls, segments: Sequence["Segment"]) -> Tuple["Segment", List[np.ndarray]]:
+        """One segment with the live rows of all inputs, and per input a local row -> merged row map (-1 if purged)
+
+        Postings are remapped, not re-tokenized.
+        """
+        keeps, vectors, reduced, lengths = [], [], [], []
+        hashes, docs, freqs, remaps = [], [], [], []
+        base = 0
+        for segment in segments:
+            keep = segment.live_rows()
+            remap = np.full(len(segment), -1, dtype=np.int64)
+            remap[keep] = base + np.arange(len(keep))
+            keeps.append(keep)
+            if segment.vectors is not None:
+                vectors.append(segment.vectors[keep])
+                reduced.append(segment.reduced[keep])
+            lengths.append(segment.doc_lengths[keep])
+
+            merged_docs = remap[segment.doc_ids]
+            valid = merged_docs >= 0
+            hashes.append(np.repeat(segment.term_hashes, np.diff(segment.offsets))[valid])
+            docs.append(merged_docs[valid].astype(np.int32))
+            freqs.append(segment.term_freqs[valid])
+            remaps.append(remap)
+            base += len(keep)
+
+        dense = len(vectors) == len(segments)
+        merged = cls(
+            ChunkTable.concat([segment.records for segment in segments], keeps),
+            np.concatenate(vectors) if dense else None,
+            np.concatenate(reduced) if dense else None,
+            sort_postings(np.concatenate(hashes), np.concatenate(docs), np.concatenate(freqs)),
+            np.concatenate(lengths)
+        )
+        return merged, remaps
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @property
+    def live_count(self) -> int:
+        return len(self.ids) - self.deleted
+
+    @property
+    def nbytes(self) -> int:
+        """Approximate bytes a merge reads and writes for this segment"""
+        arrays = [self.term_hashes, self.offsets, self.doc_ids, self.term_freqs, self.doc_lengths]
+        if self.vectors is not None:
+            arrays += [self.vectors, self.reduced]
+        return int(sum(array.nbytes for array in arrays)) + self.records.nbytes
+
+    def live_rows(self) -> np.ndarray:
+        if self.tombstones is None:
+            return np.arange(len(self.ids))
+        return np.flatnonzero(~self.tombstones)
+
+    def is_live(self, row: int) -> bool:
+        return self.tombstones is None or not self.tombstones[row]
+
+    def _replace(self, **changes) -> "Segment":
+        clone = Segment.__new__(Segment)
+        clone.__dict__.update(self.__dict__)
+        clone.__dict__.update(changes)
+        return clone
+
+    def frequencies(self) -> Tuple[np.ndarray, np.ndarray]:
+        """(term hashes, live document frequencies), computed once per tombstone version"""
+        if self._frequencies is None:
+            counts = np.diff(self.offsets)
+            if self.tombstones is not None and len(self.doc_ids):
+                dead = self.tombstones[self.doc_ids].astype(np.int64)
+                starts = self.offsets[:-1]
+                counts = counts - np.add.reduceat(dead, starts)
+            self._frequencies = (self.term_hashes, counts)
+        return self._frequencies
+
+    def with_tombstones(self, rows) -> "Segment":
+        """Version of this segment with the given local rows deleted (self if nothing changes)"""
+        rows = np.asarray(rows, dtype=np.int64)
+        if self.tombstones is not None:
+            rows = rows[~self.tombstones[rows]]
+        if not len(rows):
+            return self
+        tombstones = np.zeros(len(self.ids), dtype=bool) if self.tombstones is None else self.tombstones.copy()
+        tombstones[rows] = True
+        return self._replace(
+            _frequencies=None,
+            tombstones=tombstones,
+            deleted=int(tombstones.sum()),
+            live_length=float(self.doc_lengths[~tombstones].sum())
+        )
+
+    def without(self, chunk_ids: Set[str]) -> "Segment":
+        """Version of this segment with any of chunk_ids deleted"""
+        rows = [self.id_to_row[chunk_id] for chunk_id in chunk_ids if chunk_id in self.id_to_row]
+        return self.with_tombstones(rows) if rows else self
+
+    def with_reduced(self, reduced: np.ndarray) -> "Segment":
+        return self._replace(reduced=reduced, file_name=None)
+
+    def filter_mask(self, filters: Dict[str, Any], allowed_file_ids: Optional[List[str]]) -> Optional[np.ndarray]:
+        """Live rows matching the filters as a boolean mask, or None when every row matches"""
+        mask = None
+        for column, value in filters.items():
+            if value:
+                column_mask = self.records.mask(column, value)
+                mask = column_mask if mask is None else mask & column_mask
+        if allowed_file_ids:
+            file_mask = self.records.isin("file_id", list(allowed_file_ids))
+            mask = file_mask if mask is None else mask & file_mask
+        if self.tombstones is not None:
+            mask = ~self.tombstones if mask is None else mask & ~self.tombstones
+        return mask
+
+    def postings(self, h: np.uint64) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        """(local rows, term frequencies) of live rows containing the term hash"""
+        i = int(np.searchsorted(self.term_hashes, h))
+        if i >= len(self.term_hashes) or self.term_hashes[i] != h:
+            return None
+        start, end = int(self.offsets[i]), int(self.offsets[i + 1])
+        docs = self.doc_ids[start:end]
+        freqs = self.term_freqs[start:end]
+        if self.tombstones is not None:
+            live = ~self.tombstones[docs]
+            docs, freqs = docs[live], freqs[live]
+        return docs, freqs
+
+class SegmentRows:
+    """chunk_id -> global row of the live copy of a chunk, as a read-only mapping"""
+
+    def __init__(self, index: "SegmentedIndex"):
+        self.index = index
+
+    def get(self, chunk_id: str, default=None):
+        index = self.index
+        # Newest first: an updated chunk's live copy is in a later segment than its tombstone
+        for position in range(len(index.parts) - 1, -1, -1):
+            segment = index.parts[position]
+            row = segment.id_to_row.get(chunk_id)
+            if row is not None and segment.is_live(row):
+                return int(index.starts[position]) + row
+        return default
+
+    def __contains__(self, chunk_id: str) -> bool:
+        return self.get(chunk_id) is not None
+
+class SegmentRecords:
+    """Global row -> ChunkRecord, as a read-only sequence"""
+
+    def __init__(self, index: "SegmentedIndex"):
+        self.index = index
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def __getitem__(self, row: int) -> ChunkRecord:
+        position, local = self.index.locate(row)
+        return self.index.parts[position].records.record(local)
+
+class SegmentedIndex:
+    """One published version of the LSM-style index: sealed segments plus a small head segment
+
+    New rows go to the head, which is rebuilt on every append (dropping its own tombstoned
+    rows) and sealed once it reaches head_rows. Deletes swap in segments with updated
+    tombstone bitmaps, so a write never copies the big segments. Searches see the segments
+    concatenated in order as one row space, with DenseIndex's search interface and BM25
+    get_scores(). SegmentCompactor merges small segments and purges tombstones in the background.
+
+    BM25 statistics (corpus size, average length, document frequencies and the average idf
+    of the negative-idf floor) count live rows only, so scores match rank_bm25.BM25Okapi
+    over the live corpus whatever the segment layout.
+    """
+
+    def __init__(
+        self,
+        segments: Sequence[Segment] = (),
+        head: Optional[Segment] = None,
+        codec: Optional[DenseIndex] = None,
+        head_rows: int = 1000,
+        k1: float = 1.5,
+        b: float = 0.75,
+        epsilon: float = 0.25,
+        vocabulary: Optional[Dict[tuple, Tuple[np.ndarray, np.ndarray]]] = None
+    ):
+        self.segments = tuple(segments)
+        self.head = head
+        # Empty DenseIndex holding the dense config and PCA projection (None without a dense index)
+        self.codec = codec
+        self.head_rows = head_rows
+        self.k1 = k1
+        self.b = b
+        self.epsilon = epsilon
+        self.parts = self.segments + ((head,) if head is not None else ())
+        self.starts = np.cumsum([0] + [len(part) for part in self.parts])
+        self.live_count = sum(part.live_count for part in self.parts)
+        self.live_length = sum(part.live_length for part in self.parts)
+        # Live document frequencies of the sealed segments, shared between versions
+        self._vocabulary = vocabulary if vocabulary is not None else {}
+        self._ids = None
+        self._alive = None
+        self._average_idf = None
+        self.rows = SegmentRows(self)
+        self.records = SegmentRecords(self)
+
+    @classmethod
+    def build(
+        cls,
+        records: List[Dict[str, Any]],
+        vectors: Optional[List[List[float]]] = None,
+        codec: Optional[DenseIndex] = None,
+        head_rows: int = 1000
+    ) -> "SegmentedIndex":
+        """Index an initial load as one sealed segment, fitting the codec's PCA projection on it"""
+        if not records:
+            return cls(codec=codec, head_rows=head_rows)
+        matrix = reduced = None
+        if codec is not None:
+            matrix = codec._normalize(np.asarray(vectors, dtype=np.float32).reshape(len(records), -1))
+            codec.fit_reduction(matrix)
+            reduced = codec._reduce(matrix)
+        return cls([Segment.build(records, matrix, reduced)], None, codec, head_rows)
+
+    def _version(self, segments: Sequence[Segment], head: Optional[Segment], codec=None) -> "SegmentedIndex":
+        return SegmentedIndex(
+            segments, head, codec if codec is not None else self.codec, self.head_rows,
+            self.k1, self.b, self.epsilon, self._vocabulary
+        )
+
+    # --- writes: each returns a new version and leaves this one untouched ---
+
+    def apply(
+        self,
+        records: List[Dict[str, Any]],
+        vectors: Optional[List[List[float]]],
+        deleted_ids: Sequence[str] = ()
+    ) -> "SegmentedIndex":
+        """New version with deleted_ids tombstoned and the given index records upserted into the head"""
+        removed = set(deleted_ids) | {record["chunk_id"] for record in records}
+        parts = [part.without(removed) for part in self.parts] if removed else list(self.parts)
+        segments = parts[:len(self.segments)]
+        head = parts[-1] if self.head is not None else None
+
+        if records:
+            matrix = reduced = None
+            if self.codec is not None:
+                matrix, reduced = self.codec.prepare_rows(vectors)
+                if matrix.shape[1] != self.codec.dimension:
+                    raise ValueError(f"Expected {self.codec.dimension}-dim vectors, got {matrix.shape[1]}")
+            added = Segment.build(records, matrix, reduced)
+            head = Segment.merge([head, added])[0] if head is not None else added
+            if len(head) >= self.head_rows:
+                segments.append(head)
+                head = None
+        return self._version(segments, head)._fit_codec()
+
+    def _fit_codec(self) -> "SegmentedIndex":
+        """Fit PCA once enough rows exist (an initial load can be too small) and re-encode every segment"""
+        codec = self.codec
+        if codec is None or codec.quantization != "pca" or codec.pca_components is not None:
+            return self
+        if self.live_count < codec.reduced_dim:
+            return self
+        fitted = DenseIndex(**codec.config(), candidate_multiplier=codec.candidate_multiplier)
+        fitted.fit_reduction(np.concatenate([part.vectors[part.live_rows()] for part in self.parts]))
+        parts = [part.with_reduced(fitted._reduce(part.vectors)) for part in self.parts]
+        head = parts[-1] if self.head is not None else None
+        return self._version(parts[:len(self.segments)], head, codec=fitted)
+
+    def compaction_plan(
+        self,
+        max_segments: int = 8,
+        tombstone_ratio: float = 0.2,
+        max_merge_bytes: int = 256 * 1024 * 1024
+    ) -> List[Segment]:
+        """Sealed segments to merge next: the most-deleted segment past tombstone_ratio, else the smallest ones"""
+        dirty = [s for s in self.segments if s.deleted and s.deleted >= tombstone_ratio * len(s)]
+        if dirty:
+            return [max(dirty, key=lambda s: s.deleted / len(s))]
+        if len(self.segments) <= max_segments:
+            return []
+        plan = sorted(self.segments, key=lambda s: s.nbytes)[:len(self.segments) - max_segments + 1]
+        while len(plan) > 2 and sum(s.nbytes for s in plan) > max_merge_bytes:
+            plan.pop()
+        return plan
+
+    def replace(self, inputs: Sequence[Segment], merged: Segment, remaps: List[np.ndarray]) -> Optional["SegmentedIndex"]:
+        """New version with inputs swapped for their merged segment, carrying over deletes made during the merge
+
+        Returns None when an input is gone or was re-encoded since the merge started.
+        """
+        current = {segment.uid: segment for segment in self.segments}
+        late = []
+        for segment, remap in zip(inputs, remaps):
+            now = current.get(segment.uid)
+            if now is None or now.reduced is not segment.reduced:
+                return None
+            if now.tombstones is not None:
+                newly = now.tombstones if segment.tombstones is None else now.tombstones & ~segment.tombstones
+                late.append(remap[newly])
+        if late:
+            merged = merged.with_tombstones(np.concatenate(late))
+
+        merged_uids = {segment.uid for segment in inputs}
+        segments, placed = [], False
+        for segment in self.segments:
+            if segment.uid not in merged_uids:
+                segments.append(segment)
+            elif not placed:
+                placed = True
+                if merged.live_count:
+                    segments.append(merged)
+        return self._version(segments, self.head)
+
+    # --- reads ---
+
+    def __len__(self) -> int:
+        return int(self.starts[-1])
+
+    @property
+    def dimension(self) -> int:
+        return self.codec.dimension
+
+    @property
+    def candidate_multiplier(self) -> int:
+        return self.codec.candidate_multiplier
+
+    @property
+    def ids(self) -> List[str]:
+        """Chunk id of every global row (computed once per version)"""
+        if self._ids is None:
+            self._ids = [chunk_id for part in self.parts for chunk_id in part.ids]
+        return self._ids
+
+    @property
+    def alive(self) -> Optional[np.ndarray]:
+        """Liveness of every global row, None when nothing is deleted"""
+        if self._alive is None and any(part.deleted for part in self.parts):
+            self._alive = np.concatenate([
+                ~part.tombstones if part.tombstones is not None else np.ones(len(part), dtype=bool)
+                for part in self.parts
+            ])
+        return self._alive
+
+    def locate(self, row: int) -> Tuple[int, int]:
+        """(segment position, local row) of a global row"""
+        position = int(np.searchsorted(self.starts, row, side="right")) - 1
+        return position, int(row - self.starts[position])
+
+    def filter_rows(
+        self,
+        class_name: Optional[str] = None,
+        subject_name: Optional[str] = None,
+        allowed_file_ids: Optional[List[str]] = None,
+        user_id: Optional[str] = None
+    ) -> Optional[np.ndarray]:
+        """Return live global rows matching the filters, or None when unfiltered"""
+        filters = {"user_id": user_id, "class_name": class_name, "subject_name": subject_name}
+        masks = [part.filter_mask(filters, allowed_file_ids) for part in self.parts]
+        if all(mask is None for mask in masks):
+            return None
+        return np.flatnonzero(np.concatenate([
+            mask if mask is not None else np.ones(len(part), dtype=bool)
+            for part, mask in zip(self.parts, masks)
+        ]))
+
+    def _gather(self, score, rows: Optional[np.ndarray]) -> np.ndarray:
+        """Run score(segment, local rows or None) per segment and assemble the results in global row order"""
+        if rows is None:
+            if not self.parts:
+                return np.zeros(0, dtype=np.float32)
+            return np.concatenate([score(part, None) for part in self.parts])
+        rows = np.asarray(rows)
+        out = np.empty(len(rows), dtype=np.float32)
+        owners = np.searchsorted(self.starts, rows, side="right") - 1
+        for position in np.unique(owners):
+            mask = owners == position
+            out[mask] = score(self.parts[position], rows[mask] - self.starts[position])
+        return out
+
+    def exact_scores(self, query_vector: List[float], rows: Optional[np.ndarray] = None) -> np.ndarray:
+        """Full-precision cosine scores for the given global rows (all rows when None)"""
+        query, _ = self.codec.encode_query(query_vector)
+        return self._gather(
+            lambda part, local: (part.vectors if local is None else part.vectors[local]) @ query, rows
+        )
+
+    def coarse_scores(self, query_vector: List[float], rows: Optional[np.ndarray] = None) -> np.ndarray:
+        """Approximate scores from the segments' reduced copies (higher is better)"""
+        _, reduced_query = self.codec.encode_query(query_vector)
+        return self._gather(
+            lambda part, local: self.codec.score_codes(part.reduced if local is None else part.reduced[local], reduced_query),
+            rows
+        )
+
+    def search(
+        self,
+        query_vector: List[float],
+        top_k: int,
+        rows: Optional[np.ndarray] = None,
+        two_stage: bool = True,
+        candidate_multiplier: Optional[int] = None
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Return (global rows, full-precision scores) of the best top_k rows"""
+        return two_stage_search(self, query_vector, top_k, rows, two_stage, candidate_multiplier)
+
+    def average_idf(self) -> float:
+        """Mean idf over the live vocabulary, for the negative-idf floor (computed once per version)"""
+        if self._average_idf is None:
+            key = tuple((segment.uid, segment.deleted) for segment in self.segments)
+            sealed = self._vocabulary.get(key)
+            if sealed is None:
+                sealed = _merge_frequencies([segment.frequencies() for segment in self.segments])
+                # Only the latest sealed layout is ever asked for again
+                self._vocabulary.clear()
+                self._vocabulary[key] = sealed
+            counts = sealed[1]
+            if self.head is not None:
+                counts = _merge_frequencies([sealed, self.head.frequencies()])[1]
+            counts = counts[counts > 0]
+            n = self.live_count
+            idf = np.log(n - counts + 0.5) - np.log(counts + 0.5)
+            self._average_idf = float(idf.mean()) if len(idf) else 0.0
+        return self._average_idf
+
+    def get_scores(self, query: List[str]) -> np.ndarray:
+        """BM25 score of every global row for the tokenized query (0 for deleted rows)"""
+        scores = np.zeros(len(self), dtype=np.float64)
+        n = self.live_count
+        if not n:
+            return scores
+        avgdl = self.live_length / n or 1.0
+        for token in query:
+            h = np.uint64(term_hash(token))
+            hits, doc_freq = [], 0
+            for position, part in enumerate(self.parts):
+                found = part.postings(h)
+                if found is not None and len(found[0]):
+                    hits.append((position, *found))
+                    doc_freq += len(found[0])
+            if not doc_freq:
+                continue
+            idf = np.log(n - doc_freq + 0.5) - np.log(doc_freq + 0.5)
+            if idf < 0:
+                idf = self.epsilon * self.average_idf()
+            for position, docs, tf in hits:
+                norms = self.k1 * (1 - self.b + self.b * self.parts[position].doc_lengths[docs] / avgdl)
+                scores[self.starts[position] + docs] += idf * (tf * (self.k1 + 1) / (tf + norms))
+        return scores
+
+    def memory_usage(self) -> Dict[str, int]:
+        """Bytes held by the full and reduced vector copies"""
+        dense = [part for part in self.parts if part.vectors is not None]
+        return {
+            "full_bytes": int(sum(part.vectors.nbytes for part in dense)),
+            "reduced_bytes": int(sum(part.reduced.nbytes for part in dense))
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        """Segment counts and sizes for the health endpoint"""
+        return {
+            "segments": len(self.segments),
+            "head_rows": len(self.head) if self.head is not None else 0,
+            "rows": len(self),
+            "live_rows": self.live_count,
+            "tombstones": len(self) - self.live_count,
+            "largest_segment_rows": max((len(s) for s in self.segments), default=0)
+        }
+
+def _merge_frequencies(vocabularies: List[Tuple[np.ndarray, np.ndarray]]) -> Tuple[np.ndarray, np.ndarray]:
+    """Sum per-term document frequencies of several (sorted term hashes, counts) pairs"""
+    if not vocabularies:
+        return np.zeros(0, dtype=np.uint64), np.zeros(0, dtype=np.int64)
+    hashes = np.concatenate([hashes for hashes, _ in vocabularies])
+    counts = np.concatenate([counts for _, counts in vocabularies]).astype(np.int64)
+    unique, inverse = np.unique(hashes, return_inverse=True)
+    return unique, np.bincount(inverse, weights=counts, minlength=len(unique)).astype(np.int64)
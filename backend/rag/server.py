@@ -1,21 +1,104 @@
-from fastapi import FastAPI, HTTPException, UploadFile, File, Form
+from fastapi import FastAPI, HTTPException, UploadFile, File, Form, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel
 from typing import List, Optional, Dict, Any
 import os
+import time
 import uuid
+import threading
 from datetime import datetime
 
 from models import ChatRequest, ChatResponse, PDFUploadRequest
-from agentic_workflow import AgenticWorkflow
+from index_sync import IndexSynchronizer
+from gemini_client import gemini_stats
+from ingestion_jobs import IngestionQueue, pdfs_from_upload
+from admission import AdmissionController, Overloaded
+from tracing import metrics
+import fast_json
 
 # Initialize FastAPI app
+class FastJSONResponse(JSONResponse):
+    """JSONResponse rendered with fast_json (orjson when installed)"""
+    def render(self, content: Any) -> bytes:
+        return fast_json.dumps(content)
+
 app = FastAPI(
     title="Agentic RAG API",
     description="A simplified RAG API with agentic workflows using Gemini and Document AI",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=FastJSONResponse
 )
 
+# Compress responses above RAG_COMPRESSION_MIN_BYTES (0 disables); brotli when brotli-asgi is
+# installed and the client accepts it, gzip otherwise. Registered first so it sits inside the
+# admission middleware: BaseHTTPMiddleware re-sends bodies as a stream, which would make every
+# response look large enough to compress.
+compression_min_bytes = int(os.environ.get("RAG_COMPRESSION_MIN_BYTES", "1024"))
+compression = None
+if compression_min_bytes > 0:
+    try:
+        from brotli_asgi import BrotliMiddleware
+        app.add_middleware(BrotliMiddleware, minimum_size=compression_min_bytes, quality=4, gzip_fallback=True)
+        compression = "br"
+    except ImportError:
+        app.add_middleware(GZipMiddleware, minimum_size=compression_min_bytes, compresslevel=6)
+        compression = "gzip"
+
+# Admission control: bounded pools per endpoint class, shedding with Retry-After when overloaded.
+# Registered before CORS so rejections still carry CORS headers.
+admission = AdmissionController.from_env()
+
+def _admission_pool(request: Request) -> Optional[str]:
+    path, method = request.url.path, request.method
+    if path == "/chat/completion":
+        return "chat"
+    if path in ("/upload-pdf", "/upload-pdfs") or (method == "DELETE" and path.startswith("/files/")):
+        return "upload"
+    if path.startswith("/files/") or path.startswith("/jobs"):
+        return "read"
+    return None
+
+@app.middleware("http")
+async def admission_control(request: Request, call_next):
+    """Admit or shed the request before its body is read; health and docs are never shed"""
+    pool_name = _admission_pool(request)
+    if pool_name is None:
+        return await call_next(request)
+    pool = admission.pool(pool_name)
+    try:
+        await pool.acquire()
+    except Overloaded as e:
+        _record_http(pool_name, e.status_code, 0.0)
+        return JSONResponse(
+            status_code=e.status_code,
+            content={"detail": f"Server busy: {e}", "pool": e.pool, "retry_after": e.retry_after},
+            headers={"Retry-After": str(e.retry_after)}
+        )
+    started = time.perf_counter()
+    status_code = 500
+    try:
+        response = await call_next(request)
+        status_code = response.status_code
+        return response
+    finally:
+        duration = time.perf_counter() - started
+        pool.release(duration)
+        _record_http(pool_name, status_code, duration)
+
+def _record_http(endpoint: str, status_code: int, duration: float):
+    metrics.inc(
+        "rag_http_requests_total", labels={"endpoint": endpoint, "status": str(status_code)},
+        help="HTTP requests by endpoint class and status"
+    )
+    if duration:
+        metrics.observe(
+            "rag_http_request_duration_seconds", duration, {"endpoint": endpoint},
+            help="Admitted HTTP request duration by endpoint class"
+        )
+
 # Add CORS middleware
 app.add_middleware(
     CORSMiddleware,
@@ -25,9 +108,92 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Initialize Agentic Workflow
+# Characters of chunk content returned per retrieved chunk unless a chat asks for full content
+chat_snippet_chars = int(os.environ.get("RAG_CHAT_SNIPPET_CHARS", "240"))
+
+# The Agentic Workflow (Firestore, Gemini, vector store) is created by a startup thread or on
+# first use, so importing this module and answering /live and /jobs never wait for it
 project_id = os.environ.get("GOOGLE_CLOUD_PROJECT", "your-project-id")
-workflow = AgenticWorkflow(project_id)
+_workflow = None
+_workflow_lock = threading.Lock()
+startup_state = {"started_at": time.time(), "ready_at": None, "error": None, "warmup_ms": None}
+
+def get_workflow():
+    """The shared AgenticWorkflow, created on first call"""
+    global _workflow
+    if _workflow is None:
+        with _workflow_lock:
+            if _workflow is None:
+                from agentic_workflow import AgenticWorkflow
+                workflow = AgenticWorkflow(project_id)
+                # Ingestion embedding calls wait while chat is saturated so interactive requests go first
+                workflow.vector_store.ingest_gate = admission.yield_to_interactive
+                _workflow = workflow
+    return _workflow
+
+async def _get_workflow_async():
+    """get_workflow() without blocking the event loop while the workflow initializes"""
+    return _workflow if _workflow is not None else await run_in_threadpool(get_workflow)
+
+# PDF uploads are parsed, embedded and stored by background workers
+ingestion_queue = IngestionQueue.from_env(get_workflow)
+max_ingest_backlog = int(os.environ.get("RAG_INGEST_MAX_BACKLOG", "200"))
+
+def _check_ingest_backlog(new_jobs: int = 1):
+    """Refuse new uploads while too many accepted jobs are still waiting for a worker"""
+    if ingestion_queue.backlog + new_jobs > max_ingest_backlog:
+        raise HTTPException(
+            status_code=503,
+            detail=f"Ingestion backlog full ({ingestion_queue.backlog} jobs waiting)",
+            headers={"Retry-After": "30"}
+        )
+
+# Optional background sync so uploads handled by other instances become searchable here
+index_synchronizer = None
+
+def _initialize():
+    """Create the workflow, warm it up and start the index synchronizer (RAG_INDEX_SYNC=listener|poll)"""
+    global index_synchronizer
+    try:
+        workflow = get_workflow()
+        # Load the indexes and open client connections so no request is routed to a cold instance
+        if os.environ.get("RAG_WARMUP", "1") == "1":
+            startup_state["warmup_ms"] = workflow.warm_up(embed=os.environ.get("RAG_WARMUP_EMBED", "1") == "1")
+            print(f"🔥 Warm-up done: {startup_state['warmup_ms']}")
+        sync_mode = os.environ.get("RAG_INDEX_SYNC")
+        if sync_mode:
+            index_synchronizer = IndexSynchronizer(
+                workflow.vector_store,
+                mode=sync_mode,
+                poll_interval=float(os.environ.get("RAG_INDEX_SYNC_INTERVAL", "5")),
+                max_staleness=float(os.environ.get("RAG_INDEX_MAX_STALENESS", "30"))
+            )
+            index_synchronizer.start()
+        startup_state["ready_at"] = time.time()
+        metrics.set_gauge(
+            "rag_startup_seconds", startup_state["ready_at"] - startup_state["started_at"],
+            help="Seconds from module import until the server reported ready"
+        )
+        print(f"✅ Ready {startup_state['ready_at'] - startup_state['started_at']:.2f}s after import")
+    except Exception as e:
+        startup_state["error"] = str(e)
+        print(f"❌ Startup initialization failed: {e}")
+
+@app.on_event("startup")
+async def start_initialization():
+    """Initialize in the background so the server accepts connections (and /live) immediately"""
+    threading.Thread(target=_initialize, name="startup-init", daemon=True).start()
+
+@app.on_event("startup")
+async def resume_ingestion_jobs():
+    """Pick up uploads that were queued or in progress when the server last stopped"""
+    ingestion_queue.resume()
+
+@app.on_event("shutdown")
+async def stop_index_sync():
+    if index_synchronizer is not None:
+        index_synchronizer.stop()
+    ingestion_queue.shutdown()
 
 # Pydantic models for API requests
 class ChatRequestModel(BaseModel):
@@ -38,28 +204,96 @@ class ChatRequestModel(BaseModel):
     allowed_file_ids: List[str]
     max_tokens: int = 1000
     temperature: float = 0.7
+    # Full content and metadata of retrieved chunks instead of snippet previews
+    include_content: bool = False
 
-class PDFUploadResponse(BaseModel):
+class IngestionJobResponse(BaseModel):
+    job_id: str
+    status: str
     file_id: str
     document_id: str
     title: str
-    class_name: str
-    subject_name: str
-    total_chunks: int
     message: str
 
+# Liveness and readiness probes
+@app.get("/live")
+async def liveness():
+    """The process is up and serving requests"""
+    return {"status": "alive"}
+
+@app.get("/ready")
+async def readiness():
+    """200 once initialization and warm-up have finished, 503 before that (or if they failed)"""
+    body = {
+        "ready": startup_state["ready_at"] is not None,
+        "uptime_seconds": round(time.time() - startup_state["started_at"], 3)
+    }
+    if startup_state["ready_at"] is not None:
+        body["startup_seconds"] = round(startup_state["ready_at"] - startup_state["started_at"], 3)
+        body["warmup_ms"] = startup_state["warmup_ms"]
+        return body
+    if startup_state["error"]:
+        body["error"] = startup_state["error"]
+    return JSONResponse(status_code=503, content=body)
+
 # Health check endpoint
 @app.get("/health")
 async def health_check():
     """Health check endpoint"""
-    return {
+    health = {
         "status": "healthy",
         "timestamp": datetime.utcnow().isoformat(),
-        "service": "Agentic RAG API with Gemini and Document AI"
+        "service": "Agentic RAG API with Gemini and Document AI",
+        "ready": startup_state["ready_at"] is not None
     }
+    workflow = _workflow
+    if workflow is not None:
+        health["storage"] = workflow.vector_store.storage.name
+    if index_synchronizer is not None:
+        health["index_sync"] = index_synchronizer.stats()
+    health["gemini"] = gemini_stats()
+    if workflow is not None:
+        health["coalescing"] = {
+            "chat": workflow.chat_flight.stats(),
+            "embedding": workflow.vector_store.embedding_flight.stats()
+        }
+        health["query_embedding_batches"] = workflow.vector_store.query_batcher.stats()
+        segments = workflow.vector_store.segment_stats()
+        if segments is not None:
+            health["index_segments"] = segments
+    health["ingestion"] = ingestion_queue.stats()
+    health["admission"] = admission.stats()
+    health["responses"] = {"json": fast_json.BACKEND, "compression": compression, "min_bytes": compression_min_bytes}
+    return health
+
+# Prometheus metrics endpoint
+@app.get("/metrics", response_class=PlainTextResponse)
+async def prometheus_metrics():
+    """Stage histograms and request counters in Prometheus text format (per server process)"""
+    for name, pool in admission.pools.items():
+        stats = pool.stats()
+        labels = {"pool": name}
+        metrics.set_gauge("rag_admission_in_flight", stats["in_flight"], labels, help="Requests running per admission pool")
+        metrics.set_gauge("rag_admission_queue_depth", stats["queue_depth"], labels, help="Requests waiting per admission pool")
+        for reason in ("queue_full", "timeout"):
+            metrics.set_counter(
+                "rag_admission_rejected_total", stats[f"rejected_{reason}"], {**labels, "reason": reason},
+                help="Requests shed by admission control"
+            )
+    ingestion = ingestion_queue.stats()
+    metrics.set_gauge("rag_ingestion_backlog", ingestion["backlog"], help="Ingestion jobs waiting for a worker")
+    metrics.set_gauge("rag_ingestion_active", ingestion["active"], help="Ingestion jobs being processed")
+    for name, client in gemini_stats().items():
+        for key in ("calls", "attempts", "retries", "throttled", "failures", "rejected", "hedges", "hedge_wins"):
+            if key in client:
+                metrics.set_counter(
+                    "rag_gemini_events_total", client[key], {"client": name, "event": key},
+                    help="Gemini client call, retry, throttle, failure and hedge counts"
+                )
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
 
 # Chat completion endpoint
-@app.post("/chat/completion", response_model=Dict[str, Any])
+@app.post("/chat/completion")
 async def chat_completion(request: ChatRequestModel):
     """
     Main chat completion endpoint with agentic retrieval and generation
@@ -76,16 +310,20 @@ async def chat_completion(request: ChatRequestModel):
             temperature=request.temperature
         )
         
-        # Process with agentic workflow
-        response = workflow.process_chat_request(chat_request)
+        # Process with agentic workflow off the event loop so identical requests can coalesce
+        workflow = await _get_workflow_async()
+        response = await run_in_threadpool(workflow.process_chat_request, chat_request)
         
-        return response.to_dict()
+        # Returned as a response object so FastAPI does not run it through jsonable_encoder
+        return FastJSONResponse(
+            response.to_dict(include_content=request.include_content, snippet_chars=chat_snippet_chars)
+        )
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Chat completion failed: {str(e)}")
 
 # PDF upload endpoint
-@app.post("/upload-pdf", response_model=PDFUploadResponse)
+@app.post("/upload-pdf", response_model=IngestionJobResponse, status_code=202)
 async def upload_pdf(
     file: UploadFile = File(...),
     title: str = Form(...),
@@ -93,17 +331,20 @@ async def upload_pdf(
     subject_name: str = Form(...),
     user_id: str = Form("default")
 ):
-    """Upload and process a PDF file using Document AI"""
+    """Queue a PDF for background processing; poll /jobs/{job_id} for progress"""
     try:
         # Validate file type
         if not file.filename.lower().endswith('.pdf'):
             raise HTTPException(status_code=400, detail="Only PDF files are supported")
         
+        _check_ingest_backlog()
+        
         # Read file content
         file_content = await file.read()
         
-        # Process PDF with agentic workflow
-        result = workflow.process_pdf_upload(
+        # Spool the file and record the job off the event loop
+        job = await run_in_threadpool(
+            ingestion_queue.submit,
             file_content=file_content,
             title=title,
             class_name=class_name,
@@ -111,26 +352,89 @@ async def upload_pdf(
             user_id=user_id
         )
         
-        return PDFUploadResponse(
-            file_id=result["file_id"],
-            document_id=result["document_id"],
-            title=result["title"],
-            class_name=result["class_name"],
-            subject_name=result["subject_name"],
-            total_chunks=result["total_chunks"],
-            message=result["message"]
+        return IngestionJobResponse(
+            job_id=job["id"],
+            status=job["status"],
+            file_id=job["file_id"],
+            document_id=job["document_id"],
+            title=job["title"],
+            message="PDF queued for processing"
         )
         
     except HTTPException:
         raise
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Failed to upload and process PDF: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Failed to queue PDF: {str(e)}")
+
+# Batch PDF upload endpoint
+@app.post("/upload-pdfs", status_code=202)
+async def upload_pdfs(
+    files: List[UploadFile] = File(...),
+    class_name: str = Form(...),
+    subject_name: str = Form(...),
+    user_id: str = Form("default")
+):
+    """Queue many PDFs (or zips of PDFs) to be parsed in parallel and stored with shared batches"""
+    max_files = int(os.environ.get("RAG_BATCH_MAX_FILES", "100"))
+    max_bytes = int(os.environ.get("RAG_BATCH_MAX_BYTES", str(500 * 1024 * 1024)))
+    try:
+        pdfs = []
+        for upload in files:
+            content = await upload.read()
+            try:
+                pdfs.extend(pdfs_from_upload(upload.filename, content, max_bytes))
+            except ValueError as e:
+                raise HTTPException(status_code=400, detail=str(e))
+        
+        if not pdfs:
+            raise HTTPException(status_code=400, detail="No PDF files found in the upload")
+        if len(pdfs) > max_files:
+            raise HTTPException(status_code=400, detail=f"At most {max_files} PDFs per batch")
+        if sum(len(pdf["file_content"]) for pdf in pdfs) > max_bytes:
+            raise HTTPException(status_code=400, detail=f"Batch exceeds {max_bytes} bytes")
+        _check_ingest_backlog(len(pdfs))
+        
+        batch = await run_in_threadpool(ingestion_queue.submit_batch, pdfs, class_name, subject_name, user_id)
+        
+        return {
+            "batch_id": batch["batch_id"],
+            "jobs": [
+                {"job_id": job["id"], "title": job["title"], "file_id": job["file_id"], "status": job["status"]}
+                for job in batch["jobs"]
+            ],
+            "message": f"{len(batch['jobs'])} PDFs queued for processing"
+        }
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to queue PDFs: {str(e)}")
+
+# Ingestion job endpoints
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """Stage, chunk progress and throughput of one ingestion job"""
+    job = ingestion_queue.store.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@app.get("/jobs")
+async def list_jobs(
+    status: Optional[str] = None,
+    batch_id: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=500)
+):
+    """Most recent ingestion jobs, optionally filtered by status or batch"""
+    jobs = ingestion_queue.store.list(status=status, limit=limit, batch_id=batch_id)
+    return {"jobs": jobs, "total": len(jobs), "counts": ingestion_queue.store.counts()}
 
 # Get file chunks endpoint
 @app.get("/files/{file_id}/chunks")
 async def get_file_chunks(file_id: str):
     """Get all chunks for a specific file"""
     try:
+        workflow = await _get_workflow_async()
         chunks = workflow.get_file_chunks(file_id)
         return {
             "file_id": file_id,
@@ -145,6 +449,7 @@ async def get_file_chunks(file_id: str):
 async def delete_file(file_id: str):
     """Delete all chunks for a specific file"""
     try:
+        workflow = await _get_workflow_async()
         success = workflow.delete_file(file_id)
         if not success:
             raise HTTPException(status_code=404, detail="File not found")
@@ -173,9 +478,15 @@ async def root():
         "endpoints": {
             "chat_completion": "/chat/completion",
             "upload_pdf": "/upload-pdf",
+            "upload_pdfs": "/upload-pdfs",
+            "get_job": "/jobs/{job_id}",
+            "list_jobs": "/jobs",
             "get_file_chunks": "/files/{file_id}/chunks",
             "delete_file": "/files/{file_id}",
-            "health_check": "/health"
+            "health_check": "/health",
+            "liveness": "/live",
+            "readiness": "/ready",
+            "metrics": "/metrics"
         },
         "usage": {
             "chat_completion": {
@@ -186,7 +497,8 @@ async def root():
                     "user_id": "user123",
                     "class_name": "12th Grade",
                     "subject_name": "Mathematics",
-                    "allowed_file_ids": ["file-uuid-1", "file-uuid-2"]
+                    "allowed_file_ids": ["file-uuid-1", "file-uuid-2"],
+                    "include_content": False
                 }
             },
             "upload_pdf": {
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+Sharded Search Harness
+Spawns N shard workers on localhost over an in-memory synthetic corpus and compares
+scatter-gather results and latency against a single-node index (no cloud access needed)
+"""
+
+import argparse
+import time
+import multiprocessing
+import numpy as np
+import requests
+
+from local_firestore import LocalFirestore
+from synthetic_corpus import generate_corpus, generate_queries, deterministic_embedding, load_corpus
+from sharding import ShardPartitioner, ShardCoordinator
+from hybrid_vector_store import HybridVectorStore
+
+def build_store(docs, partition_filter=None) -> HybridVectorStore:
+    """Two-stage HybridVectorStore over a LocalFirestore loaded with the corpus"""
+    db = LocalFirestore()
+    load_corpus(db, docs)
+    store = HybridVectorStore("local-harness", dense_mode="two_stage", db=db, partition_filter=partition_filter)
+    store._load_bm25_index()
+    return store
+
+def run_shard(shard_id: int, args, port: int, delay_ms: float):
+    """Shard worker process entry point"""
+    import uvicorn
+    from shard_server import create_shard_app
+
+    docs = generate_corpus(args.files, args.chunks_per_file)
+    partitioner = ShardPartitioner(args.shards, args.partition_by)
+    store = build_store(docs, partitioner.owns(shard_id))
+    uvicorn.run(create_shard_app(store, shard_id, delay_ms=delay_ms), host="127.0.0.1", port=port, log_level="warning")
+
+def wait_for_shards(urls, timeout: float = 120.0):
+    deadline = time.time() + timeout
+    pending = list(urls)
+    while pending and time.time() < deadline:
+        for url in list(pending):
+            try:
+                if requests.get(f"{url}/health", timeout=1).ok:
+                    pending.remove(url)
+            except requests.RequestException:
+                pass
+        time.sleep(0.2)
+    if pending:
+        raise RuntimeError(f"Shards did not start: {pending}")
+
+def percentile(values, q):
+    return float(np.percentile(values, q)) if values else 0.0
+
+def main():
+    """Main function"""
+    parser = argparse.ArgumentParser(description="Scatter-gather sharded search harness")
+    parser.add_argument("--shards", type=int, default=4, help="Number of shard workers")
+    parser.add_argument("--files", type=int, default=200, help="Synthetic files in the corpus")
+    parser.add_argument("--chunks-per-file", type=int, default=50, help="Chunks per file")
+    parser.add_argument("--queries", type=int, default=100, help="Number of queries")
+    parser.add_argument("--top-k", type=int, default=5, help="Results per query")
+    parser.add_argument("--partition-by", default="file_id", choices=ShardPartitioner.PARTITION_KEYS)
+    parser.add_argument("--fusion", default="score", choices=ShardCoordinator.FUSIONS)
+    parser.add_argument("--timeout", type=float, default=2.0, help="Per-shard timeout in seconds")
+    parser.add_argument("--slow-shard", type=int, default=None, help="Shard id to delay past the timeout")
+    parser.add_argument("--base-port", type=int, default=8600, help="First shard port")
+    args = parser.parse_args()
+
+    ctx = multiprocessing.get_context("spawn")
+    urls, processes = [], []
+    for shard_id in range(args.shards):
+        port = args.base_port + shard_id
+        delay_ms = args.timeout * 1500 if shard_id == args.slow_shard else 0.0
+        process = ctx.Process(target=run_shard, args=(shard_id, args, port, delay_ms), daemon=True)
+        process.start()
+        processes.append(process)
+        urls.append(f"http://127.0.0.1:{port}")
+
+    try:
+        print(f"🚀 Starting {args.shards} shards over {args.files * args.chunks_per_file} chunks...")
+        docs = generate_corpus(args.files, args.chunks_per_file)
+        reference = build_store(docs)
+        wait_for_shards(urls)
+
+        coordinator = ShardCoordinator(
+            urls, ShardPartitioner(args.shards, args.partition_by), timeout=args.timeout, fusion=args.fusion
+        )
+        queries = generate_queries(args.queries)
+
+        single_ms, sharded_ms, recalls, partial = [], [], [], 0
+        for query in queries:
+            embedding = deterministic_embedding(query)
+
+            start = time.perf_counter()
+            expected = reference.hybrid_search(query, top_k=args.top_k, query_embedding=embedding)
+            single_ms.append((time.perf_counter() - start) * 1000)
+
+            start = time.perf_counter()
+            results, info = coordinator.search(query, embedding, top_k=args.top_k)
+            sharded_ms.append((time.perf_counter() - start) * 1000)
+
+            partial += info["partial"]
+            expected_ids = {r.chunk_id for r in expected}
+            if expected_ids:
+                recalls.append(len(expected_ids & {r.chunk_id for r in results}) / len(expected_ids))
+
+        print(f"\n{'setup':<12}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+        for name, values in (("single", single_ms), ("sharded", sharded_ms)):
+            print(f"{name:<12}{percentile(values, 50):>10.2f}{percentile(values, 95):>10.2f}{percentile(values, 99):>10.2f}")
+        print(f"\nrecall@{args.top_k} vs single node: {np.mean(recalls):.3f}")
+        print(f"partial responses: {partial}/{len(queries)}")
+    finally:
+        for process in processes:
+            process.terminate()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Shard Search Worker
+Serves hybrid search over the partitions of the corpus owned by one shard
+"""
+
+import os
+import time
+from typing import List, Optional
+
+from fastapi import FastAPI, HTTPException
+from pydantic import BaseModel
+
+from sharding import ShardPartitioner
+
+class ShardSearchRequest(BaseModel):
+    query: str
+    query_embedding: Optional[List[float]] = None
+    class_name: Optional[str] = None
+    subject_name: Optional[str] = None
+    allowed_file_ids: Optional[List[str]] = None
+    top_k: int = 5
+    user_id: Optional[str] = None
+
+def create_shard_app(vector_store, shard_id: int, delay_ms: float = 0.0) -> FastAPI:
+    """Lightweight search endpoint around a partition-filtered HybridVectorStore"""
+    app = FastAPI(title=f"RAG Shard {shard_id}")
+
+    @app.get("/health")
+    def health():
+        health = {"status": "healthy", "shard_id": shard_id, "loaded": vector_store.bm25_index is not None}
+        if vector_store.synchronizer is not None:
+            health["index_sync"] = vector_store.synchronizer.stats()
+        return health
+
+    @app.post("/search")
+    def search(request: ShardSearchRequest):
+        start = time.perf_counter()
+        if delay_ms:
+            # Simulated slow shard for the local test harness
+            time.sleep(delay_ms / 1000)
+        try:
+            results = vector_store.hybrid_search(
+                query=request.query,
+                class_name=request.class_name,
+                subject_name=request.subject_name,
+                allowed_file_ids=request.allowed_file_ids,
+                top_k=request.top_k,
+                user_id=request.user_id,
+                query_embedding=request.query_embedding
+            )
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Shard search failed: {str(e)}")
+        return {
+            "shard_id": shard_id,
+            "results": [r.to_dict() for r in results],
+            "took_ms": (time.perf_counter() - start) * 1000
+        }
+
+    return app
+
+def main():
+    """Run one shard worker configured from the environment"""
+    import uvicorn
+    from hybrid_vector_store import HybridVectorStore
+    from index_sync import IndexSynchronizer
+
+    shard_id = int(os.environ["RAG_SHARD_ID"])
+    shard_count = int(os.environ["RAG_SHARD_COUNT"])
+    partitioner = ShardPartitioner(shard_count, os.environ.get("RAG_SHARD_PARTITION_BY", "file_id"))
+
+    project_id = os.environ.get("GOOGLE_CLOUD_PROJECT", "your-project-id")
+    vector_store = HybridVectorStore(project_id, dense_mode="two_stage", partition_filter=partitioner.owns(shard_id))
+    vector_store.warm_up(embed=False)
+    print(f"✅ Shard {shard_id}/{shard_count} loaded {len(vector_store.dense_index)} rows")
+
+    # Uploads go through the coordinator or other nodes; apply the ones in this shard's partition
+    sync_mode = os.environ.get("RAG_INDEX_SYNC", "poll")
+    if sync_mode != "off":
+        IndexSynchronizer(
+            vector_store,
+            mode=sync_mode,
+            poll_interval=float(os.environ.get("RAG_INDEX_SYNC_INTERVAL", "5")),
+            max_staleness=float(os.environ.get("RAG_INDEX_MAX_STALENESS", "30"))
+        ).start()
+
+    uvicorn.run(create_shard_app(vector_store, shard_id), host="0.0.0.0", port=int(os.environ.get("PORT", 8100 + shard_id)))
+
+if __name__ == "__main__":
+    main()
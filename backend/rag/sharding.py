@@ -0,0 +1,162 @@
+import os
+import time
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import List, Dict, Any, Optional, Callable, Tuple
+
+import requests
+
+from models import SearchResult
+
+class ShardPartitioner:
+    """Assigns embedding documents to shards by class/subject or by a hash of file_id"""
+
+    PARTITION_KEYS = ("file_id", "class_subject")
+
+    def __init__(self, shard_count: int, partition_by: str = "file_id"):
+        if partition_by not in self.PARTITION_KEYS:
+            raise ValueError(f"Unknown partition key '{partition_by}', expected one of {self.PARTITION_KEYS}")
+        self.shard_count = shard_count
+        self.partition_by = partition_by
+
+    def _shard_for_key(self, key: str) -> int:
+        digest = hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest()
+        return int.from_bytes(digest, "little") % self.shard_count
+
+    def shard_for(self, doc: Dict[str, Any]) -> int:
+        """Shard that owns an embedding document"""
+        if self.partition_by == "class_subject":
+            return self._shard_for_key(f"{doc.get('class_name')}/{doc.get('subject_name')}")
+        return self._shard_for_key(str(doc.get("file_id")))
+
+    def owns(self, shard_id: int) -> Callable[[Dict[str, Any]], bool]:
+        """Partition filter for HybridVectorStore on shard shard_id"""
+        return lambda doc: self.shard_for(doc) == shard_id
+
+    def shards_for_query(
+        self,
+        class_name: Optional[str] = None,
+        subject_name: Optional[str] = None,
+        allowed_file_ids: Optional[List[str]] = None
+    ) -> List[int]:
+        """Shards that can hold matches; fan-out is skipped for shards that cannot"""
+        if self.partition_by == "class_subject" and class_name and subject_name:
+            return [self.shard_for({"class_name": class_name, "subject_name": subject_name})]
+        if self.partition_by == "file_id" and allowed_file_ids:
+            return sorted({self.shard_for({"file_id": file_id}) for file_id in allowed_file_ids})
+        return list(range(self.shard_count))
+
+class ShardCoordinator:
+    """Scatter-gather hybrid search over shard workers with per-shard timeouts"""
+
+    FUSIONS = ("score", "rrf")
+
+    def __init__(
+        self,
+        shard_urls: List[str],
+        partitioner: Optional[ShardPartitioner] = None,
+        timeout: float = 2.0,
+        fusion: str = "score",
+        rrf_k: int = 60
+    ):
+        if fusion not in self.FUSIONS:
+            raise ValueError(f"Unknown fusion '{fusion}', expected one of {self.FUSIONS}")
+        self.shard_urls = [url.rstrip("/") for url in shard_urls]
+        self.partitioner = partitioner or ShardPartitioner(len(shard_urls))
+        self.timeout = timeout
+        self.fusion = fusion
+        self.rrf_k = rrf_k
+        self.executor = ThreadPoolExecutor(max_workers=max(4, len(shard_urls) * 2), thread_name_prefix="shard-fanout")
+        self._local = threading.local()
+
+    @classmethod
+    def from_env(cls) -> Optional["ShardCoordinator"]:
+        """Build from RAG_SHARD_URLS (comma-separated base URLs, in shard id order)"""
+        urls = [url.strip() for url in os.environ.get("RAG_SHARD_URLS", "").split(",") if url.strip()]
+        if not urls:
+            return None
+        partitioner = ShardPartitioner(len(urls), os.environ.get("RAG_SHARD_PARTITION_BY", "file_id"))
+        return cls(
+            urls,
+            partitioner=partitioner,
+            timeout=float(os.environ.get("RAG_SHARD_TIMEOUT", "2.0")),
+            fusion=os.environ.get("RAG_SHARD_FUSION", "score")
+        )
+
+    def _session(self) -> requests.Session:
+        # One keep-alive session per fan-out thread
+        if not hasattr(self._local, "session"):
+            self._local.session = requests.Session()
+        return self._local.session
+
+    def _query_shard(self, shard_id: int, payload: Dict[str, Any]) -> List[SearchResult]:
+        response = self._session().post(f"{self.shard_urls[shard_id]}/search", json=payload, timeout=self.timeout)
+        response.raise_for_status()
+        return [SearchResult.from_dict(r) for r in response.json()["results"]]
+
+    def search(
+        self,
+        query: str,
+        query_embedding: Optional[List[float]],
+        class_name: Optional[str] = None,
+        subject_name: Optional[str] = None,
+        allowed_file_ids: Optional[List[str]] = None,
+        top_k: int = 5,
+        user_id: Optional[str] = None
+    ) -> Tuple[List[SearchResult], Dict[str, Any]]:
+        """Fan out to the relevant shards, merge their top-k, and report failed/slow shards"""
+        start = time.perf_counter()
+        payload = {
+            "query": query,
+            "query_embedding": query_embedding,
+            "class_name": class_name,
+            "subject_name": subject_name,
+            "allowed_file_ids": allowed_file_ids,
+            "top_k": top_k,
+            "user_id": user_id
+        }
+        shard_ids = self.partitioner.shards_for_query(class_name, subject_name, allowed_file_ids)
+        futures = {self.executor.submit(self._query_shard, shard_id, payload): shard_id for shard_id in shard_ids}
+        done, not_done = wait(futures, timeout=self.timeout)
+
+        shard_results = {}
+        failed = {}
+        for future in done:
+            shard_id = futures[future]
+            try:
+                shard_results[shard_id] = future.result()
+            except Exception as e:
+                failed[shard_id] = str(e)
+        for future in not_done:
+            future.cancel()
+            failed[futures[future]] = "timeout"
+
+        merged = self._merge(list(shard_results.values()), top_k)
+        info = {
+            "shards_queried": len(shard_ids),
+            "shards_succeeded": len(shard_results),
+            "failed_shards": failed,
+            "partial": bool(failed),
+            "took_ms": (time.perf_counter() - start) * 1000
+        }
+        return merged, info
+
+    def _merge(self, result_lists: List[List[SearchResult]], top_k: int) -> List[SearchResult]:
+        """Score fusion across shards (hybrid score or reciprocal rank)"""
+        if self.fusion == "rrf":
+            fused: Dict[str, float] = {}
+            by_id: Dict[str, SearchResult] = {}
+            for results in result_lists:
+                for rank, result in enumerate(results, 1):
+                    fused[result.chunk_id] = fused.get(result.chunk_id, 0.0) + 1.0 / (self.rrf_k + rank)
+                    by_id.setdefault(result.chunk_id, result)
+            ranked = sorted(fused, key=fused.get, reverse=True)[:top_k]
+            return [by_id[chunk_id] for chunk_id in ranked]
+
+        best: Dict[str, SearchResult] = {}
+        for results in result_lists:
+            for result in results:
+                if result.chunk_id not in best or result.hybrid_score > best[result.chunk_id].hybrid_score:
+                    best[result.chunk_id] = result
+        return sorted(best.values(), key=lambda r: r.hybrid_score, reverse=True)[:top_k]
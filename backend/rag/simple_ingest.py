@@ -60,7 +60,7 @@ def ingest_pdf(pdf_path, title, class_name, subject_name, user_id="default"):
         
         # Store chunks in database
         print("💾 Storing chunks in database...")
-        chunk_ids = vector_store.store_chunks(result["chunks"])
+        chunk_ids = vector_store.store_chunks(result["chunks"], parents=result["parents"])
         
         print(f"✅ Successfully stored {len(chunk_ids)} chunks")
         
@@ -0,0 +1,42 @@
+import hashlib
+from collections import Counter
+from typing import List, Dict, Sequence
+
+import numpy as np
+
+def term_hash(term: str) -> int:
+    """Stable 64-bit hash of a BM25 term (Python's hash() is salted per process)"""
+    return int.from_bytes(hashlib.blake2b(term.encode("utf-8"), digest_size=8).digest(), "little")
+
+def tokenize(text: str) -> List[str]:
+    """Tokenizer shared by every BM25 index"""
+    return text.lower().split()
+
+def build_postings(
+    tokenized_docs: Sequence[List[str]],
+    doc_offset: int = 0
+) -> Dict[str, np.ndarray]:
+    """Flat (term hash, doc id, term frequency) triplets for a batch of documents"""
+    hashes, docs, freqs = [], [], []
+    for i, tokens in enumerate(tokenized_docs):
+        for term, freq in Counter(tokens).items():
+            hashes.append(term_hash(term))
+            docs.append(doc_offset + i)
+            freqs.append(freq)
+    return {
+        "hashes": np.array(hashes, dtype=np.uint64),
+        "docs": np.array(docs, dtype=np.int32),
+        "freqs": np.array(freqs, dtype=np.float32)
+    }
+
+def sort_postings(hashes: np.ndarray, docs: np.ndarray, freqs: np.ndarray) -> Dict[str, np.ndarray]:
+    """CSR postings (term_hashes, offsets, doc_ids, term_freqs) from unsorted triplets"""
+    order = np.lexsort((docs, hashes))
+    hashes, docs, freqs = hashes[order], docs[order], freqs[order]
+    term_hashes, starts = np.unique(hashes, return_index=True)
+    return {
+        "term_hashes": term_hashes,
+        "offsets": np.append(starts, len(hashes)).astype(np.int64),
+        "doc_ids": docs,
+        "term_freqs": freqs
+    }
@@ -6,28 +6,31 @@ Startup script for the Agentic RAG API
 import os
 import sys
 import subprocess
+import importlib.util
 import uvicorn
 from pathlib import Path
 
 def check_dependencies():
-    """Check if all required dependencies are installed"""
-    required_packages = [
-        'fastapi',
-        'uvicorn',
-        'google-generativeai',
-        'google-cloud-documentai',
-        'google-cloud-firestore',
-        'rank-bm25',
-        'numpy',
-        'requests'
-    ]
+    """Check if all required dependencies are installed (located, not imported, to keep startup fast)"""
+    required_packages = {
+        'fastapi': 'fastapi',
+        'uvicorn': 'uvicorn',
+        'google-generativeai': 'google.generativeai',
+        'google-cloud-firestore': 'google.cloud.firestore',
+        'firebase-admin': 'firebase_admin',
+        'unstructured': 'unstructured',
+        'numpy': 'numpy',
+        'requests': 'requests'
+    }
     
     missing_packages = []
     
-    for package in required_packages:
+    for package, module in required_packages.items():
         try:
-            __import__(package.replace('-', '_'))
+            found = importlib.util.find_spec(module) is not None
         except ImportError:
+            found = False
+        if not found:
             missing_packages.append(package)
     
     if missing_packages:
@@ -115,7 +118,7 @@ def main():
     print("\n✅ All checks passed!")
     print("🌐 Starting server at http://localhost:8000")
     print("📚 API documentation at http://localhost:8000/docs")
-    print("🔍 Health check at http://localhost:8000/health")
+    print("🔍 Health check at http://localhost:8000/health (probes: /live, /ready)")
     print("\nPress Ctrl+C to stop the server")
     print("=" * 50)
     
@@ -0,0 +1,311 @@
+import os
+import json
+import sqlite3
+import threading
+import numpy as np
+from typing import List, Dict, Any, Optional, Tuple, Iterator, Callable
+
+from local_firestore import LocalFirestore, _OPERATORS
+
+# (field, operator, value); operators are the Firestore ones used by the store: ==, in, >
+Filter = Tuple[str, str, Any]
+Write = Tuple[str, str, Dict[str, Any]]
+
+def _plain(data: Dict[str, Any], converted: Optional[Dict[int, list]] = None) -> Dict[str, Any]:
+    """Firestore only stores plain values: NumPy embeddings become lists here, at the storage boundary
+
+    converted memoizes lists by array identity, so a chunk doc and its embeddings doc written
+    in the same batch share one conversion.
+    """
+    if not any(isinstance(value, np.ndarray) for value in data.values()):
+        return data
+    converted = converted if converted is not None else {}
+    plain = {}
+    for key, value in data.items():
+        if isinstance(value, np.ndarray):
+            if id(value) not in converted:
+                converted[id(value)] = value.tolist()
+            value = converted[id(value)]
+        plain[key] = value
+    return plain
+
+class StorageBackend:
+    """Document storage behind HybridVectorStore and IndexSynchronizer
+
+    Documents are plain dicts addressed by (collection, doc_id). Backends implement
+    bulk puts, point gets, filtered streams and bulk deletes; change listeners are optional.
+    """
+
+    name = "base"
+    supports_listener = False
+    bucket = None
+
+    def put(self, collection: str, doc_id: str, data: Dict[str, Any]):
+        self.put_many([(collection, doc_id, data)])
+
+    def put_many(self, writes: List[Write]):
+        raise NotImplementedError
+
+    def get(self, collection: str, doc_id: str) -> Optional[Dict[str, Any]]:
+        raise NotImplementedError
+
+    def get_many(self, collection: str, doc_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        docs = {}
+        for doc_id in doc_ids:
+            data = self.get(collection, doc_id)
+            if data is not None:
+                docs[doc_id] = data
+        return docs
+
+    def stream(
+        self,
+        collection: str,
+        filters: Optional[List[Filter]] = None,
+        order_by: Optional[str] = None
+    ) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        """(doc_id, data) for every doc matching all filters"""
+        raise NotImplementedError
+
+    def delete_many(self, collection: str, doc_ids: List[str]):
+        raise NotImplementedError
+
+    def delete_where(self, collection: str, filters: List[Filter]) -> List[str]:
+        """Delete every doc matching the filters; returns the deleted ids"""
+        doc_ids = [doc_id for doc_id, _ in self.stream(collection, filters)]
+        self.delete_many(collection, doc_ids)
+        return doc_ids
+
+    def watch(self, collection: str, callback: Callable):
+        """Subscribe to a Firestore-style change stream; returns a handle with unsubscribe()"""
+        raise NotImplementedError(f"{self.name} storage has no change listener, use RAG_INDEX_SYNC=poll")
+
+    def close(self):
+        pass
+
+class FirestoreStorage(StorageBackend):
+    """Firestore (or the LocalFirestore emulation) with batched writes"""
+
+    name = "firestore"
+    supports_listener = True
+
+    def __init__(self, db, bucket=None, write_batch_ops: Optional[int] = None):
+        self.db = db
+        self.bucket = bucket
+        # Firestore allows at most 500 writes per batch commit
+        self.write_batch_ops = write_batch_ops or int(os.environ.get("RAG_WRITE_BATCH_OPS", "400"))
+        if isinstance(db, LocalFirestore):
+            self.name, self.supports_listener = "memory", False
+
+    def put_many(self, writes: List[Write]):
+        # The in-memory emulation serializes nothing, so it keeps embedding arrays as they are
+        convert = _plain if self.name != "memory" else lambda data, converted=None: data
+        if len(writes) == 1:
+            collection, doc_id, data = writes[0]
+            self.db.collection(collection).document(doc_id).set(convert(data))
+            return
+        converted: Dict[int, list] = {}
+        for start in range(0, len(writes), self.write_batch_ops):
+            batch = self.db.batch()
+            for collection, doc_id, data in writes[start:start + self.write_batch_ops]:
+                batch.set(self.db.collection(collection).document(doc_id), convert(data, converted))
+            batch.commit()
+
+    def get(self, collection: str, doc_id: str) -> Optional[Dict[str, Any]]:
+        doc = self.db.collection(collection).document(doc_id).get()
+        return doc.to_dict() if doc.exists else None
+
+    def stream(
+        self,
+        collection: str,
+        filters: Optional[List[Filter]] = None,
+        order_by: Optional[str] = None
+    ) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        query = self.db.collection(collection)
+        for field, op, value in filters or []:
+            query = query.where(field, op, value)
+        if order_by:
+            query = query.order_by(order_by)
+        for doc in query.stream():
+            yield doc.id, doc.to_dict()
+
+    def delete_many(self, collection: str, doc_ids: List[str]):
+        for start in range(0, len(doc_ids), self.write_batch_ops):
+            batch = self.db.batch()
+            for doc_id in doc_ids[start:start + self.write_batch_ops]:
+                batch.delete(self.db.collection(collection).document(doc_id))
+            batch.commit()
+
+    def watch(self, collection: str, callback: Callable):
+        if not self.supports_listener:
+            return super().watch(collection, callback)
+        return self.db.collection(collection).on_snapshot(callback)
+
+class SQLiteStorage(StorageBackend):
+    """Single-file local store: SQLite in WAL mode with float32 blob-packed vectors
+
+    Fields the store filters on are real indexed columns, so scoped streams and
+    watermark polls are index range scans; everything else lives in a JSON column.
+    One connection per thread lets readers proceed concurrently with the writer.
+    """
+
+    name = "sqlite"
+    # Filterable fields stored as indexed columns
+    COLUMNS = ("file_id", "class_name", "subject_name", "user_id", "indexed_at", "deleted_at")
+    # List-of-float fields packed as float32 blobs instead of JSON text
+    VECTORS = ("dense_embedding", "sparse_embedding")
+
+    def __init__(self, path: str = "rag_store.db"):
+        self.path = path
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._local = threading.local()
+        self._write_lock = threading.Lock()
+        conn = self._conn()
+        with conn:
+            conn.execute(f"""
+                CREATE TABLE IF NOT EXISTS documents (
+                    collection TEXT NOT NULL,
+                    id TEXT NOT NULL,
+                    data TEXT NOT NULL,
+                    {", ".join(f"{c} TEXT" for c in self.COLUMNS)},
+                    {", ".join(f"{v} BLOB" for v in self.VECTORS)},
+                    PRIMARY KEY (collection, id)
+                )
+            """)
+            for column in self.COLUMNS:
+                conn.execute(f"CREATE INDEX IF NOT EXISTS idx_documents_{column} ON documents (collection, {column})")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_documents_scope ON documents (collection, class_name, subject_name)")
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _row(self, collection: str, doc_id: str, data: Dict[str, Any]) -> tuple:
+        body = {k: v for k, v in data.items() if k not in self.VECTORS}
+        vectors = []
+        for field in self.VECTORS:
+            value = data.get(field)
+            vectors.append(None if value is None else np.asarray(value, dtype=np.float32).tobytes())
+        columns = [None if data.get(c) is None else str(data.get(c)) for c in self.COLUMNS]
+        return (collection, doc_id, json.dumps(body), *columns, *vectors)
+
+    def _decode(self, data: str, blobs: tuple) -> Dict[str, Any]:
+        doc = json.loads(data)
+        for field, blob in zip(self.VECTORS, blobs):
+            if blob is not None:
+                doc[field] = np.frombuffer(blob, dtype=np.float32).tolist()
+        return doc
+
+    def put_many(self, writes: List[Write]):
+        if not writes:
+            return
+        placeholders = ", ".join("?" * (3 + len(self.COLUMNS) + len(self.VECTORS)))
+        conn = self._conn()
+        with self._write_lock, conn:
+            conn.executemany(
+                f"INSERT OR REPLACE INTO documents VALUES ({placeholders})",
+                [self._row(collection, doc_id, data) for collection, doc_id, data in writes]
+            )
+
+    def get(self, collection: str, doc_id: str) -> Optional[Dict[str, Any]]:
+        return self.get_many(collection, [doc_id]).get(doc_id)
+
+    def get_many(self, collection: str, doc_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        docs = {}
+        vectors = ", ".join(self.VECTORS)
+        for start in range(0, len(doc_ids), 500):
+            ids = doc_ids[start:start + 500]
+            rows = self._conn().execute(
+                f"SELECT id, data, {vectors} FROM documents WHERE collection = ? AND id IN ({', '.join('?' * len(ids))})",
+                [collection, *ids]
+            )
+            for doc_id, data, *blobs in rows:
+                docs[doc_id] = self._decode(data, blobs)
+        return docs
+
+    def _where(self, collection: str, filters: Optional[List[Filter]]) -> Tuple[str, list, List[Filter]]:
+        """SQL for filters on indexed columns; the rest are applied in Python"""
+        clauses, params, remaining = ["collection = ?"], [collection], []
+        for field, op, value in filters or []:
+            if field in self.COLUMNS and op in ("==", ">", ">=", "<", "<="):
+                clauses.append(f"{field} {'=' if op == '==' else op} ?")
+                params.append(str(value))
+            elif field in self.COLUMNS and op == "in":
+                values = [str(v) for v in value]
+                if not values:
+                    clauses.append("0")
+                else:
+                    clauses.append(f"{field} IN ({', '.join('?' * len(values))})")
+                    params.extend(values)
+            else:
+                remaining.append((field, op, value))
+        return " AND ".join(clauses), params, remaining
+
+    def stream(
+        self,
+        collection: str,
+        filters: Optional[List[Filter]] = None,
+        order_by: Optional[str] = None
+    ) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        where, params, remaining = self._where(collection, filters)
+        sql = f"SELECT id, data, {', '.join(self.VECTORS)} FROM documents WHERE {where}"
+        if order_by in self.COLUMNS:
+            sql += f" ORDER BY {order_by}"
+        rows = self._conn().execute(sql, params)
+        docs = ((doc_id, self._decode(data, blobs)) for doc_id, data, *blobs in rows)
+        if remaining:
+            docs = (
+                (doc_id, doc) for doc_id, doc in docs
+                if all(_OPERATORS[op](doc.get(field), value) for field, op, value in remaining)
+            )
+        if order_by and order_by not in self.COLUMNS:
+            docs = iter(sorted(docs, key=lambda item: item[1].get(order_by) or ""))
+        yield from docs
+
+    def delete_many(self, collection: str, doc_ids: List[str]):
+        conn = self._conn()
+        with self._write_lock, conn:
+            conn.executemany(
+                "DELETE FROM documents WHERE collection = ? AND id = ?",
+                [(collection, doc_id) for doc_id in doc_ids]
+            )
+
+    def delete_where(self, collection: str, filters: List[Filter]) -> List[str]:
+        where, params, remaining = self._where(collection, filters)
+        if remaining:
+            return super().delete_where(collection, filters)
+        conn = self._conn()
+        with self._write_lock, conn:
+            doc_ids = [row[0] for row in conn.execute(f"SELECT id FROM documents WHERE {where}", params)]
+            conn.execute(f"DELETE FROM documents WHERE {where}", params)
+        return doc_ids
+
+    def close(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+def create_storage_backend(backend: Optional[str] = None) -> StorageBackend:
+    """Storage selected by RAG_STORAGE_BACKEND: firestore (default), sqlite or memory"""
+    backend = (backend or os.environ.get("RAG_STORAGE_BACKEND", "firestore")).lower()
+    if backend == "firestore":
+        from firebase_gemini_init import initialize_services
+        db, bucket = initialize_services()
+        return FirestoreStorage(db, bucket)
+
+    from firebase_gemini_init import initialize_gemini
+    initialize_gemini()
+    if backend == "sqlite":
+        path = os.environ.get("RAG_SQLITE_PATH", "rag_store.db")
+        print(f"📚 Using SQLite storage at {path}")
+        return SQLiteStorage(path)
+    if backend == "memory":
+        print("⚠️ Using in-memory storage; documents are lost on restart")
+        return FirestoreStorage(LocalFirestore())
+    raise ValueError(f"Unknown storage backend '{backend}', expected 'firestore', 'sqlite' or 'memory'")
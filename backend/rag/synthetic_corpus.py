@@ -0,0 +1,86 @@
+import hashlib
+from functools import lru_cache
+from datetime import datetime
+from typing import List, Dict, Any
+
+import numpy as np
+
+# Small vocabulary per topic so BM25 has something meaningful to match
+_TOPIC_WORDS = [
+    "algebra", "geometry", "calculus", "photosynthesis", "cells", "genetics", "atoms", "molecules",
+    "reactions", "electricity", "magnetism", "motion", "poetry", "grammar", "novel", "history",
+    "empire", "revolution", "climate", "rivers", "mountains", "economy", "trade", "democracy"
+]
+_FILLER_WORDS = ["the", "and", "of", "in", "is", "to", "a", "for", "with", "as", "by", "on"]
+
+@lru_cache(maxsize=65536)
+def _word_vector(word: str, dimension: int) -> np.ndarray:
+    seed = int.from_bytes(hashlib.blake2b(word.encode("utf-8"), digest_size=8).digest(), "little")
+    weight = 0.2 if word in _FILLER_WORDS else 1.0
+    return weight * np.random.default_rng(seed).standard_normal(dimension).astype(np.float32)
+
+def deterministic_embedding(text: str, dimension: int = 768) -> List[float]:
+    """Stable pseudo-embedding: topic words pull vectors together, so similar texts score higher"""
+    vector = np.zeros(dimension, dtype=np.float32)
+    # Word vectors are cached: the synthetic vocabulary is small and regenerating them dominated
+    for word in text.lower().split():
+        vector += _word_vector(word, dimension)
+    norm = np.linalg.norm(vector)
+    return (vector / norm if norm else vector).tolist()
+
+def generate_corpus(
+    num_files: int,
+    chunks_per_file: int,
+    classes: List[str] = ("Grade 10", "Grade 11", "Grade 12"),
+    subjects: List[str] = ("Mathematics", "Science", "English", "History"),
+    words_per_chunk: int = 120,
+    dimension: int = 768,
+    seed: int = 0
+) -> List[Dict[str, Any]]:
+    """Embedding-collection documents for N files x M chunks spread across classes/subjects"""
+    rng = np.random.default_rng(seed)
+    docs = []
+    for file_index in range(num_files):
+        file_id = f"file-{file_index:05d}"
+        document_id = f"doc-{file_index:05d}"
+        class_name = classes[file_index % len(classes)]
+        subject_name = subjects[(file_index // len(classes)) % len(subjects)]
+        topics = rng.choice(_TOPIC_WORDS, size=3, replace=False)
+        for chunk_index in range(chunks_per_file):
+            words = rng.choice(
+                list(topics) + _FILLER_WORDS, size=words_per_chunk,
+                p=[0.15, 0.1, 0.05] + [0.7 / len(_FILLER_WORDS)] * len(_FILLER_WORDS)
+            )
+            content = " ".join(words) + f" section{chunk_index} {file_id}"
+            chunk_id = f"{file_id}-chunk-{chunk_index:04d}"
+            now = datetime.utcnow().isoformat()
+            docs.append({
+                "chunk_id": chunk_id,
+                "document_id": document_id,
+                "dense_embedding": deterministic_embedding(content, dimension),
+                "sparse_embedding": [],
+                "content": content,
+                "class_name": class_name,
+                "subject_name": subject_name,
+                "file_id": file_id,
+                "chunk_index": chunk_index,
+                "metadata": {"title": f"Synthetic {file_id}", "user_id": "default"},
+                "user_id": "default",
+                "created_at": now,
+                "indexed_at": now
+            })
+    return docs
+
+def generate_queries(num_queries: int, seed: int = 1) -> List[str]:
+    """Short topical questions drawn from the same vocabulary"""
+    rng = np.random.default_rng(seed)
+    return [
+        f"explain {' and '.join(rng.choice(_TOPIC_WORDS, size=2, replace=False))}"
+        for _ in range(num_queries)
+    ]
+
+def load_corpus(db, docs: List[Dict[str, Any]], collection: str = "embeddings"):
+    """Write corpus documents into a Firestore-compatible client"""
+    col = db.collection(collection)
+    for doc in docs:
+        col.document(doc["chunk_id"]).set(doc)
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Admission Control Test
+Queue-full (429) and queue-timeout (503) shedding with Retry-After, directly on AdmissionPool
+and through the server middleware (no cloud access needed; run with pytest)
+"""
+
+import json
+import asyncio
+
+import pytest
+
+from admission import AdmissionPool, Overloaded
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+def test_full_queue_is_rejected_with_429():
+    async def scenario():
+        pool = AdmissionPool("chat", max_concurrent=1, max_queue=1, max_wait=5)
+        await pool.acquire()
+        waiter = asyncio.ensure_future(pool.acquire())
+        await asyncio.sleep(0)
+        with pytest.raises(Overloaded) as rejected:
+            await pool.acquire()
+        pool.release(4.0)
+        await waiter
+        return pool, rejected.value
+
+    pool, error = run(scenario())
+    assert error.status_code == 429 and error.retry_after >= 1
+    stats = pool.stats()
+    assert stats["rejected_queue_full"] == 1 and stats["admitted"] == 2
+    # The slot was handed to the waiter, not returned to the pool
+    assert stats["in_flight"] == 1 and stats["queue_depth"] == 0
+
+def test_queue_wait_past_max_wait_is_rejected_with_503():
+    async def scenario():
+        pool = AdmissionPool("chat", max_concurrent=1, max_queue=4, max_wait=0.05)
+        await pool.acquire()
+        with pytest.raises(Overloaded) as rejected:
+            await pool.acquire()
+        return pool, rejected.value
+
+    pool, error = run(scenario())
+    assert error.status_code == 503 and error.retry_after >= 1
+    assert pool.stats()["rejected_timeout"] == 1 and pool.queue_depth == 0 and pool.in_flight == 1
+
+def test_retry_after_grows_with_service_time_and_backlog():
+    pool = AdmissionPool("upload", max_concurrent=2, max_queue=10, max_wait=5)
+    assert pool.retry_after() == 1
+    for _ in range(20):
+        pool.in_flight += 1
+        pool.release(10.0)
+    # One queued-or-arriving request over two slots at ~10s each
+    assert pool.retry_after() == 5
+
+def test_cancelled_waiter_gives_back_its_slot():
+    async def scenario():
+        pool = AdmissionPool("chat", max_concurrent=1, max_queue=2, max_wait=5)
+        await pool.acquire()
+        waiter = asyncio.ensure_future(pool.acquire())
+        await asyncio.sleep(0)
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        pool.release()
+        return pool
+
+    pool = run(scenario())
+    assert pool.in_flight == 0 and pool.queue_depth == 0
+
+@pytest.fixture
+def server(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("RAG_JOB_DB", str(tmp_path / "jobs.db"))
+    monkeypatch.setenv("RAG_JOB_UPLOAD_DIR", str(tmp_path / "uploads"))
+    import server
+    pools = dict(server.admission.pools)
+    yield server
+    server.admission.pools.clear()
+    server.admission.pools.update(pools)
+
+async def request(app, method, path):
+    """Status, headers and JSON body of one request sent straight to the ASGI app"""
+    messages = []
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+    async def send(message):
+        messages.append(message)
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": method,
+        "scheme": "http", "path": path, "raw_path": path.encode(), "root_path": "", "query_string": b"",
+        "headers": [], "client": ("test", 1), "server": ("test", 80)
+    }
+    await app(scope, receive, send)
+    start = messages[0]
+    body = b"".join(message.get("body", b"") for message in messages[1:])
+    return start["status"], {k.decode().lower(): v.decode() for k, v in start["headers"]}, json.loads(body)
+
+@pytest.mark.parametrize("max_queue, max_wait, status", [(0, 5, 429), (1, 0.05, 503)])
+def test_middleware_sheds_with_retry_after(server, max_queue, max_wait, status):
+    async def scenario():
+        pool = AdmissionPool("chat", max_concurrent=1, max_queue=max_queue, max_wait=max_wait)
+        server.admission.pools["chat"] = pool
+        await pool.acquire()
+        return await request(server.app, "POST", "/chat/completion")
+
+    code, headers, body = run(scenario())
+    assert code == status
+    assert int(headers["retry-after"]) >= 1
+    assert body["pool"] == "chat" and body["retry_after"] == int(headers["retry-after"])
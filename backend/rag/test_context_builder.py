@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+"""
+Context Builder Test
+Merging, deduplication and compression of retrieved chunks into one prompt budget
+(no cloud access needed; run with pytest)
+"""
+
+from models import SearchResult
+from context_builder import ContextBuilder
+from context_compressor import ContextCompressor
+
+OVERLAP = 60
+
+def sentences(topic, start, count):
+    return " ".join(f"Sentence {i} explains how {topic} changes the motion of a body in detail." for i in range(start, start + count))
+
+def result(file_id, chunk_index, content, score):
+    return SearchResult(
+        chunk_id=f"{file_id}-{chunk_index}", document_id=f"doc-{file_id}", content=content,
+        class_name="Grade 10", subject_name="Physics", file_id=file_id,
+        dense_score=score, sparse_score=score, hybrid_score=score,
+        metadata={"title": file_id, "overlap": OVERLAP}, chunk_index=chunk_index
+    )
+
+def retrieved():
+    first = sentences("friction", 0, 20)
+    second = first[-OVERLAP:] + " " + sentences("gravity", 20, 20)
+    return [
+        result("notes", 0, first, 0.9),
+        result("notes", 1, second, 0.8),
+        # Same text as chunk 0 under another file: dropped by MMR before compression
+        result("copy", 0, first, 0.7)
+    ]
+
+def compress_with(compressor, query):
+    return lambda passages, budget: compressor.compress(query, passages, budget)
+
+def test_overlapping_chunks_are_merged_before_compression():
+    """Adjacent chunks become one passage; compression keeps its matching sentences, not a join of chunks"""
+    builder = ContextBuilder(token_budget=200)
+    packed = builder.build(retrieved(), compress=compress_with(ContextCompressor(), "gravity motion"))
+
+    assert [p.chunk_ids for p in packed.passages] == [["notes-0", "notes-1"]]
+    assert packed.dropped_duplicates == 1
+    assert packed.passages[0].label() == "notes, parts 1-2"
+    assert "gravity" in packed.text
+    assert packed.tokens <= builder.token_budget
+
+def test_compression_fills_the_builder_budget_only():
+    """Compressed context stays within RAG_CONTEXT_TOKENS, the only budget"""
+    for budget in (60, 150, 400):
+        builder = ContextBuilder(token_budget=budget)
+        packed = builder.build(retrieved(), compress=compress_with(ContextCompressor(), "friction"))
+        assert 0 < packed.tokens <= budget
+
+def test_without_compression_passages_are_trimmed_to_the_budget():
+    builder = ContextBuilder(token_budget=150)
+    packed = builder.build(retrieved())
+    assert [p.chunk_ids for p in packed.passages] == [["notes-0", "notes-1"]]
+    assert packed.tokens <= 150
@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+"""
+Fast JSON Test
+The stdlib fallback writes responses the way orjson does, including non-finite floats as null
+(no cloud access needed; run with pytest)
+"""
+
+import json
+
+import numpy as np
+import pytest
+
+import fast_json
+
+RESPONSE = {
+    "response": "Snell's law — n₁ sin θ₁ = n₂ sin θ₂",
+    "retrieved_chunks": [
+        {"chunk_id": "c1", "hybrid_score": float("nan"), "dense_score": float("inf"), "sparse_score": 1.5},
+        {"chunk_id": "c2", "hybrid_score": np.float32(0.25), "dense_score": -float("inf"), "sparse_score": 0.0}
+    ],
+    "metadata": {"timings": np.array([1.0, np.nan]), "offsets": (3, 7)}
+}
+
+EXPECTED = {
+    "response": "Snell's law — n₁ sin θ₁ = n₂ sin θ₂",
+    "retrieved_chunks": [
+        {"chunk_id": "c1", "hybrid_score": None, "dense_score": None, "sparse_score": 1.5},
+        {"chunk_id": "c2", "hybrid_score": 0.25, "dense_score": None, "sparse_score": 0.0}
+    ],
+    "metadata": {"timings": [1.0, None], "offsets": [3, 7]}
+}
+
+@pytest.fixture
+def stdlib(monkeypatch):
+    monkeypatch.setattr(fast_json, "orjson", None)
+
+def test_fallback_writes_non_finite_floats_as_null(stdlib):
+    assert json.loads(fast_json.dumps(RESPONSE)) == EXPECTED
+
+def test_fallback_matches_orjson(monkeypatch):
+    if fast_json.orjson is None:
+        pytest.skip("orjson not installed")
+    expected = fast_json.dumps(RESPONSE)
+    monkeypatch.setattr(fast_json, "orjson", None)
+    assert fast_json.dumps(RESPONSE) == expected
+
+def test_fallback_still_rejects_unserializable_values(stdlib):
+    with pytest.raises(TypeError):
+        fast_json.dumps({"value": object()})
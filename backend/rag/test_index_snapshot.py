@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+Index Snapshot Test
+Shared snapshot segments across two stores in one directory: incremental publishes, tombstone
+purging and collection of superseded snapshots (no cloud access needed; run with pytest)
+"""
+
+import io
+import os
+import contextlib
+
+import numpy as np
+from rank_bm25 import BM25Okapi
+
+from fake_gemini import FakeGemini
+from local_firestore import LocalFirestore
+from storage_backends import FirestoreStorage
+from hybrid_vector_store import HybridVectorStore
+from benchmark_suite import corpus_chunks
+from sparse_index import tokenize
+
+def make_stores(directory, count=2):
+    backend = FakeGemini()
+    storage = FirestoreStorage(LocalFirestore())
+    stores = []
+    for _ in range(count):
+        store = HybridVectorStore("snapshot-test", dense_mode="two_stage", snapshot_dir=str(directory), storage=storage)
+        store.embedding_client = backend
+        store.snapshot_store.check_interval = 0
+        stores.append(store)
+    return stores
+
+def snapshot_dirs(directory):
+    return [name for name in os.listdir(directory) if name.startswith("snap-")]
+
+def test_publish_writes_only_new_segments(tmp_path, monkeypatch):
+    """An upload adds a head segment; the sealed segments on disk are reused, not rewritten"""
+    monkeypatch.setenv("RAG_HEAD_SEGMENT_ROWS", "1000")
+    writer, = make_stores(tmp_path, 1)
+    chunks = corpus_chunks(10, 10)
+    with contextlib.redirect_stdout(io.StringIO()):
+        writer.store_chunks_batched(chunks[:80])
+        writer.warm_up(embed=False)
+        sealed = writer.snapshot.manifest["segments"]
+        writer.store_chunks_batched(chunks[80:])
+    manifest = writer.snapshot.manifest
+    assert manifest["segments"] == sealed and manifest["head"] is not None
+    assert manifest["rows"] == len(chunks)
+
+def test_deletes_are_purged_and_bm25_matches_live_corpus(tmp_path, monkeypatch):
+    """Segments past the tombstone ratio are merged at publish time; BM25 counts live rows only"""
+    monkeypatch.setenv("RAG_HEAD_SEGMENT_ROWS", "20")
+    monkeypatch.setenv("RAG_MAX_SEGMENTS", "3")
+    writer, reader = make_stores(tmp_path)
+    chunks = corpus_chunks(12, 10)
+    with contextlib.redirect_stdout(io.StringIO()):
+        writer.store_chunks_batched(chunks[:60])
+        writer.warm_up(embed=False)
+        for start in range(60, 120, 20):
+            writer.store_chunks_batched(chunks[start:start + 20])
+        for chunk in chunks[:60:10]:
+            writer.delete_chunks_by_file_id(chunk.file_id)
+        reader.warm_up(embed=False)
+
+    index = reader.segmented_index
+    assert index.stats()["tombstones"] < len(index) * 0.2
+    assert len(index.segments) <= 3
+    live = [row for row in range(len(index)) if index.alive is None or index.alive[row]]
+    assert len(live) == 60
+    query = tokenize("physics energy theory")
+    expected = BM25Okapi([tokenize(index.records[row].content) for row in live]).get_scores(query)
+    assert np.allclose(index.get_scores(query)[live], expected, atol=1e-4)
+
+def test_superseded_snapshots_are_collected_after_readers_move_on(tmp_path):
+    """A snapshot a reader still uses is kept; once it switches, the next publish deletes it"""
+    writer, reader = make_stores(tmp_path)
+    chunks = corpus_chunks(4, 10)
+    with contextlib.redirect_stdout(io.StringIO()):
+        writer.store_chunks_batched(chunks[:10])
+        writer.warm_up(embed=False)
+        reader.warm_up(embed=False)
+        held = reader.snapshot.path
+        for start in range(10, 40, 10):
+            writer.store_chunks_batched(chunks[start:start + 10])
+        assert os.path.exists(held)
+
+        reader.hybrid_search("physics", top_k=3)
+        writer.store_chunks_batched(chunks[:5])
+    assert not os.path.exists(held)
+    # The current snapshot and the one the writer replaced during its last publish
+    assert len(snapshot_dirs(tmp_path)) <= 2
+    listed = set(reader.snapshot.segment_names) | set(writer.snapshot.segment_names)
+    assert set(os.listdir(tmp_path / "segments")) <= listed
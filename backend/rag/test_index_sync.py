@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Index Sync Test
+Two vector stores over one in-memory storage: what one writes, the other's poll sync must serve
+(no cloud access needed; run with pytest)
+"""
+
+import io
+import contextlib
+from dataclasses import replace
+
+from fake_gemini import FakeGemini
+from local_firestore import LocalFirestore
+from storage_backends import FirestoreStorage
+from benchmark_suite import corpus_chunks, make_store
+from index_sync import IndexSynchronizer
+from document_processor import DocumentProcessor
+
+def make_pair(chunks=None, parents=None):
+    """Writer and reader stores sharing one storage, the reader loaded and synced"""
+    backend = FakeGemini()
+    storage = FirestoreStorage(LocalFirestore())
+    writer = make_store(storage, backend, "exact")
+    reader = make_store(storage, backend, "exact")
+    chunks = chunks or corpus_chunks(3, 5)
+    with contextlib.redirect_stdout(io.StringIO()):
+        writer.store_chunks_batched(chunks, parents=parents)
+        reader._load_bm25_index()
+    sync = IndexSynchronizer(reader, mode="poll")
+    assert sync.sync_once()
+    return writer, reader, sync, chunks
+
+def search(store, query):
+    with contextlib.redirect_stdout(io.StringIO()):
+        return {result.chunk_id: result.content for result in store.hybrid_search(query, top_k=20)}
+
+def test_poll_applies_new_chunks():
+    """Chunks stored by another node become searchable after one poll"""
+    writer, reader, sync, chunks = make_pair()
+    extra = [replace(chunk, id=f"{chunk.id}-extra", content="quokka " + chunk.content) for chunk in chunks[:2]]
+    with contextlib.redirect_stdout(io.StringIO()):
+        writer.store_chunks_batched(extra)
+        assert sync.sync_once()
+    found = search(reader, "quokka")
+    assert {chunk.id for chunk in extra} <= set(found)
+
+def test_poll_applies_reindexed_content():
+    """Re-storing the same chunk ids with new content replaces what the other node serves"""
+    writer, reader, sync, chunks = make_pair()
+    file_id = chunks[0].file_id
+    rewritten = [
+        replace(chunk, content=f"axolotl revision {chunk.chunk_index}")
+        for chunk in chunks if chunk.file_id == file_id
+    ]
+    with contextlib.redirect_stdout(io.StringIO()):
+        writer.replace_file_chunks(file_id, rewritten)
+        assert sync.sync_once()
+
+    found = search(reader, "axolotl revision")
+    for chunk in rewritten:
+        assert found.get(chunk.id) == chunk.content
+    # Each id is served once, in its new version only
+    assert len(reader.indexed_chunk_ids([chunk.id for chunk in chunks])) == len(chunks)
+    assert sync.stats()["applied_inserts"] == len(rewritten)
+
+def test_poll_skips_overlap_rereads():
+    """Docs re-read by the overlap window are not applied twice"""
+    writer, reader, sync, chunks = make_pair()
+    applied = sync.stats()["applied_inserts"]
+    with contextlib.redirect_stdout(io.StringIO()):
+        assert sync.sync_once()
+    assert sync.stats()["applied_inserts"] == applied
+
+def test_poll_applies_deletes():
+    """Deleting a file on one node removes its chunks from the other"""
+    writer, reader, sync, chunks = make_pair()
+    file_id = chunks[0].file_id
+    with contextlib.redirect_stdout(io.StringIO()):
+        writer.delete_chunks_by_file_id(file_id)
+        assert sync.sync_once()
+    remaining = reader.indexed_chunk_ids([chunk.id for chunk in chunks])
+    assert remaining == {chunk.id for chunk in chunks if chunk.file_id != file_id}
+
+def lecture(topic: str) -> str:
+    return " ".join(f"The {topic} lecture covers point {i} in some detail." for i in range(40))
+
+def test_reindexed_parents_replace_cached_ones(monkeypatch):
+    """A node that cached a parent window serves the rewritten parent once the re-index syncs"""
+    monkeypatch.setenv("RAG_HIERARCHICAL", "1")
+    processor = DocumentProcessor("sync-test", hierarchical=True, child_chars=200)
+    chunk = lambda text: processor.chunk_document(text, "Notes", "Physics", "Optics", "u1", "file-1", "doc-1")
+    first = chunk(lecture("refraction"))
+    writer, reader, sync, _ = make_pair(first["chunks"], first["parents"])
+    assert "refraction" in " ".join(search(reader, "lecture point").values())
+
+    second = chunk(lecture("diffraction"))
+    with contextlib.redirect_stdout(io.StringIO()):
+        writer.replace_file_chunks("file-1", second["chunks"], parents=second["parents"])
+        assert sync.sync_once()
+    served = " ".join(search(reader, "lecture point").values())
+    assert "diffraction" in served and "refraction" not in served
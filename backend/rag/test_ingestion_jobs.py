@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Ingestion Jobs Test
+A restarted process resumes the jobs its predecessor left queued or running, from the spooled
+uploads in the job database (no cloud access needed; run with pytest)
+"""
+
+import os
+import time
+import subprocess
+
+from ingestion_jobs import JobStore, IngestionQueue
+
+class RecordingWorkflow:
+    """Stands in for AgenticRAGWorkflow: records calls and reports a fixed chunk count"""
+
+    def __init__(self):
+        self.processed = []
+        self.deleted = []
+
+    def delete_file(self, file_id):
+        self.deleted.append(file_id)
+
+    def process_pdf_upload(self, file_content, title, class_name, subject_name, user_id, progress, file_id, document_id):
+        self.processed.append((title, file_content, file_id))
+        progress("embedding", 3, 3)
+        return {"file_id": file_id, "document_id": document_id, "total_chunks": 3, "chunk_ids": ["a", "b", "c"]}
+
+def spool(store, upload_dir, title, content=b"%PDF-1.4 test", batch_id=None):
+    path = os.path.join(upload_dir, f"{title}.pdf")
+    with open(path, "wb") as f:
+        f.write(content)
+    return store.create(title, "Grade 10", "Physics", "u1", path, len(content), batch_id=batch_id)
+
+def dead_pid():
+    process = subprocess.Popen(["true"])
+    process.wait()
+    return process.pid
+
+def wait_until_finished(store, job_ids, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while any(store.get(job_id)["status"] in ("queued", "running") for job_id in job_ids):
+        assert time.monotonic() < deadline, "jobs did not finish"
+        time.sleep(0.01)
+
+def test_resume_runs_queued_and_interrupted_jobs(tmp_path):
+    upload_dir = str(tmp_path / "uploads")
+    os.makedirs(upload_dir)
+    db_path = str(tmp_path / "jobs.db")
+
+    # State left behind by a process that stopped mid-upload
+    previous = JobStore(db_path)
+    waiting = spool(previous, upload_dir, "waiting")
+    interrupted = spool(previous, upload_dir, "interrupted", batch_id="batch-1")
+    elsewhere = spool(previous, upload_dir, "elsewhere")
+    for job, pid in ((interrupted, dead_pid()), (elsewhere, os.getppid())):
+        assert previous.claim(job["id"])
+        previous._execute("UPDATE ingestion_jobs SET worker_pid = ? WHERE id = ?", (pid, job["id"]))
+    previous.set_progress(interrupted["id"], "embedding", 1, 3)
+
+    workflow = RecordingWorkflow()
+    queue = IngestionQueue(workflow, store=JobStore(db_path), upload_dir=upload_dir, max_workers=1)
+    assert queue.resume() == 2
+    wait_until_finished(queue.store, [waiting["id"], interrupted["id"]])
+    queue.shutdown(wait=True)
+
+    for job in (waiting, interrupted):
+        done = queue.store.get(job["id"])
+        assert done["status"] == "completed" and done["progress"] == 1.0
+        assert done["result"]["total_chunks"] == 3 and "chunk_ids" not in done["result"]
+        assert not os.path.exists(os.path.join(upload_dir, f"{job['title']}.pdf"))
+    assert sorted(title for title, _, _ in workflow.processed) == ["interrupted", "waiting"]
+    # The retry first drops whatever the interrupted attempt had stored, under the same file id
+    assert queue.store.get(interrupted["id"])["attempts"] == 2
+    assert workflow.deleted == [interrupted["file_id"]]
+    assert (interrupted["title"], b"%PDF-1.4 test", interrupted["file_id"]) in workflow.processed
+
+    # Still owned by a live process, so it is left alone
+    assert queue.store.get(elsewhere["id"])["status"] == "running"
+    assert os.path.exists(os.path.join(upload_dir, "elsewhere.pdf"))
+
+def test_resume_is_a_noop_when_nothing_was_left(tmp_path):
+    store = JobStore(str(tmp_path / "jobs.db"))
+    finished = spool(store, str(tmp_path), "finished")
+    assert store.claim(finished["id"])
+    store.finish(finished["id"], result={"total_chunks": 1})
+
+    queue = IngestionQueue(RecordingWorkflow(), store=store, upload_dir=str(tmp_path / "uploads"))
+    assert queue.resume() == 0
+    queue.shutdown(wait=True)
+    assert store.get(finished["id"])["attempts"] == 1
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+Segmented Index Test
+Appends, deletes and compaction of SegmentedIndex versions, with BM25 scores checked against
+rank_bm25 over the live rows after every step (no cloud access needed; run with pytest)
+"""
+
+import io
+import contextlib
+
+import numpy as np
+from rank_bm25 import BM25Okapi
+
+from synthetic_corpus import generate_corpus
+from segmented_index import Segment, SegmentedIndex
+from sparse_index import tokenize
+from fake_gemini import FakeGemini
+from local_firestore import LocalFirestore
+from storage_backends import FirestoreStorage
+from benchmark_suite import corpus_chunks, make_store
+from segment_compactor import SegmentCompactor
+
+QUERIES = ["physics energy theory", "section3 motion", "explain photosynthesis and cells"]
+
+def records(num_files, chunks_per_file=10, seed=0):
+    return generate_corpus(num_files, chunks_per_file, dimension=8, seed=seed)
+
+def live_rows(index):
+    return [row for row in range(len(index)) if index.alive is None or index.alive[row]]
+
+def assert_bm25_parity(index):
+    """Scores of live rows equal BM25Okapi built over the live rows alone"""
+    live = live_rows(index)
+    corpus = BM25Okapi([tokenize(index.records[row].content) for row in live])
+    for query in QUERIES:
+        tokens = tokenize(query)
+        assert np.allclose(index.get_scores(tokens)[live], corpus.get_scores(tokens), atol=1e-4)
+
+def test_apply_appends_to_head_and_seals_it():
+    """Appends land in the head segment, which is sealed once it reaches head_rows"""
+    docs = records(6)
+    index = SegmentedIndex.build(docs[:20], head_rows=25)
+    index = index.apply(docs[20:40], None)
+    assert len(index.segments) == 1 and len(index.head) == 20
+    index = index.apply(docs[40:50], None)
+    assert len(index.segments) == 2 and index.head is None
+    assert len(index) == index.live_count == 50
+    assert index.rows.get(docs[45]["chunk_id"]) is not None
+    assert_bm25_parity(index)
+
+def test_apply_upserts_and_deletes_with_tombstones():
+    """Re-applied ids replace their old row; deletes tombstone rows without touching older versions"""
+    docs = records(4)
+    base = SegmentedIndex.build(docs)
+    rewritten = [dict(doc, content="quokka " + doc["content"]) for doc in docs[:5]]
+    index = base.apply(rewritten, None, deleted_ids=[doc["chunk_id"] for doc in docs[30:40]])
+
+    assert index.live_count == 30 and len(index) == 45
+    assert base.live_count == 40 and base.alive is None
+    served = {index.records[row].chunk_id: index.records[row].content for row in live_rows(index)}
+    assert all(served[doc["chunk_id"]].startswith("quokka") for doc in rewritten)
+    assert not any(doc["chunk_id"] in served for doc in docs[30:40])
+    assert_bm25_parity(index)
+
+def test_compaction_purges_tombstones_and_keeps_scores():
+    """Merging a segment past the tombstone ratio drops its deleted rows; scores do not change"""
+    docs = records(6)
+    index = SegmentedIndex.build(docs[:30], head_rows=10)
+    for start in range(30, 60, 10):
+        index = index.apply(docs[start:start + 10], None)
+    index = index.apply([], None, deleted_ids=[doc["chunk_id"] for doc in docs[:12]])
+
+    plan = index.compaction_plan(max_segments=8, tombstone_ratio=0.2)
+    assert plan == [index.segments[0]]
+    before = {query: index.get_scores(tokenize(query))[live_rows(index)] for query in QUERIES}
+    merged, remaps = Segment.merge(plan)
+    compacted = index.replace(plan, merged, remaps)
+
+    assert len(compacted.segments[0]) == 18 and compacted.stats()["tombstones"] == 0
+    assert len(compacted) == compacted.live_count == 48
+    for query in QUERIES:
+        assert np.allclose(compacted.get_scores(tokenize(query)), before[query], atol=1e-4)
+    assert_bm25_parity(compacted)
+
+def test_replace_carries_over_deletes_made_during_a_merge():
+    """Rows deleted while a merge was running stay deleted in the merged segment"""
+    docs = records(6)
+    index = SegmentedIndex.build(docs[:20], head_rows=10)
+    for start in range(20, 60, 10):
+        index = index.apply(docs[start:start + 10], None)
+    plan = index.compaction_plan(max_segments=3)
+    merged, remaps = Segment.merge(plan)
+
+    late = [plan[0].ids[0], plan[-1].ids[-1]]
+    index = index.apply([], None, deleted_ids=late)
+    compacted = index.replace(plan, merged, remaps)
+    assert len(compacted.segments) == 3
+    assert compacted.live_count == 58
+    assert not any(chunk_id in compacted.rows for chunk_id in late)
+    assert_bm25_parity(compacted)
+
+def test_replace_is_discarded_when_an_input_was_merged_away():
+    docs = records(4)
+    index = SegmentedIndex.build(docs[:20], head_rows=10)
+    for start in range(20, 40, 10):
+        index = index.apply(docs[start:start + 10], None)
+    plan = index.compaction_plan(max_segments=1)
+    first = index.replace(plan, *Segment.merge(plan))
+    assert first is not None and len(first.segments) == 1
+    assert first.replace(plan, *Segment.merge(plan)) is None
+
+def test_compactor_merges_a_live_store(monkeypatch):
+    """SegmentCompactor merges the store's segments in place; searches keep returning the same chunks"""
+    monkeypatch.setenv("RAG_HEAD_SEGMENT_ROWS", "10")
+    store = make_store(FirestoreStorage(LocalFirestore()), FakeGemini(), "exact")
+    chunks = corpus_chunks(6, 10)
+    with contextlib.redirect_stdout(io.StringIO()):
+        store.store_chunks_batched(chunks[:10])
+        store._load_bm25_index()
+        for start in range(10, 60, 10):
+            store.store_chunks_batched(chunks[start:start + 10])
+        store.delete_chunks_by_file_id(chunks[0].file_id)
+        assert len(store.segmented_index.segments) == 6
+        before = [result.chunk_id for result in store.hybrid_search("physics energy", top_k=10)]
+
+        compactor = SegmentCompactor(store, max_segments=2, mb_per_second=1e6)
+        while compactor.compact_once():
+            pass
+        after = [result.chunk_id for result in store.hybrid_search("physics energy", top_k=10)]
+
+    index = store.segmented_index
+    assert len(index.segments) <= 2 and index.stats()["tombstones"] == 0
+    assert compactor.stats()["rows_purged"] == 10
+    assert after == before
+    assert_bm25_parity(index)
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+SingleFlight Test
+Concurrent calls with one key share a single execution, its result and its exception
+(no cloud access needed; run with pytest)
+"""
+
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from singleflight import SingleFlight
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.001)
+
+def run_concurrently(flight, key, fn, callers):
+    """Start callers that all hit fn under key; returns their futures once all but the leader wait"""
+    pool = ThreadPoolExecutor(max_workers=callers)
+    futures = [pool.submit(flight.do, key, fn) for _ in range(callers)]
+    wait_for(lambda: flight.stats()["coalesced"] == callers - 1)
+    pool.shutdown(wait=False)
+    return futures
+
+def test_concurrent_calls_are_coalesced():
+    flight = SingleFlight("test")
+    release = threading.Event()
+    calls = []
+
+    def work():
+        calls.append(1)
+        release.wait(5)
+        return {"answer": 42}
+
+    futures = run_concurrently(flight, "question", work, 8)
+    release.set()
+    results = [future.result(timeout=5) for future in futures]
+    assert len(calls) == 1
+    assert all(result is results[0] for result in results)
+    assert flight.stats() == {"executed": 1, "coalesced": 7, "in_flight": 0}
+
+def test_waiters_receive_the_leaders_exception():
+    flight = SingleFlight("test")
+    release = threading.Event()
+
+    def fail():
+        release.wait(5)
+        raise ValueError("upstream down")
+
+    futures = run_concurrently(flight, "question", fail, 4)
+    release.set()
+    for future in futures:
+        with pytest.raises(ValueError, match="upstream down"):
+            future.result(timeout=5)
+    assert flight.stats()["in_flight"] == 0
+
+def test_results_are_not_cached_and_keys_are_independent():
+    flight = SingleFlight("test")
+    counter = iter(range(100))
+    assert flight.do("a", next, counter) == 0
+    assert flight.do("a", next, counter) == 1
+    assert flight.do("b", next, counter) == 2
+    assert flight.stats() == {"executed": 3, "coalesced": 0, "in_flight": 0}
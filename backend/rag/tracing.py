@@ -0,0 +1,144 @@
+import time
+import threading
+import contextvars
+from contextlib import contextmanager
+from typing import Dict, Any, Optional, Tuple, List
+
+# Seconds; covers sub-millisecond index work up to slow generations
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+def _label_key(labels: Optional[Dict[str, str]]) -> LabelKey:
+    return tuple(sorted((labels or {}).items()))
+
+def _format_labels(key: LabelKey, extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(key) + ([extra] if extra else [])
+    if not pairs:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+class MetricsRegistry:
+    """Process-wide counters, gauges and histograms rendered in Prometheus text format"""
+
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._help: Dict[str, str] = {}
+        self._counters: Dict[str, Dict[LabelKey, float]] = {}
+        self._gauges: Dict[str, Dict[LabelKey, float]] = {}
+        # name -> labels -> [bucket counts..., sum, count]
+        self._histograms: Dict[str, Dict[LabelKey, List[float]]] = {}
+
+    def inc(self, name: str, value: float = 1.0, labels: Optional[Dict[str, str]] = None, help: str = ""):
+        key = _label_key(labels)
+        with self._lock:
+            self._help.setdefault(name, help)
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0.0) + value
+
+    def set_counter(self, name: str, value: float, labels: Optional[Dict[str, str]] = None, help: str = ""):
+        """Mirror a monotonic count maintained elsewhere (e.g. a component's stats())"""
+        with self._lock:
+            self._help.setdefault(name, help)
+            self._counters.setdefault(name, {})[_label_key(labels)] = float(value)
+
+    def set_gauge(self, name: str, value: float, labels: Optional[Dict[str, str]] = None, help: str = ""):
+        with self._lock:
+            self._help.setdefault(name, help)
+            self._gauges.setdefault(name, {})[_label_key(labels)] = float(value)
+
+    def observe(self, name: str, seconds: float, labels: Optional[Dict[str, str]] = None, help: str = ""):
+        key = _label_key(labels)
+        with self._lock:
+            self._help.setdefault(name, help)
+            series = self._histograms.setdefault(name, {})
+            values = series.get(key)
+            if values is None:
+                values = series[key] = [0.0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    values[i] += 1
+            values[-2] += seconds
+            values[-1] += 1
+
+    def render(self) -> str:
+        lines = []
+        with self._lock:
+            for name, series in sorted(self._counters.items()):
+                lines += [f"# HELP {name} {self._help.get(name, '')}", f"# TYPE {name} counter"]
+                lines += [f"{name}{_format_labels(key)} {value:g}" for key, value in sorted(series.items())]
+            for name, series in sorted(self._gauges.items()):
+                lines += [f"# HELP {name} {self._help.get(name, '')}", f"# TYPE {name} gauge"]
+                lines += [f"{name}{_format_labels(key)} {value:g}" for key, value in sorted(series.items())]
+            for name, series in sorted(self._histograms.items()):
+                lines += [f"# HELP {name} {self._help.get(name, '')}", f"# TYPE {name} histogram"]
+                for key, values in sorted(series.items()):
+                    for bound, count in zip(self.buckets, values):
+                        lines.append(f"{name}_bucket{_format_labels(key, ('le', f'{bound:g}'))} {count:g}")
+                    lines.append(f"{name}_bucket{_format_labels(key, ('le', '+Inf'))} {values[-1]:g}")
+                    lines.append(f"{name}_sum{_format_labels(key)} {values[-2]:.6f}")
+                    lines.append(f"{name}_count{_format_labels(key)} {values[-1]:g}")
+        return "\n".join(lines) + "\n"
+
+metrics = MetricsRegistry()
+
+class Trace:
+    """Stage timings (ms) of one request; repeated stages accumulate"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.started = time.perf_counter()
+        self.stages: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def add(self, stage_name: str, ms: float):
+        with self._lock:
+            self.stages[stage_name] = round(self.stages.get(stage_name, 0.0) + ms, 3)
+
+    def total_ms(self) -> float:
+        return round((time.perf_counter() - self.started) * 1000, 3)
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            stages = dict(self.stages)
+        return {**stages, "total": self.total_ms()}
+
+_current_trace: contextvars.ContextVar[Optional[Trace]] = contextvars.ContextVar("rag_trace", default=None)
+
+def current_trace() -> Optional[Trace]:
+    return _current_trace.get()
+
+@contextmanager
+def trace_request(name: str):
+    """Collect stage timings for the enclosed request and record its total duration"""
+    trace = Trace(name)
+    token = _current_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        _current_trace.reset(token)
+        metrics.observe(
+            "rag_request_duration_seconds", trace.total_ms() / 1000, {"request": name},
+            help="End-to-end duration of traced requests"
+        )
+
+def record_stage(stage_name: str, ms: float):
+    """Add an already measured stage to the current trace and the stage histogram"""
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.add(stage_name, ms)
+    metrics.observe(
+        "rag_stage_duration_seconds", ms / 1000, {"stage": stage_name},
+        help="Duration of request stages"
+    )
+
+@contextmanager
+def stage(stage_name: str):
+    """Time the enclosed block as one stage"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(stage_name, (time.perf_counter() - started) * 1000)